@@ -9,9 +9,23 @@ def tmp_db_store(tmpdir, monkeypatch):
     db_root = tmpdir.mkdir('db_root')
     db_path = db_root.join('db.json')
     scan_db_path = db_root.join('scan_db.json')
+    scan_index_path = db_root.join('scan_index.sqlite')
+    scan_data_path = db_root.join('scan_data.bin')
     monkeypatch.setattr('wwb_scanner.utils.dbstore.DBStore.DB_PATH', str(db_path))
     monkeypatch.setattr('wwb_scanner.utils.dbstore.DBStore.SCAN_DB_PATH', str(scan_db_path))
-    return {'db_path':db_path, 'scan_db_path':scan_db_path}
+    monkeypatch.setattr('wwb_scanner.utils.dbstore.DBStore.SCAN_INDEX_PATH', str(scan_index_path))
+    monkeypatch.setattr('wwb_scanner.utils.dbstore.DBStore.SCAN_DATA_PATH', str(scan_data_path))
+    # Drop any handles the shared instance opened on other paths
+    from wwb_scanner.utils.dbstore import db_store
+    for attr in ['_db', '_scan_db', '_scan_store', '_writer']:
+        monkeypatch.setattr(db_store, attr, None)
+    yield {
+        'db_path':db_path, 'scan_db_path':scan_db_path,
+        'scan_index_path':scan_index_path, 'scan_data_path':scan_data_path,
+    }
+    # Finish any background writes before the paths are restored
+    if db_store._writer is not None:
+        db_store._writer.stop()
 
 @pytest.fixture
 def random_samples():
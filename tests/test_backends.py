@@ -0,0 +1,94 @@
+import numpy as np
+
+def test_synthetic_source():
+    from wwb_scanner.scanner.backends import SyntheticSource
+    from wwb_scanner.scanner.psd import ByteSampleConverter
+    from wwb_scanner.utils import dbmath
+
+    rs = 2.048e6
+    fc = 500e6
+    src = SyntheticSource(
+        sample_rate=rs, realtime=False, seed=1, noise_floor=-40.,
+        carriers=[{'frequency':fc + 256e3, 'level':-10.}],
+    )
+    src.open()
+    src.center_freq = fc
+    num_samples = 65536
+
+    iq = src.read_samples(num_samples)
+    assert iq.size == num_samples
+
+    # Quantized through the uint8 path just like a real device
+    values = src.read_bytes(num_samples * 2)
+    assert values.dtype == np.uint8
+    iq_bytes = ByteSampleConverter(num_samples).convert(values)
+    assert np.abs(iq_bytes.real).max() <= 1 and np.abs(iq_bytes.imag).max() <= 1
+
+    for samples in [iq, iq_bytes]:
+        X = np.abs(np.fft.fftshift(np.fft.fft(samples))) ** 2 / num_samples ** 2
+        f = np.fft.fftshift(np.fft.fftfreq(num_samples, 1. / rs)) + fc
+        peak_ix = np.argmax(X)
+        assert abs(f[peak_ix] - (fc + 256e3)) <= rs / num_samples
+        assert abs(dbmath.to_dB(X[peak_ix]) - -10.) < 1.
+    src.close()
+
+def test_synthetic_async():
+    from wwb_scanner.scanner.backends import SyntheticSource
+
+    src = SyntheticSource(realtime=False, seed=2)
+    src.open()
+    received = []
+    def callback(values, context):
+        received.append(values)
+        if len(received) == 3:
+            context.cancel_read_async()
+    src.read_samples_async(callback, num_samples=1024)
+    assert len(received) == 3
+    assert all(v.size == 1024 and np.iscomplexobj(v) for v in received)
+
+def test_synthetic_scan():
+    from wwb_scanner.scanner.main import Scanner
+    from wwb_scanner.scanner.config import ScanConfig
+
+    carrier_freqs = [472.125, 481.6]
+    config = ScanConfig(scan_range=[470., 484.])
+    config.device.backend = 'synthetic'
+    config.device.backend_options = dict(
+        realtime=False, seed=3, noise_floor=-50.,
+        carriers=[{'frequency':f * 1e6, 'level':-20.} for f in carrier_freqs],
+    )
+    config.sampling.window_size = 128
+    scanner = Scanner(config=config, autosave=False)
+    versions = []
+    scanner.on_spectrum_updated = versions.append
+    progress_updates = []
+    def on_progress(progress):
+        progress_updates.append(progress.copy())
+    scanner.on_progress = on_progress
+    scanner.run_scan()
+
+    # One notification per merged hop
+    assert len(versions) == scanner.plan.num_hops
+    assert versions == sorted(set(versions))
+    assert versions[-1] == scanner.spectrum.version
+
+    num_hops = scanner.plan.num_hops
+    assert [p.hops_done for p in progress_updates] == list(range(1, num_hops + 1))
+    progress = scanner.scan_progress
+    assert progress.num_hops == num_hops
+    assert progress.fraction == scanner.progress == 1.
+    assert progress.eta == 0.
+    assert progress.hops_per_second > 0
+    assert progress.mean_dsp_time > 0 and progress.mean_read_time > 0
+    assert progress_updates[0].eta > 0
+
+    sdata = scanner.spectrum.sample_data
+    freqs = sdata['frequency']
+    dbFS = sdata['dbFS']
+    assert freqs.min() <= 470.1 and freqs.max() >= 483.9
+
+    noise = np.median(dbFS)
+    for f in carrier_freqs:
+        ix = np.flatnonzero(np.abs(freqs - f) <= .05)
+        assert ix.size
+        assert dbFS[ix].max() > noise + 20
@@ -0,0 +1,148 @@
+import os
+
+import numpy as np
+
+def test_capture_roundtrip(tmpdir):
+    from wwb_scanner.scanner.capture import RawCaptureWriter, RawCaptureReader
+
+    filename = str(tmpdir.join('capture.iq'))
+    shape = (4, 1024)
+    expected = []
+    with RawCaptureWriter(filename, chunk_size=16384) as writer:
+        for i, fc in enumerate([470e6, 470.512e6, 471.024e6]):
+            _, data = writer.allocate_hop(fc, 2.048e6, 29.7, shape, np.complex64, timestamp=i)
+            values = (np.random.uniform(-1, 1, shape) + 1j * np.random.uniform(-1, 1, shape))
+            data[:] = values
+            expected.append(data.copy())
+
+        # Readable while the writer is still open
+        assert len(RawCaptureReader(filename)) == 3
+
+    reader = RawCaptureReader(filename)
+    assert len(reader) == 3
+    assert reader.center_frequencies.tolist() == [470000000, 470512000, 471024000]
+    for i, (header, samples) in enumerate(reader):
+        assert header['timestamp'] == i
+        assert header['sample_rate'] == 2.048e6
+        assert np.isclose(header['gain'], 29.7)
+        assert header['offset'] % 64 == 0
+        assert samples.dtype == np.complex64
+        assert np.array_equal(samples, expected[i])
+
+    # Reopening appends
+    with RawCaptureWriter(filename) as writer:
+        _, data = writer.allocate_hop(480e6, 2.048e6, None, (1, 16), np.complex128)
+        data[:] = 1j
+    reader = RawCaptureReader(filename)
+    assert len(reader) == 4
+    header, samples = reader[3]
+    assert np.isnan(header['gain'])
+    assert np.all(samples == 1j)
+
+def test_scan_save_raw_values(tmp_db_store):
+    from wwb_scanner.scanner.main import Scanner
+    from wwb_scanner.scanner.config import ScanConfig
+    from wwb_scanner.scanner.capture import RawCaptureReader
+
+    config = ScanConfig(scan_range=[470., 473.], save_raw_values=True)
+    config.device.backend = 'synthetic'
+    config.device.backend_options = dict(
+        realtime=False, seed=4, carriers=[{'frequency':471e6, 'level':-20.}],
+    )
+    config.sampling.window_size = 128
+    scanner = Scanner(config=config, autosave=False)
+    scanner.run_scan()
+
+    filename = scanner.sample_collection.capture_filename
+    assert os.path.dirname(os.path.dirname(filename)) == str(tmp_db_store['db_path'].dirpath())
+
+    reader = RawCaptureReader(filename)
+    plan = scanner.plan
+    assert np.array_equal(reader.center_frequencies, plan.hop_centers)
+
+    engine = scanner.sample_collection.psd_engine
+    for header, samples in reader:
+        assert samples.shape == (scanner.sweeps_per_scan, scanner.samples_per_sweep)
+        fc = int(header['center_frequency'])
+        sample_set = scanner.sample_collection.sample_sets[fc]
+        freqs, Pxx = engine.process(samples.reshape(-1), fc)
+        assert np.array_equal(freqs, sample_set.frequencies)
+        assert np.array_equal(Pxx, sample_set.powers)
+
+def test_replay_scanner(tmp_db_store, tmpdir):
+    from wwb_scanner.scanner.main import Scanner
+    from wwb_scanner.scanner.config import ScanConfig
+    from wwb_scanner.scanner import ReplayScanner
+
+    filename = str(tmpdir.join('replay.iq'))
+    config = ScanConfig(scan_range=[470., 475.], save_raw_values=True, raw_values_path=filename)
+    config.device.backend = 'synthetic'
+    config.device.backend_options = dict(
+        realtime=False, seed=5, carriers=[{'frequency':472.5e6, 'level':-20.}],
+    )
+    config.sampling.window_size = 128
+    scanner = Scanner(config=config, autosave=False)
+    scanner.run_scan()
+    orig_data = scanner.spectrum.sample_data
+
+    replay_config = ScanConfig(config._serialize())
+    results = {}
+    for max_workers in [0, 2]:
+        replay = ReplayScanner(
+            config=replay_config, filename=filename, max_workers=max_workers,
+            hops_per_task=3, autosave=False,
+        )
+        replay.run_scan()
+        assert replay.progress == 1.
+        data = replay.spectrum.sample_data
+        assert np.array_equal(data['frequency'], orig_data['frequency'])
+        assert np.allclose(data['dbFS'], orig_data['dbFS'])
+        results[max_workers] = data
+    assert np.array_equal(results[0]['dbFS'], results[2]['dbFS'])
+
+    replay_config.sampling.window_size = 256
+    replay_config.sampling.window_type = 'hann'
+    replay = ReplayScanner(
+        config=replay_config, filename=filename, max_workers=2, autosave=False,
+    )
+    replay.run_scan()
+    data = replay.spectrum.sample_data
+    assert np.allclose(np.diff(data['frequency']), .008)
+    peak_freq = data['frequency'][np.argmax(data['dbFS'])]
+    assert abs(peak_freq - 472.5) <= .05
+
+def test_replay_repeated_sweeps(tmp_db_store, tmpdir):
+    from wwb_scanner.scanner.main import Scanner
+    from wwb_scanner.scanner.config import ScanConfig
+    from wwb_scanner.scanner.capture import RawCaptureReader
+    from wwb_scanner.scanner import ReplayScanner
+
+    filename = str(tmpdir.join('replay.iq'))
+    config = ScanConfig(scan_range=[470., 475.], save_raw_values=True, raw_values_path=filename)
+    config.device.backend = 'synthetic'
+    config.device.backend_options = dict(realtime=False, seed=5)
+    config.sampling.window_size = 128
+    # The second scan is appended to the same capture
+    for i in range(2):
+        scanner = Scanner(config=config, autosave=False)
+        scanner.run_scan()
+    plan = scanner.plan
+    with RawCaptureReader(filename) as reader:
+        centers = reader.center_frequencies
+    assert centers.size == plan.num_hops * 2
+    assert np.any(np.diff(centers) < 0)
+
+    for max_workers in [0, 2]:
+        replay = ReplayScanner(
+            config=ScanConfig(config._serialize()), filename=filename,
+            max_workers=max_workers, hops_per_task=3, autosave=False,
+        )
+        assert replay.reader.closed
+        assert replay.plan.step_size_hz == plan.step_size_hz
+        assert replay.plan.scan_range == plan.scan_range
+        assert replay.plan.num_bins == plan.num_bins
+        replay.run_scan()
+        assert replay.progress == 1.
+        assert replay.scan_progress.hops_done == centers.size
+        data = replay.spectrum.sample_data
+        assert np.array_equal(data['frequency_hz'], plan.frequency_axis())
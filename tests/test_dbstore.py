@@ -13,7 +13,7 @@ def test_dbstore_monkeypatch(tmp_db_store):
 
 def test_dbstore(tmp_db_store, data_files, random_samples):
     from wwb_scanner.file_handlers import BaseImporter
-    from wwb_scanner.scan_objects import Spectrum
+    from wwb_scanner.scan_objects import Spectrum, SampleArray
     from wwb_scanner.utils.dbstore import db_store
 
     spec = {}
@@ -46,8 +46,331 @@ def test_dbstore(tmp_db_store, data_files, random_samples):
         db_spectrum = Spectrum.from_dbstore(eid=spectrum.eid)
         for attr in Spectrum._serialize_attrs:
             assert getattr(spectrum, attr) == getattr(db_spectrum, attr)
-        assert np.array_equal(spectrum.sample_data, db_spectrum.sample_data)
+        # Stored in compact form (levels rounded to 0.01 dB)
+        expected = SampleArray.from_compact(spectrum.sample_data.to_compact())
+        assert np.array_equal(expected.data, db_spectrum.sample_data.data)
+        assert np.allclose(spectrum.sample_data['dbFS'], db_spectrum.sample_data['dbFS'], atol=.005)
 
     db_data = db_store.get_all_scans()
 
     assert set(db_data.keys()) == set(spec.keys())
+
+def test_dbstore_append_only(tmp_db_store, random_samples):
+    import os
+    from wwb_scanner.scan_objects import Spectrum, SampleArray
+    from wwb_scanner.utils.dbstore import db_store
+
+    def build_spectrum(name):
+        freqs, sig, Pxx = random_samples(n=1024)
+        spectrum = Spectrum(name=name)
+        spectrum.add_sample_set(frequency=freqs, iq=Pxx)
+        return spectrum
+
+    data_path = str(tmp_db_store['scan_data_path'])
+    spectrum = build_spectrum('first')
+    spectrum.save_to_dbstore()
+    scan_size = os.path.getsize(data_path)
+    for i in range(5):
+        build_spectrum(str(i)).save_to_dbstore()
+    # Each save only appends its own arrays
+    assert os.path.getsize(data_path) == scan_size * 6
+
+    spectrum.name = 'renamed'
+    spectrum.update_dbstore('name')
+    assert os.path.getsize(data_path) == scan_size * 6
+    db_spectrum = Spectrum.from_dbstore(eid=spectrum.eid)
+    assert db_spectrum.name == 'renamed'
+    expected = SampleArray.from_compact(spectrum.sample_data.to_compact())
+    assert np.array_equal(db_spectrum.sample_data.data, expected.data)
+    assert len(db_store.get_all_scans()) == 6
+
+def test_dbstore_migrate_tinydb(tmp_db_store, random_samples, monkeypatch):
+    import pytest
+    from tinydb import TinyDB
+    from wwb_scanner.scan_objects import Spectrum, SampleArray
+    from wwb_scanner.utils import dbstore
+    from wwb_scanner.utils.scanstore import ScanStore
+
+    # Write scans the way earlier versions did
+    db = TinyDB(str(tmp_db_store['scan_db_path']), storage=dbstore.JSONStorage)
+    table = db.table('scans_performed')
+    spectra = {}
+    for i in range(3):
+        freqs, sig, Pxx = random_samples(n=256)
+        spectrum = Spectrum(name='scan {}'.format(i))
+        spectrum.add_sample_set(frequency=freqs, iq=Pxx)
+        eid = table.insert(spectrum._serialize())
+        spectra[eid] = spectrum
+    table.remove(eids=[min(spectra)])
+    del spectra[min(spectra)]
+    db.close()
+
+    db_store = dbstore.db_store
+
+    # A migration that fails partway is rolled back and retried
+    write_array = ScanStore._write_array
+    calls = []
+    def failing_write_array(store, sample_data):
+        calls.append(sample_data)
+        if len(calls) == 2:
+            raise IOError('disk full')
+        return write_array(store, sample_data)
+    monkeypatch.setattr(ScanStore, '_write_array', failing_write_array)
+    with pytest.raises(IOError):
+        db_store.scan_store
+    assert db_store._scan_store is None
+    monkeypatch.setattr(ScanStore, '_write_array', write_array)
+    store = ScanStore(db_store.SCAN_INDEX_PATH, db_store.SCAN_DATA_PATH)
+    assert store.count() == 0
+    assert store.get_meta('scan_db_migrated') is None
+    store.close()
+
+    assert set(db_store.get_all_scans().keys()) == set(spectra.keys())
+    for eid, spectrum in spectra.items():
+        db_spectrum = Spectrum.from_dbstore(eid=eid)
+        assert db_spectrum.name == spectrum.name
+        expected = SampleArray.from_compact(spectrum.sample_data.to_compact())
+        assert np.array_equal(db_spectrum.sample_data.data, expected.data)
+
+    # Only migrated once
+    new_store = dbstore.DBStore()
+    assert set(new_store.get_all_scans().keys()) == set(spectra.keys())
+
+def test_dbstore_metadata(tmp_db_store, random_samples, monkeypatch):
+    from wwb_scanner.scan_objects import Spectrum, SampleArray
+    from wwb_scanner.utils.dbstore import db_store
+    from wwb_scanner.utils.scanstore import ScanStore
+
+    spectra = {}
+    for i in range(3):
+        freqs, sig, Pxx = random_samples(n=256, fc=(500 + i * 10) * 1e6)
+        spectrum = Spectrum(name='scan {}'.format(i), step_size=.025)
+        spectrum.add_sample_set(frequency=freqs, iq=Pxx)
+        spectrum.save_to_dbstore()
+        spectra[spectrum.eid] = spectrum
+
+    read_array = ScanStore._read_array
+    def no_arrays(*args, **kwargs):
+        raise AssertionError('array data should not be read')
+    monkeypatch.setattr(ScanStore, '_read_array', no_arrays)
+
+    scans = db_store.list_scans()
+    assert set(scans.keys()) == set(spectra.keys())
+    for eid, spectrum in spectra.items():
+        info = scans[eid]
+        assert info['name'] == spectrum.name
+        assert info['timestamp_utc'] == spectrum.timestamp_utc
+        assert info['step_size'] == .025
+        assert info['color'] == spectrum.color
+        assert info['num_points'] == spectrum.sample_data.size
+        freqs = spectrum.sample_data.frequency
+        assert np.allclose(info['frequency_range'], [freqs.min(), freqs.max()])
+
+    # Arrays are only read when the data is used
+    db_spectrum = Spectrum.from_dbstore(eid=eid)
+    assert db_spectrum.name == spectrum.name
+    assert not db_spectrum.sample_data_loaded
+    db_spectrum.name = 'renamed'
+    db_spectrum.save_to_dbstore()
+    assert db_store.list_scans()[eid]['name'] == 'renamed'
+
+    monkeypatch.setattr(ScanStore, '_read_array', read_array)
+    snapshot = db_spectrum.snapshot
+    assert db_spectrum.sample_data_loaded
+    expected = SampleArray.from_compact(spectrum.sample_data.to_compact())
+    assert np.array_equal(snapshot.data, expected.data)
+
+def test_scan_writer(tmp_db_store, random_samples, monkeypatch):
+    import threading
+    import time
+    from wwb_scanner.scan_objects import Spectrum, SampleArray
+    from wwb_scanner.scanner.main import ThreadedScanner
+    from wwb_scanner.scanner.config import ScanConfig
+    from wwb_scanner.utils.dbstore import db_store
+
+    # Hold scan writes until the gate is opened
+    gate = threading.Event()
+    write_scan = db_store.write_scan
+    def slow_write_scan(spectrum, data):
+        gate.wait()
+        return write_scan(spectrum, data)
+    monkeypatch.setattr(db_store, 'write_scan', slow_write_scan)
+    writer = db_store.writer
+
+    freqs, sig, Pxx = random_samples(n=256)
+    spectrum = Spectrum(name='first')
+    spectrum.add_sample_set(frequency=freqs, iq=Pxx)
+    other = Spectrum(name='other')
+    other.add_sample_set(frequency=freqs, iq=Pxx)
+    writer.save_scan(other)
+    for i in range(5):
+        spectrum.name = 'save {}'.format(i)
+        writer.save_scan(spectrum)
+    assert writer.queue_depth == 2
+    assert writer.num_coalesced == 4
+    assert not writer.flush(timeout=.01)
+
+    gate.set()
+    assert writer.flush(timeout=10)
+    assert writer.queue_depth == 0
+    assert spectrum.eid is not None
+    scans = db_store.list_scans()
+    assert len(scans) == 2
+    assert scans[spectrum.eid]['name'] == 'save 4'
+
+    # Updates of the same eid are combined
+    gate.clear()
+    writer.save_scan(other)
+    spectrum.name = 'renamed'
+    spectrum.update_dbstore('name')
+    spectrum.step_size = .025
+    spectrum.update_dbstore('step_size')
+    assert writer.queue_depth == 2
+    gate.set()
+    info = db_store.list_scans()[spectrum.eid]
+    assert info['name'] == 'renamed'
+    assert info['step_size'] == .025
+
+    # Continuous scans go on while the first save is held
+    gate.clear()
+    config = ScanConfig(scan_range=[470., 474.])
+    config.device.backend = 'synthetic'
+    config.device.backend_options = dict(realtime=False, seed=3, noise_floor=-50.)
+    config.sampling.window_size = 128
+    scanner = ThreadedScanner(
+        config=config, run_once=False, scan_wait_timeout=0., history_max_bytes=2 ** 20,
+    )
+    scanner.daemon = True
+    scanner.start()
+    timeout = time.time() + 30
+    while len(scanner.history) < 4 and time.time() < timeout:
+        time.sleep(.05)
+    scanner.stop()
+    assert len(scanner.history) >= 4
+    assert writer.queue_depth == 2
+    gate.set()
+    writer.flush()
+    db_spectrum = Spectrum.from_dbstore(eid=scanner.spectrum.eid)
+    expected = SampleArray.from_compact(scanner.spectrum.sample_data.to_compact())
+    assert np.array_equal(db_spectrum.sample_data.data, expected.data)
+
+def test_scan_config_cache(tmp_db_store, random_samples, monkeypatch):
+    import tinydb
+    from wwb_scanner.scan_objects import Spectrum
+    from wwb_scanner.scanner.main import Scanner
+    from wwb_scanner.scanner.config import ScanConfig
+    from wwb_scanner.utils.dbstore import db_store
+
+    # Identical configs are only stored once
+    configs = [ScanConfig(scan_range=[470., 480.]) for i in range(3)]
+    for config in configs:
+        db_store.add_scan_config(config)
+    assert len(set(config.eid for config in configs)) == 1
+    other = ScanConfig(scan_range=[500., 510.], name='other')
+    db_store.add_scan_config(other)
+    assert other.eid != configs[0].eid
+    assert len(db_store.db.table('scan_configs')) == 2
+
+    spectra = []
+    for i in range(10):
+        freqs, sig, Pxx = random_samples(n=256)
+        spectrum = Spectrum(name=str(i), scan_config=ScanConfig(scan_range=[470., 480.]))
+        spectrum.add_sample_set(frequency=freqs, iq=Pxx)
+        spectrum.save_to_dbstore()
+        assert spectrum.scan_config_eid == configs[0].eid
+        spectra.append(spectrum)
+    assert len(db_store.db.table('scan_configs')) == 2
+
+    # Lookups don't query the table
+    def no_query(*args, **kwargs):
+        raise AssertionError('scan_configs should not be queried')
+    table_methods = {}
+    for attr in ['get', 'search', 'all']:
+        table_methods[attr] = getattr(tinydb.database.Table, attr)
+        monkeypatch.setattr(tinydb.database.Table, attr, no_query)
+    for spectrum in spectra:
+        db_spectrum = Spectrum.from_dbstore(eid=spectrum.eid)
+        assert db_spectrum.scan_config['scan_range'] == [470., 480.]
+    assert db_store.get_scan_config(name='other').eid == other.eid
+    assert db_store.get_scan_config(datetime=configs[0]['datetime']).eid == configs[0].eid
+    assert db_store.get_scan_config(eid=1000) is None
+    scanner = Scanner(autosave=False)
+    assert scanner.config.scan_range == [500., 510.]
+
+    for attr, method in table_methods.items():
+        monkeypatch.setattr(tinydb.database.Table, attr, method)
+
+    # Replacing a config updates the cache
+    other.scan_range = [520., 530.]
+    db_store.add_scan_config(other, force_insert=True)
+    assert db_store.get_scan_config(eid=other.eid)['scan_range'] == [520., 530.]
+
+    # Only the replaced config is reindexed
+    monkeypatch.setattr(tinydb.database.Table, 'all', no_query)
+    other.scan_range = [540., 550.]
+    db_store.add_scan_config(other, force_insert=True)
+    cache = db_store.config_cache
+    assert cache.find(ScanConfig(scan_range=[540., 550.], name='other')) == other.eid
+    assert cache.find(ScanConfig(scan_range=[500., 510.], name='other')) is None
+    assert cache.find(ScanConfig(scan_range=[470., 480.])) == configs[0].eid
+    assert db_store.get_scan_config(name='other').eid == other.eid
+    assert db_store.get_scan_config().eid == other.eid
+    monkeypatch.setattr(tinydb.database.Table, 'all', table_methods['all'])
+    assert db_store.get_scan_config(eid=other.eid) == db_store.db.table('scan_configs').get(eid=other.eid)
+
+    # Changing a returned config doesn't change the cached one
+    record = db_store.get_scan_config(eid=other.eid)
+    sampling = dict(record['sampling'])
+    record['sampling']['window_size'] = 4096
+    record['scan_range'].append(560.)
+    record = db_store.get_scan_config(eid=other.eid)
+    assert record['sampling'] == sampling
+    assert record['scan_range'] == [540., 550.]
+
+def test_scan_writer_config(tmp_db_store, random_samples, monkeypatch):
+    import threading
+    from wwb_scanner.scan_objects import Spectrum
+    from wwb_scanner.scanner.config import ScanConfig
+    from wwb_scanner.utils.dbstore import db_store
+
+    # The writer is only created once when first used from several threads
+    barrier = threading.Barrier(8)
+    writers = []
+    def get_writer():
+        barrier.wait()
+        writers.append(db_store.writer)
+    threads = [threading.Thread(target=get_writer) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(writers) == 8
+    assert all(w is db_store.writer for w in writers)
+    writer = db_store.writer
+
+    # New configs are stored by the writer, not the thread saving the scan
+    config_threads = []
+    add_scan_config = db_store.add_scan_config
+    def record_add_scan_config(config, *args, **kwargs):
+        config_threads.append(threading.current_thread())
+        return add_scan_config(config, *args, **kwargs)
+    monkeypatch.setattr(db_store, 'add_scan_config', record_add_scan_config)
+
+    freqs, sig, Pxx = random_samples(n=256)
+    config = ScanConfig(scan_range=[470., 480.])
+    spectrum = Spectrum(name='first', scan_config=config)
+    spectrum.add_sample_set(frequency=freqs, iq=Pxx)
+    writer.save_scan(spectrum)
+    assert writer.flush(timeout=10)
+    assert config_threads == [writer]
+    assert config.eid is not None
+    assert spectrum.scan_config_eid == config.eid
+    assert db_store.list_scans()[spectrum.eid]['scan_config_eid'] == config.eid
+    assert db_store.get_scan_config(eid=config.eid)['datetime'] == config['datetime']
+
+    # Once stored, later saves don't store it again
+    spectrum.name = 'second'
+    writer.save_scan(spectrum)
+    assert writer.flush(timeout=10)
+    assert len(config_threads) == 1
+    assert len(db_store.db.table('scan_configs')) == 1
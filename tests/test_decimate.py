@@ -0,0 +1,94 @@
+import numpy as np
+
+def brute_force(x, y, x_min, x_max, num_buckets):
+    # Bucket every point the same way and pick min/max with argmin/argmax
+    span = x_max - x_min
+    b = np.clip(np.floor((x - x_min) * (num_buckets / span)).astype(int), 0, num_buckets - 1)
+    b[x < x_min] = -1
+    b[x > x_max] = num_buckets
+    ix = []
+    for bucket in np.unique(b):
+        bix = np.flatnonzero(b == bucket)
+        if bucket == -1:
+            ix.append(bix[-1])
+        elif bucket == num_buckets:
+            ix.append(bix[0])
+        else:
+            ix.extend(sorted({bix[np.argmin(y[bix])], bix[np.argmax(y[bix])]}))
+    ix = np.array(ix)
+    return x[ix], y[ix]
+
+def test_decimate():
+    from wwb_scanner.ui.decimate import MinMaxDecimator
+
+    x = np.arange(200000) * .0005 + 470.
+    y = np.random.uniform(-110, -90, x.size)
+    # Single bin carrier
+    carrier_ix = 123457
+    y[carrier_ix] = -20.
+
+    d = MinMaxDecimator()
+    x_out, y_out = d.set_data(x, y)
+    assert x_out is x
+
+    x_out, y_out = d.set_view(x[0], x[-1], 800)
+    assert x_out.size <= 1600
+    assert np.all(np.diff(x_out) > 0)
+    assert x[carrier_ix] in x_out
+    assert y_out.max() == -20.
+    ex, ey = brute_force(x, y, x[0], x[-1], d.num_buckets)
+    assert np.array_equal(x_out, ex)
+    assert np.array_equal(y_out, ey)
+
+    # Zoomed in with points on either side of the view
+    x_min, x_max = 500.0002, 510.
+    x_out, y_out = d.set_view(x_min, x_max, 640)
+    ex, ey = brute_force(x, y, x_min, x_max, d.num_buckets)
+    assert np.array_equal(x_out, ex)
+    assert np.array_equal(y_out, ey)
+    assert x_out[0] < x_min and x_out[1] >= x_min
+    assert x_out[-1] > x_max and x_out[-2] <= x_max
+
+    # Fewer points than buckets are passed through
+    x_out, y_out = d.set_view(x[100], x[200], 800)
+    assert np.array_equal(x_out, x[99:202])
+
+def test_decimate_update():
+    from wwb_scanner.ui.decimate import MinMaxDecimator
+
+    x_min, x_max = 470., 570.
+    d = MinMaxDecimator()
+    d.set_view(x_min, x_max, 500)
+    x = np.zeros(0)
+    y = np.zeros(0)
+    out_x = d.x_out.copy()
+    out_y = d.y_out.copy()
+    hop_size = 2048
+    for i in range(48):
+        # Hops overlapping by half, the last one past the end of the view
+        hop_x = x_min + (i * hop_size // 2 + np.arange(hop_size)) * .001
+        hop_y = np.random.uniform(-110, -90, hop_size)
+        start = np.searchsorted(x, hop_x[0])
+        x = np.concatenate([x[:start], hop_x])
+        y = np.concatenate([y[:start], hop_y])
+        o0, o1 = d.update(x, y, start, x.size)
+        # Apply the changed range the way a graph model would
+        if d.x_out.size != out_x.size:
+            o1 = d.x_out.size
+            out_x = np.concatenate([out_x[:o0], np.zeros(o1 - o0)])
+            out_y = np.concatenate([out_y[:o0], np.zeros(o1 - o0)])
+        out_x[o0:o1] = d.x_out[o0:o1]
+        out_y[o0:o1] = d.y_out[o0:o1]
+        assert np.array_equal(out_x, d.x_out)
+        ex, ey = brute_force(x, y, x_min, x_max, d.num_buckets)
+        assert np.array_equal(d.x_out, ex)
+        assert np.array_equal(d.y_out, ey)
+        if i > 0:
+            # Only the buckets the new hop covers were updated
+            assert o1 - o0 <= 2 * (hop_size * .001) / (x_max - x_min) * d.num_buckets * 2 + 4
+
+    # In place updates don't move any output points
+    y[5000] = 0.
+    o0, o1 = d.update(x, y, 5000, 5001)
+    assert o1 - o0 <= 2
+    assert d.y_out.max() == 0.
@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+
+def test_history_ring_buffer(tmpdir):
+    from wwb_scanner.scan_objects import SpectrumHistory
+
+    freqs = 470000000 + np.arange(1000, dtype=np.int64) * 25000
+    row_bytes = freqs.size * 4
+    history = SpectrumHistory(max_bytes=row_bytes * 10, frequency_hz=freqs)
+    assert history.max_rows == 10
+    assert history.data.dtype == np.float32
+
+    for i in range(25):
+        history.append(np.full(freqs.size, -100. + i), timestamp=1000. + i)
+    assert len(history) == 10
+    timestamps = history.get_timestamps()
+    assert np.array_equal(timestamps, 1000. + np.arange(15, 25))
+
+    ts, row = history.get_row(-1)
+    assert ts == 1024.
+    assert np.all(row == -76.)
+    ts, row = history.get_row(0)
+    assert ts == 1015.
+
+    ts, rows = history.time_slice(1017., 1019.)
+    assert np.array_equal(ts, [1017., 1018., 1019.])
+    assert np.array_equal(rows[:,0], [-83., -82., -81.])
+    assert history.index_of_time(1020.5) == 6
+
+    # Hops are placed by frequency and overlaps are averaged
+    history.begin_row(timestamp=2000.)
+    history.add_hop(freqs[:600], np.full(600, -50.))
+    history.add_hop(freqs[500:], np.full(500, -60.))
+    assert len(history) == 9
+    history.commit_row()
+    assert len(history) == 10
+    ts, row = history.get_row(-1)
+    assert ts == 2000.
+    assert np.all(row[:500] == -50.)
+    assert np.all(row[500:600] == -55.)
+    assert np.all(row[600:] == -60.)
+
+    max_hold = history.max_hold(end_ts=1030., chunk_rows=3)
+    assert np.all(max_hold == -76.)
+    assert history.max_hold()[0] == -50.
+
+    filename = str(tmpdir.join('history.dat'))
+    history = SpectrumHistory(max_rows=4, filename=filename)
+    history.append(np.zeros(freqs.size), frequency_hz=freqs, timestamp=1.)
+    assert isinstance(history.data, np.memmap)
+    history.flush()
+    data = np.memmap(filename, dtype=np.float32, mode='r', shape=(4, freqs.size))
+    assert np.all(data[0] == 0)
+
+def test_threaded_scanner_history():
+    from wwb_scanner.scanner.main import ThreadedScanner
+    from wwb_scanner.scanner.config import ScanConfig
+
+    config = ScanConfig(scan_range=[470., 474.])
+    config.device.backend = 'synthetic'
+    config.device.backend_options = dict(
+        realtime=False, seed=3, noise_floor=-50.,
+        carriers=[{'frequency':472.125e6, 'level':-20.}],
+    )
+    config.sampling.window_size = 128
+    scanner = ThreadedScanner(
+        config=config, autosave=False, run_once=False, scan_wait_timeout=0.,
+    )
+    scanner.daemon = True
+    history = scanner.history
+    row_timestamps = []
+    scanner.on_history_row = row_timestamps.append
+    scanner.start()
+    timeout = time.time() + 30
+    while len(history) < 3 and time.time() < timeout:
+        time.sleep(.05)
+    scanner.stop()
+
+    assert len(history) >= 3
+    assert np.array_equal(history.frequency_hz, scanner.plan.frequency_axis())
+    timestamps, rows = history.get_rows()
+    assert np.all(np.diff(timestamps) > 0)
+    assert np.array_equal(row_timestamps, timestamps)
+    assert not np.any(np.isnan(rows))
+    ix = np.flatnonzero(np.abs(history.frequency - 472.125) <= .05)
+    assert np.all(rows[:,ix].max(axis=1) > np.median(rows, axis=1) + 20)
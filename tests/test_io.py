@@ -72,6 +72,16 @@ def test_io(tmpdir, random_samples):
     dB = np.around(spectrum.sample_data['dbFS'], decimals=1)
 
     p = tmpdir.mkdir('test_io')
+    for compact in [True, False]:
+        fn = p.join('foo_{}.npz'.format(compact))
+        spectrum.export_to_file(filename=str(fn), compact=compact, compress=True)
+        imp_spectrum = Spectrum.import_from_file(str(fn))
+        assert np.array_equal(spectrum.sample_data['frequency_hz'], imp_spectrum.sample_data['frequency_hz'])
+        if compact:
+            assert np.allclose(spectrum.sample_data['dbFS'], imp_spectrum.sample_data['dbFS'], atol=.005)
+        else:
+            assert np.array_equal(spectrum.sample_data.data, imp_spectrum.sample_data.data)
+
     for ext in ['csv', 'sdb2']:
         fn = p.join('foo.{}'.format(ext))
         spectrum.export_to_file(filename=str(fn))
@@ -80,3 +90,38 @@ def test_io(tmpdir, random_samples):
         assert np.allclose(spectrum.sample_data['frequency'], imp_spectrum.sample_data['frequency'])
         imp_dB = np.around(imp_spectrum.sample_data['dbFS'], decimals=1)
         assert np.allclose(dB, imp_dB)
+
+def test_numpyjson(random_samples):
+    import base64
+    import json
+    from wwb_scanner.utils import numpyjson
+    from wwb_scanner.scan_objects import Spectrum
+
+    freqs, sig, Pxx = random_samples(n=1024)
+    spectrum = Spectrum(name='test')
+    spectrum.add_sample_set(frequency=freqs, iq=Pxx)
+
+    s = spectrum.to_json()
+    assert 'pickle' not in s
+    d = json.loads(s)
+    assert set(d['sample_data']['data']['__ndarray__'].keys()) == {'dtype', 'shape', 'data'}
+
+    loaded = Spectrum.from_json(s)
+    sample_data = loaded.sample_data
+    assert sample_data.data.dtype == spectrum.sample_data.data.dtype
+    assert np.array_equal(sample_data.data, spectrum.sample_data.data)
+    # Decoded without a copy, then copied on the first write
+    assert not sample_data.data.flags.writeable
+    loaded.scale(-100., -50.)
+    assert sample_data.data.flags.writeable
+    assert np.isclose(sample_data['dbFS'].max(), -50.)
+
+    # Non-native byte order and other dtypes
+    a = np.arange(12, dtype='>f4').reshape(3, 4)
+    b = numpyjson.loads(numpyjson.dumps({'a':a}))['a']
+    assert b.shape == (3, 4)
+    assert np.array_equal(a, b)
+
+    # Pickled arrays written by earlier versions can still be read
+    legacy = json.dumps({'x':{'__ndarray__':base64.b64encode(a.dumps()).decode('UTF-8')}})
+    assert np.array_equal(numpyjson.loads(legacy)['x'], a)
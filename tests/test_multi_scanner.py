@@ -0,0 +1,126 @@
+import os
+import threading
+
+import pytest
+import numpy as np
+
+def build_config(tmpdir):
+    from wwb_scanner.scanner.config import ScanConfig
+
+    config = ScanConfig(
+        scan_range=[470., 490.], save_raw_values=True,
+        raw_values_path=str(tmpdir.join('capture.iq')),
+    )
+    config.device.backend = 'synthetic'
+    config.device.backend_options = dict(
+        realtime=False, seed=3, carriers=[
+            {'frequency':472.5e6, 'level':-20.},
+            {'frequency':487.5e6, 'level':-20.},
+        ],
+    )
+    config.sampling.window_size = 128
+    return config
+
+def test_multi_scanner(tmp_db_store, tmpdir):
+    from wwb_scanner.scanner import MultiScanner
+    from wwb_scanner.scanner.capture import RawCaptureReader
+
+    config = build_config(tmpdir)
+    multi = MultiScanner(
+        config=config, serial_numbers=['0', '1', '2', '3'], autosave=False,
+    )
+    plan = multi.plan
+
+    ranges = multi.split_scan_range()
+    assert len(ranges) == 4
+    assert ranges[0][0] == 470.
+    assert np.isclose(ranges[-1][1], plan.scan_range[1])
+    for r1, r2 in zip(ranges[:-1], ranges[1:]):
+        assert np.isclose(r2[0] - r1[1], multi.step_size)
+
+    updates = []
+    def on_spectrum_updated(version):
+        updates.append((threading.current_thread(), multi.spectrum.sample_data.size))
+    multi.on_spectrum_updated = on_spectrum_updated
+
+    merged = []
+    add_sample_set = multi.spectrum.add_sample_set
+    def record_add_sample_set(**kwargs):
+        merged.append(kwargs['center_frequency'])
+        add_sample_set(**kwargs)
+    multi.spectrum.add_sample_set = record_add_sample_set
+
+    multi.run_scan()
+
+    assert len(multi.scanners) == 4
+    assert [s.device_config.serial_number for s in multi.scanners] == ['0', '1', '2', '3']
+    assert [s.config.scan_range for s in multi.scanners] == ranges
+    assert multi.progress == 1.
+
+    # Each hop is merged as it's processed, from the device's own thread
+    num_hops = sum(s.plan.num_hops for s in multi.scanners)
+    assert num_hops == plan.num_hops
+    assert len(updates) == num_hops
+    # and only once, into the spectrum shared by all devices
+    assert sorted(merged) == sorted(plan.hop_centers.tolist())
+    assert all(s.spectrum is multi.spectrum for s in multi.scanners)
+    assert len(set(t for t, _ in updates)) == 4
+    assert threading.current_thread() not in set(t for t, _ in updates)
+    assert updates[0][1] < plan.num_bins
+
+    # The merged spectrum covers the full range without duplicates
+    sdata = multi.spectrum.sample_data
+    assert np.array_equal(sdata['frequency_hz'], plan.frequency_axis())
+    assert sdata['frequency_hz'][0] <= 470e6
+    assert sdata['frequency_hz'][-1] >= 490e6
+    for fc in [472.5e6, 487.5e6]:
+        ix = np.abs(sdata['frequency_hz'] - fc).argmin()
+        assert sdata['dbFS'][ix] > np.median(sdata['dbFS']) + 20
+
+    # Each device writes its own capture
+    filenames = [s.sample_collection.capture_filename for s in multi.scanners]
+    assert filenames == [s.config.raw_values_path for s in multi.scanners]
+    assert len(set(filenames)) == 4
+    for scanner, filename in zip(multi.scanners, filenames):
+        assert os.path.dirname(filename) == str(tmpdir)
+        reader = RawCaptureReader(filename)
+        assert np.array_equal(reader.center_frequencies, scanner.plan.hop_centers)
+        reader.close()
+
+def test_multi_scanner_single_device(tmp_db_store, tmpdir):
+    from wwb_scanner.scanner import MultiScanner
+
+    config = build_config(tmpdir)
+    multi = MultiScanner(config=config, serial_numbers=['0'], autosave=False)
+    multi.run_scan()
+
+    assert len(multi.scanners) == 1
+    assert multi.scanners[0].config.raw_values_path == config.raw_values_path
+    assert np.array_equal(
+        multi.spectrum.sample_data['frequency_hz'], multi.plan.frequency_axis(),
+    )
+
+def test_multi_scanner_device_error(tmp_db_store, tmpdir):
+    from wwb_scanner.scanner import MultiScanner, Scanner
+    from wwb_scanner.utils.dbstore import db_store
+
+    class FailingScanner(Scanner):
+        def run_scan(self):
+            if self.device_config.serial_number == '1':
+                raise RuntimeError('device not found')
+            super(FailingScanner, self).run_scan()
+
+    config = build_config(tmpdir)
+    multi = MultiScanner(
+        config=config, serial_numbers=['0', '1'], scanner_cls=FailingScanner,
+    )
+    with pytest.raises(RuntimeError):
+        multi.run_scan()
+
+    # The other device finished, but the partial scan isn't saved
+    assert multi.scanners[0].progress == 1.
+    assert multi.spectrum.eid is None
+    db_store.flush_writes()
+    assert not len(db_store.list_scans())
+    assert not multi._running.is_set()
+    assert multi._stopped.is_set()
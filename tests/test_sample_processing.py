@@ -0,0 +1,197 @@
+import pytest
+import numpy as np
+from scipy import signal
+
+def legacy_process(samples, fc, rs, win):
+    from wwb_scanner.scanner.sample_processing import SampleSet, sort_psd
+
+    freqs, Pxx = signal.welch(samples, fs=rs, window=win, detrend=False,
+        nperseg=win.size, scaling='density', return_onesided=False)
+    iPxx = np.fft.irfft(Pxx)
+    iPxx = SampleSet().translate_freq(iPxx, fc, rs)
+    Pxx = np.abs(np.fft.rfft(iPxx.real))
+    freqs, Pxx = sort_psd(freqs, Pxx)
+    freqs = np.around(freqs)
+    freqs += fc
+    return freqs, Pxx
+
+@pytest.mark.parametrize('window_type', ['boxcar', 'hann'])
+@pytest.mark.parametrize('win_size', [128, 256])
+def test_psd_engine(window_type, win_size):
+    from wwb_scanner.scanner.psd import PSDEngine
+
+    rs = 2.048e6
+    win = signal.get_window(window_type, win_size)
+    engine = PSDEngine(rs, win)
+
+    for fc in [470e6, 572.5e6, 600.256e6, 899.9e6]:
+        a = np.random.randint(low=0, high=256, size=8192 * 4 * 2)
+        samples = (a[::2] + 1j * a[1::2]) / 127.5 - (1 + 1j)
+
+        freqs, Pxx = engine.process(samples, fc)
+        legacy_freqs, legacy_Pxx = legacy_process(samples.copy(), fc, rs, win)
+
+        assert np.array_equal(freqs, legacy_freqs)
+        # The legacy phase ramp accumulates rounding error over each sample
+        assert np.allclose(Pxx, legacy_Pxx, rtol=1e-6, atol=0)
+
+@pytest.mark.parametrize('sweep_size', [8192, 1000, 100])
+def test_psd_accumulator(sweep_size):
+    from wwb_scanner.scanner.psd import PSDEngine, PSDAccumulator
+
+    rs = 2.048e6
+    fc = 600e6
+    win = signal.get_window('hann', 128)
+    engine = PSDEngine(rs, win)
+    accumulator = PSDAccumulator(engine)
+
+    a = np.random.randint(low=0, high=256, size=sweep_size * 20 * 2)
+    samples = (a[::2] + 1j * a[1::2]) / 127.5 - (1 + 1j)
+
+    for sweep in samples.reshape((20, sweep_size)):
+        accumulator.add_samples(sweep)
+
+    assert np.allclose(accumulator.get_psd(), engine.welch(samples), rtol=1e-12)
+
+    freqs, Pxx = engine.process_psd(accumulator.get_psd(), fc)
+    expected_freqs, expected_Pxx = engine.process(samples, fc)
+    assert np.array_equal(freqs, expected_freqs)
+    assert np.allclose(Pxx, expected_Pxx, rtol=1e-9)
+
+def test_processing_pipeline():
+    import threading
+    import time
+    from wwb_scanner.scanner.sample_processing import ProcessingPipeline
+
+    class FakeSampleSet(object):
+        def __init__(self, center_frequency):
+            self.center_frequency = center_frequency
+            self.complete = threading.Event()
+        def process_samples(self):
+            time.sleep(.01)
+            processed.append((self.center_frequency, threading.current_thread()))
+            self.complete.set()
+
+    processed = []
+    pipeline = ProcessingPipeline(max_queued=2)
+    pipeline.start()
+
+    sample_sets = [FakeSampleSet(f) for f in range(10)]
+    for sample_set in sample_sets:
+        pipeline.submit(sample_set)
+    assert not sample_sets[-1].complete.is_set()
+
+    pipeline.stop()
+    assert all(sample_set.complete.is_set() for sample_set in sample_sets)
+    assert [f for f, t in processed] == list(range(10))
+    assert all(t is not threading.current_thread() for f, t in processed)
+
+def test_scan_error_cleanup(tmp_db_store, tmpdir, monkeypatch):
+    import threading
+    from wwb_scanner.scanner.main import Scanner
+    from wwb_scanner.scanner.config import ScanConfig
+    from wwb_scanner.scanner.sample_processing import SampleSet
+
+    config = ScanConfig(
+        scan_range=[470., 480.], save_raw_values=True,
+        raw_values_path=str(tmpdir.join('capture.iq')),
+    )
+    config.device.backend = 'synthetic'
+    config.device.backend_options = dict(realtime=False, seed=2)
+    config.sampling.window_size = 128
+    scanner = Scanner(config=config, autosave=False)
+
+    read_samples = SampleSet.read_samples
+    def failing_read_samples(sample_set):
+        if sample_set.collection.num_processed >= 2:
+            raise RuntimeError('device lost')
+        read_samples(sample_set)
+    monkeypatch.setattr(SampleSet, 'read_samples', failing_read_samples)
+
+    num_threads = threading.active_count()
+    collection = scanner.sample_collection
+    with pytest.raises(RuntimeError):
+        scanner.run_scan()
+
+    # The pipeline thread and the capture are stopped either way
+    assert collection.pipeline is None
+    assert collection.capture is None
+    assert threading.active_count() == num_threads
+    assert not collection.scanning.is_set()
+    assert collection.stopped.is_set()
+
+def test_pipeline_hop_error(tmp_db_store, monkeypatch):
+    from wwb_scanner.scanner.main import Scanner
+    from wwb_scanner.scanner.config import ScanConfig
+    from wwb_scanner.scanner.sample_processing import SampleSet
+
+    config = ScanConfig(scan_range=[470., 480.])
+    config.device.backend = 'synthetic'
+    config.device.backend_options = dict(realtime=False, seed=2)
+    config.sampling.window_size = 128
+    scanner = Scanner(config=config, autosave=False)
+    assert scanner.sampling_config.pipeline_processing
+
+    process_samples = SampleSet.process_samples
+    failed = []
+    def failing_process_samples(sample_set):
+        if sample_set.collection.num_processed == 3 and not failed:
+            failed.append(sample_set.center_frequency)
+            raise ValueError('bad hop')
+        process_samples(sample_set)
+    monkeypatch.setattr(SampleSet, 'process_samples', failing_process_samples)
+
+    with pytest.raises(ValueError):
+        scanner.run_scan()
+
+    # The other hops are kept and the failed one is counted
+    plan = scanner.plan
+    collection = scanner.sample_collection
+    progress = scanner.scan_progress
+    assert collection.pipeline is None
+    failing_fc = failed[0]
+    assert [fc for fc, _ in collection.errors] == [failing_fc]
+    assert progress.hops_failed == 1
+    assert progress.hops_done == plan.num_hops - 1
+    assert progress.hops_remaining == 0
+    assert progress.fraction == 1.
+    assert '(1 failed)' in str(progress)
+
+@pytest.mark.parametrize('window_type', ['boxcar', 'hann'])
+def test_single_precision(window_type):
+    from wwb_scanner.scanner.config import SamplingConfig
+    from wwb_scanner.scanner.psd import PSDEngine, PSDAccumulator, ByteSampleConverter
+    from wwb_scanner.utils import dbmath
+
+    rs = 2.048e6
+    samples_per_sweep = 8192
+    sweeps_per_scan = 20
+    config = SamplingConfig(window_type=window_type, window_size=128)
+    engine = PSDEngine.from_config(config, sample_rate=rs)
+    config.single_precision = True
+    engine32 = PSDEngine.from_config(config, sample_rate=rs)
+    assert engine32.window.dtype == np.float32
+
+    converter = ByteSampleConverter(samples_per_sweep)
+    accumulator = PSDAccumulator(engine32)
+
+    raw_bytes = np.random.randint(
+        low=0, high=256, size=samples_per_sweep * sweeps_per_scan * 2,
+    ).astype(np.uint8)
+
+    # Same conversion as pyrtlsdr's packed_bytes_to_iq
+    iq = raw_bytes.astype(np.float64).view(np.complex128)
+    iq /= 127.5
+    iq -= (1 + 1j)
+
+    for sweep_bytes in raw_bytes.reshape((sweeps_per_scan, -1)):
+        iq32 = converter.convert(sweep_bytes.tobytes())
+        assert iq32.dtype == np.complex64
+        accumulator.add_samples(iq32)
+
+    for fc in [470e6, 600.256e6]:
+        freqs, Pxx = engine.process(iq, fc)
+        freqs32, Pxx32 = engine32.process_psd(accumulator.get_psd(), fc)
+        assert Pxx32.dtype == np.float32
+        assert np.array_equal(freqs, freqs32)
+        assert np.allclose(dbmath.to_dB(Pxx), dbmath.to_dB(Pxx32), atol=.01)
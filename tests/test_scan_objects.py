@@ -61,27 +61,29 @@ def test_add_sample_set(random_samples):
     def build_data(fc):
         freqs, sig, Pxx = random_samples(n=256, rs=rs, fc=fc)
 
+        # Frequencies are stored in integer Hz
+        freqs = np.around(freqs * 1e6) / 1e6
         return freqs, Pxx
 
     def build_struct_data(freqs, ff):
         data = np.zeros(freqs.size, dtype=SampleArray.dtype)
-        data['frequency'] = freqs
+        data['frequency_hz'] = np.around(freqs * 1e6)
         data['iq'] = ff
         data['magnitude'] = np.abs(ff)
         data['dbFS'] = 10 * np.log10(np.abs(ff))
         return data
 
     def get_overlap_arrays(data1, data2):
-        freqs1 = data1['frequency']
-        freqs2 = data2['frequency']
+        freqs1 = data1['frequency_hz']
+        freqs2 = data2['frequency_hz']
         overlap_data1 = data1[np.flatnonzero(np.in1d(freqs1, freqs2))]
         overlap_data2 = data2[np.flatnonzero(np.in1d(freqs2, freqs1))]
         avg_data = np.zeros(overlap_data1.size, dtype=overlap_data1.dtype)
-        avg_data['frequency'] = overlap_data1['frequency']
+        avg_data['frequency_hz'] = overlap_data1['frequency_hz']
         for key in ['iq', 'magnitude', 'dbFS']:
             avg_data[key] = np.mean([overlap_data1[key], overlap_data2[key]], axis=0)
         non_overlap_data2 = data2[np.flatnonzero(np.in1d(freqs2, freqs1, invert=True))]
-        assert np.array_equal(overlap_data1['frequency'], overlap_data2['frequency'])
+        assert np.array_equal(overlap_data1['frequency_hz'], overlap_data2['frequency_hz'])
 
         return avg_data, non_overlap_data2
 
@@ -118,11 +120,12 @@ def test_add_sample_set(random_samples):
     assert spectrum.sample_data.size == data1.size + non_overlap_data2.size
 
     for freq in freqs2:
-        mask = np.isin([freq], avg_data['frequency'])
+        freq_hz = np.around(freq * 1e6)
+        mask = np.isin([freq_hz], avg_data['frequency_hz'])
         if np.any(mask):
-            val = avg_data[np.searchsorted(avg_data['frequency'], freq)]
+            val = avg_data[np.searchsorted(avg_data['frequency_hz'], freq_hz)]
         else:
-            val = non_overlap_data2[np.searchsorted(non_overlap_data2['frequency'], freq)]
+            val = non_overlap_data2[np.searchsorted(non_overlap_data2['frequency_hz'], freq_hz)]
         sample = spectrum.samples[freq]
         ix = sample.spectrum_index
         iq = spectrum.sample_data['iq'][ix]
@@ -150,11 +153,12 @@ def test_add_sample_set(random_samples):
     assert spectrum.sample_data.size == data1.size + non_overlap_data2.size + non_overlap_data3.size
 
     for freq in freqs3:
-        mask = np.isin([freq], avg_data2['frequency'])
+        freq_hz = np.around(freq * 1e6)
+        mask = np.isin([freq_hz], avg_data2['frequency_hz'])
         if np.any(mask):
-            val = avg_data2[np.searchsorted(avg_data2['frequency'], freq)]
+            val = avg_data2[np.searchsorted(avg_data2['frequency_hz'], freq_hz)]
         else:
-            val = non_overlap_data3[np.searchsorted(non_overlap_data3['frequency'], freq)]
+            val = non_overlap_data3[np.searchsorted(non_overlap_data3['frequency_hz'], freq_hz)]
         sample = spectrum.samples[freq]
         ix = sample.spectrum_index
         iq = spectrum.sample_data['iq'][ix]
@@ -163,3 +167,336 @@ def test_add_sample_set(random_samples):
         assert iq == val['iq'] == sample.iq
         assert m == val['magnitude'] == sample.magnitude
         assert dB == val['dbFS'] == sample.dbFS
+
+def test_spectrum_samples_view(random_samples):
+    from wwb_scanner.scan_objects import Spectrum
+    from wwb_scanner.scan_objects.spectrum import compare_spectra
+
+    freqs, sig, ff = random_samples(n=512)
+    spectrum = Spectrum()
+    spectrum.add_sample_set(frequency=freqs, magnitude=np.abs(ff), force_lower_freq=True)
+
+    samples = spectrum.samples
+    assert len(samples) == freqs.size
+    assert list(samples) == freqs.tolist()
+    assert freqs[10] in samples
+    assert freqs[10] + 1e-6 not in samples
+    assert samples.get(freqs[10] + 1e-6) is None
+
+    sample = samples[freqs[10]]
+    assert sample.spectrum_index == 10
+    assert sample.magnitude == np.abs(ff)[10]
+    version = spectrum.version
+    sample.dbFS = -50.
+    assert spectrum.sample_data['dbFS'][10] == -50.
+    assert spectrum.version > version
+
+    other = Spectrum()
+    other.add_sample_set(frequency=freqs[::2], magnitude=np.abs(ff)[::2] / 2, force_lower_freq=True)
+    diff = compare_spectra(spectrum, other)
+    assert np.array_equal(diff.sample_data['frequency'], freqs[::2])
+    expected = spectrum.sample_data['magnitude'][::2] - other.sample_data['magnitude']
+    assert np.array_equal(diff.sample_data['magnitude'], expected)
+
+    # Samples of a spectrum decoded from JSON (read-only arrays) can be edited
+    decoded = Spectrum.from_json(spectrum.to_json())
+    assert not decoded.sample_data.data.flags.writeable
+    snapshot = decoded.snapshot
+    sample = decoded.samples[freqs[20]]
+    sample.dbFS = -50.
+    sample.magnitude = 2.
+    sample.iq = 1 + 2j
+    assert decoded.sample_data['magnitude'][20] == 2.
+    assert decoded.sample_data['dbFS'][20] == -50.
+    assert decoded.sample_data['iq'][20] == 1 + 2j
+    assert snapshot.data['dbFS'][20] == spectrum.sample_data['dbFS'][20]
+
+def test_spectrum_snapshot(random_samples):
+    import threading
+    import pytest
+    from wwb_scanner.scan_objects import Spectrum
+
+    freqs, sig, ff = random_samples(n=256)
+    spectrum = Spectrum()
+    empty = spectrum.snapshot
+    assert empty.version == 0
+    assert not empty.size
+
+    spectrum.add_sample_set(frequency=freqs[:128], magnitude=np.abs(ff)[:128], force_lower_freq=True)
+    snapshot = spectrum.snapshot
+    assert snapshot.version == spectrum.version
+    assert snapshot is spectrum.snapshot
+    assert np.array_equal(snapshot.frequency, freqs[:128])
+    assert not snapshot.data.flags.writeable
+    with pytest.raises(AttributeError):
+        snapshot.version = 0
+
+    # Merges don't touch published snapshots
+    spectrum.add_sample_set(frequency=freqs[128:], magnitude=np.abs(ff)[128:], force_lower_freq=True)
+    assert snapshot.size == 128
+    assert spectrum.snapshot.size == 256
+
+    # Readers get the previous snapshot instead of waiting on a writer
+    locked = threading.Event()
+    release = threading.Event()
+    def writer():
+        with spectrum.data_update_lock:
+            spectrum.sample_data['dbFS'] = -50.
+            spectrum.set_data_updated()
+            locked.set()
+            release.wait()
+    t = threading.Thread(target=writer)
+    t.start()
+    locked.wait()
+    snapshot = spectrum.snapshot
+    assert snapshot.version < spectrum.version
+    assert snapshot.size == 256
+    assert np.all(snapshot.dbFS != -50.)
+    release.set()
+    t.join()
+    snapshot = spectrum.snapshot
+    assert snapshot.version == spectrum.version
+    assert np.all(snapshot.dbFS == -50.)
+
+    # A pending request is published by the next writer
+    spectrum._snapshot_requested = True
+    spectrum.smooth(4)
+    assert spectrum._snapshot.version == spectrum.version
+    assert not spectrum._snapshot_requested
+
+def test_spectrum_snapshot_chunks(monkeypatch):
+    from wwb_scanner.scan_objects import Spectrum, SpectrumSnapshot
+
+    monkeypatch.setattr(SpectrumSnapshot, 'chunk_size', 100)
+    freqs = 470000000 + np.arange(1000, dtype=np.int64) * 25000
+    spectrum = Spectrum()
+    spectrum.add_sample_set(frequency_hz=freqs, magnitude=np.ones(freqs.size))
+    first = spectrum.snapshot
+    assert len(first.chunks) == 10
+
+    # Only the chunks overlapping the changed range are copied again
+    with spectrum.data_update_lock:
+        spectrum.sample_data['dbFS'][250:260] = -50.
+        spectrum.set_data_updated(250, 260)
+    second = spectrum.snapshot
+    assert second.chunks[2] is not first.chunks[2]
+    shared = [i for i in range(10) if second.chunks[i] is first.chunks[i]]
+    assert shared == [0, 1, 3, 4, 5, 6, 7, 8, 9]
+    r = second.get_range(195, 305)
+    assert np.array_equal(r, spectrum.sample_data.data[195:305])
+    assert not r.flags.writeable
+    assert np.all(first.dbFS[250:260] == 0)
+    assert np.all(second.dbFS[250:260] == -50.)
+    assert np.array_equal(second.data, spectrum.sample_data.data)
+    assert not second.data.flags.writeable
+
+    # Appending past the end copies only the last (partial) chunk onward
+    spectrum.add_sample_set(
+        frequency_hz=freqs[-1] + 25000 * np.arange(1, 51), magnitude=np.ones(50),
+    )
+    third = spectrum.snapshot
+    assert third.size == 1050
+    assert all(third.chunks[i] is second.chunks[i] for i in range(10))
+    assert third.chunks[10].size == 50
+    assert np.array_equal(third.data, spectrum.sample_data.data)
+
+def test_spectrum_changed_range():
+    from wwb_scanner.scan_objects import Spectrum
+
+    nfft = 256
+    step = 100
+    rel_freqs = np.arange(nfft) * 1000
+    spectrum = Spectrum()
+    copy = np.zeros(0, dtype=spectrum.sample_data.dtype)
+    version = None
+    for i in range(64):
+        fc = 500000000 + i * step * 1000
+        freqs = rel_freqs + fc
+        if i % 3 == 2:
+            # Offset hop that interleaves with the existing bins
+            freqs = freqs + 500
+        spectrum.add_sample_set(
+            frequency_hz=freqs, magnitude=np.random.uniform(.1, 1, nfft),
+            force_lower_freq=True,
+        )
+        snapshot = spectrum.snapshot
+        start, stop = snapshot.changed_range(version)
+        if version is not None:
+            # Only the bins around the new hop are reported
+            assert stop - start <= 3 * nfft
+        size = snapshot.size
+        if copy.size != size:
+            stop = size
+            copy = np.concatenate([copy[:start], np.zeros(size - start, dtype=copy.dtype)])
+        copy[start:stop] = snapshot.data[start:stop]
+        version = snapshot.version
+        assert np.array_equal(copy, snapshot.data)
+
+    # Only the last few changes are kept
+    spectrum.max_changes = 4
+    v = spectrum.version
+    for i in range(8):
+        spectrum.sample_data['dbFS'][i] = 0.
+        spectrum.set_data_updated(i, i + 1)
+    snapshot = spectrum.snapshot
+    assert snapshot.changed_range(v + 5) == (5, 8)
+    assert snapshot.changed_range(v) == (0, snapshot.size)
+    assert snapshot.changed_range(snapshot.version) == (snapshot.size, snapshot.size)
+
+    spectrum.smooth(4)
+    snapshot = spectrum.snapshot
+    assert snapshot.changed_range(snapshot.version - 1) == (0, snapshot.size)
+
+def test_sample_array_merge():
+    from wwb_scanner.scan_objects import SampleArray
+
+    def legacy_merge(a, b):
+        in_a = np.in1d(a['frequency_hz'], b['frequency_hz'])
+        in_b = np.in1d(b['frequency_hz'], a['frequency_hz'])
+        a = a.copy()
+        for key in ['iq', 'magnitude', 'dbFS']:
+            a[key][in_a] = np.mean([a[key][in_a], b[key][in_b]], axis=0)
+        return np.sort(np.append(a, b[~in_b]), order='frequency_hz')
+
+    rng = np.random.RandomState(1)
+    grid = np.arange(4096) * .008 + 470.
+    a = SampleArray()
+    expected = np.empty(0, dtype=SampleArray.dtype)
+    for _ in range(50):
+        start = rng.randint(0, grid.size - 128)
+        freqs = np.sort(rng.choice(grid[start:start+256], 128, replace=False))
+        b = SampleArray.create(frequency=freqs, magnitude=rng.uniform(1, 2, freqs.size))
+        a.insert_sorted(b)
+        expected = legacy_merge(expected, b.data)
+        assert np.array_equal(a.data, expected)
+    assert a.capacity >= a.size
+
+def test_sample_array_merge_cost():
+    from scipy.signal import get_window
+    from wwb_scanner.scanner.plan import ScanPlan
+    from wwb_scanner.scan_objects import Spectrum
+
+    plan = ScanPlan(
+        scan_range=[470., 530.], sample_rate=2.048e6,
+        window=get_window('hann', 128),
+    )
+    rng = np.random.RandomState(0)
+
+    def merge_hops(spectrum):
+        sdata = spectrum.sample_data
+        buffers = [sdata._buffer]
+        for fc in plan.hop_centers:
+            size = sdata.size
+            freqs = plan.hop_frequencies(fc)
+            start, stop = spectrum._add_sample_set(
+                frequency_hz=freqs, magnitude=rng.uniform(1e-9, 1e-6, freqs.size),
+                force_lower_freq=True,
+            )
+            # Only the overlap with the previous hop and the new bins change,
+            # nothing before them is moved
+            assert stop == sdata.size
+            assert stop - start <= freqs.size
+            assert np.array_equal(sdata['frequency_hz'][start:], np.union1d(
+                freqs, sdata['frequency_hz'][start:size],
+            ))
+            if sdata._buffer is not buffers[-1]:
+                buffers.append(sdata._buffer)
+        assert sdata.size == plan.num_bins
+        assert np.all(np.diff(sdata['frequency_hz']) > 0)
+        return buffers
+
+    # A spectrum reserved for the plan's bins never reallocates
+    spectrum = Spectrum()
+    spectrum.sample_data.reserve(plan.num_bins)
+    assert len(merge_hops(spectrum)) == 1
+
+    # Otherwise the buffer grows geometrically
+    spectrum = Spectrum()
+    buffers = merge_hops(spectrum)
+    assert len(buffers) <= np.ceil(np.log2(plan.num_bins / 1024.)) + 2
+
+def test_sample_array_hz():
+    from wwb_scanner.scan_objects import SampleArray
+
+    legacy_dtype = np.dtype([
+        ('frequency', np.float64),
+        ('iq', np.complex128),
+        ('magnitude', np.float64),
+        ('dbFS', np.float64)
+    ])
+    legacy = np.zeros(4, dtype=legacy_dtype)
+    legacy['frequency'] = [470.1, 470.0125, 470.0000001, 470.025]
+    legacy['magnitude'] = [1, 2, 3, 4]
+
+    a = SampleArray(legacy)
+    assert a.data.dtype == SampleArray.dtype
+    assert a['frequency_hz'].tolist() == [470000000, 470012500, 470025000, 470100000]
+    assert a['magnitude'].tolist() == [3, 2, 4, 1]
+    assert np.array_equal(a['frequency'], a.frequency)
+    assert a['frequency'].tolist() == [470., 470.0125, 470.025, 470.1]
+
+    a['frequency'] = a['frequency'] + .001
+    assert a['frequency_hz'][0] == 470001000
+
+    # Hops computed separately in float MHz still line up exactly
+    b = SampleArray.create(frequency=(np.arange(4) * 12500 + 470001000) * 1e-6, magnitude=1.)
+    a.insert_sorted(b)
+    assert a.size == 5
+    assert a.index_of(470.001) == 0
+    assert a['magnitude'][0] == 2.
+
+def test_sample_array_compact(tmpdir):
+    from wwb_scanner.scan_objects import SampleArray
+    from wwb_scanner.utils.scanstore import ScanStore
+
+    freqs = 470000000 + np.arange(4096, dtype=np.int64) * 25000
+    dB = np.random.uniform(-120, -20, freqs.size)
+    dB[10] = np.nan
+    a = SampleArray.create(frequency_hz=freqs, dbFS=dB)
+
+    d = a.to_compact()
+    assert set(d.keys()) == {'frequency_axis', 'dbFS'}
+    assert d['frequency_axis'].tolist() == [470000000, 25000, freqs.size]
+    assert d['dbFS'].dtype == np.int16
+    assert a.data.nbytes / sum(v.nbytes for v in d.values()) > 5
+
+    b = SampleArray.from_compact(d)
+    assert np.array_equal(b['frequency_hz'], freqs)
+    assert np.isnan(b['dbFS'][10]) and np.isnan(b['magnitude'][10])
+    ix = ~np.isnan(dB)
+    assert np.allclose(b['dbFS'][ix], dB[ix], rtol=0, atol=.005)
+    assert np.allclose(b['magnitude'][ix], a['magnitude'][ix], rtol=.002)
+    # Exact once quantized
+    c = SampleArray.from_compact(b.to_compact())
+    assert np.array_equal(c.data[ix], b.data[ix])
+
+    # Uneven spacing and iq are kept as is
+    a = SampleArray.create(frequency_hz=freqs[[0, 1, 3]], iq=np.array([1+1j, 2, 3]))
+    d = a.to_compact()
+    assert set(d.keys()) == {'frequency_hz', 'dbFS', 'iq'}
+    b = SampleArray.from_compact(d)
+    assert np.array_equal(b['frequency_hz'], a['frequency_hz'])
+    assert np.array_equal(b['iq'], a['iq'])
+
+    a = SampleArray.create(frequency_hz=freqs, dbFS=np.nan_to_num(dB))
+    expected = SampleArray.from_compact(a.to_compact())
+    sizes = {}
+    for compact, compress in [(False, False), (True, False), (True, True)]:
+        key = '{}-{}'.format(compact, compress)
+        store = ScanStore(
+            str(tmpdir.join(key + '.sqlite')), str(tmpdir.join(key + '.bin')),
+            compact=compact, compress=compress,
+        )
+        eid = store.insert({'name':key, 'sample_data':a})
+        sizes[key] = tmpdir.join(key + '.bin').size()
+        data = store.get_sample_data(eid).data
+        if compact:
+            assert np.array_equal(data, expected.data)
+        else:
+            assert np.array_equal(data, a.data)
+        info = store.list_scans()[eid]
+        assert info['num_points'] == freqs.size
+        assert info['frequency_range'] == [freqs[0] / 1e6, freqs[-1] / 1e6]
+        store.close()
+    assert sizes['False-False'] / sizes['True-False'] > 5
+    assert sizes['True-True'] < sizes['True-False']
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+import numpy as np
+
+def test_scan_plan():
+    from wwb_scanner.scanner.plan import ScanPlan, calc_step_size
+    from wwb_scanner.scanner.config import ScanConfig
+
+    config = ScanConfig(scan_range=[24., 1700.])
+    config.sampling.window_size = 128
+    config.sampling.window_type = 'hann'
+
+    start_ts = time.perf_counter()
+    plan = ScanPlan.from_config(config)
+    assert time.perf_counter() - start_ts < .5
+
+    step_size, equal_spacing = calc_step_size(2048000, 128, .5)
+    assert plan.step_size == step_size
+    assert plan.equal_spacing is equal_spacing
+    assert plan.hop_centers.dtype == np.int64
+    assert plan.hop_centers[0] == 24000000
+    assert plan.hop_centers[-1] <= 1700000000
+    assert plan.hop_centers[-1] + plan.step_size_hz > 1700000000
+    assert np.all(np.diff(plan.hop_centers) == plan.step_size_hz)
+
+    rel_freqs = np.fft.fftshift(np.fft.fftfreq(128, 1 / 2048000))
+    assert plan.frequencies.dtype == np.int64
+    assert np.array_equal(plan.frequencies, np.around(rel_freqs))
+    assert np.array_equal(np.fft.fftfreq(128)[plan.sort_index], np.fft.fftshift(np.fft.fftfreq(128)))
+
+    with pytest.raises(AttributeError):
+        plan.step_size_hz = 1
+    with pytest.raises(ValueError):
+        plan.hop_centers[0] = 0
+
+    sub_plans = plan.split(3)
+    assert len(sub_plans) == 3
+    assert np.array_equal(
+        np.concatenate([p.hop_centers for p in sub_plans]), plan.hop_centers,
+    )
+    for p in sub_plans:
+        assert p.step_size_hz == plan.step_size_hz
+        assert np.array_equal(p.frequencies, plan.frequencies)
+        assert ScanPlan.from_config(
+            ScanConfig(scan_range=p.scan_range, sampling=config.sampling._serialize())
+        ).hop_centers.tolist() == p.hop_centers.tolist()
+
+def test_scanner_plan_rebuilt(tmp_db_store):
+    from wwb_scanner.scanner.main import Scanner
+    from wwb_scanner.scanner.config import ScanConfig
+
+    config = ScanConfig(scan_range=[470., 475.])
+    config.device.backend = 'synthetic'
+    config.device.backend_options = dict(realtime=False, seed=1)
+    config.sampling.window_size = 128
+    scanner = Scanner(config=config, autosave=False)
+    scanner.run_scan()
+    plan = scanner.plan
+    assert np.array_equal(scanner.spectrum.sample_data['frequency_hz'], plan.frequency_axis())
+
+    # Config changes apply to the next scan
+    scanner.config.scan_range = [480., 490.]
+    scanner.config.sampling.window_size = 256
+    scanner.run_scan()
+    assert scanner.plan is not plan
+    assert scanner.plan.nfft == 256
+    assert scanner.plan.scan_range[0] == 480.
+    assert scanner.sample_collection.plan is scanner.plan
+    freqs = scanner.spectrum.sample_data['frequency_hz']
+    assert np.all(np.isin(scanner.plan.frequency_axis(), freqs))
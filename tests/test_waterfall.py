@@ -0,0 +1,61 @@
+import numpy as np
+
+def test_dB_to_rgba():
+    from wwb_scanner.utils.color import build_colormap, dB_to_rgba
+
+    lut = build_colormap(['#000000', '#ff0000', '#ffffff'], size=5)
+    assert lut.shape == (5, 4)
+    assert lut.dtype == np.uint8
+    assert np.array_equal(lut[0], [0, 0, 0, 255])
+    assert np.array_equal(lut[2], [255, 0, 0, 255])
+    assert np.array_equal(lut[4], [255, 255, 255, 255])
+
+    dB = np.array([[-200., -100., -75.], [-50., 0., np.nan]])
+    rgba = dB_to_rgba(dB, -100., -50., lut)
+    assert rgba.shape == (2, 3, 4)
+    assert np.array_equal(rgba[0,0], lut[0])
+    assert np.array_equal(rgba[0,1], lut[0])
+    assert np.array_equal(rgba[0,2], lut[2])
+    assert np.array_equal(rgba[1,0], lut[4])
+    assert np.array_equal(rgba[1,1], lut[4])
+    assert np.array_equal(rgba[1,2], lut[0])
+
+def test_waterfall_buffer():
+    from wwb_scanner.ui.waterfall import WaterfallBuffer
+    from wwb_scanner.scan_objects import SpectrumHistory
+
+    freqs = 470000000 + np.arange(1000, dtype=np.int64) * 25000
+    wf = WaterfallBuffer(width=100, height=8, min_db=-120., max_db=-20.)
+    assert wf.image.shape == (8, 100, 4)
+    assert np.all(wf.image == wf.colormap[0])
+
+    history = SpectrumHistory(max_rows=4, frequency_hz=freqs)
+    for i in range(12):
+        row = np.full(freqs.size, -120.)
+        # Single bin carrier moving up one column per sweep
+        row[i * 10 + 3] = -20.
+        history.append(row, timestamp=float(i))
+        version = wf.add_history_row(history)
+    assert version == wf.version
+    assert wf.num_rows == 8
+
+    image = wf.image
+    assert image.flags['C_CONTIGUOUS']
+    # Newest sweep is the top row
+    for row_ix in range(8):
+        col = 11 - row_ix
+        assert np.array_equal(image[row_ix,col], wf.colormap[-1])
+        others = np.delete(image[row_ix], col, axis=0)
+        assert np.all(others == wf.colormap[0])
+
+    # Recoloring keeps the rows
+    wf.set_limits(-120., 20.)
+    mid = wf.colormap[int((100 / 140) * (wf.colormap.shape[0] - 1))]
+    assert np.array_equal(wf.image[0,11], mid)
+    assert np.array_equal(wf.image[7,4], mid)
+
+    # A new axis clears the image
+    wf.add_row(np.full(10, -20.), freqs[:10])
+    assert wf.num_rows == 1
+    assert np.all(wf.image[1:] == wf.colormap[0])
+    assert np.all(wf.values[0] == -20.)
@@ -52,11 +52,30 @@ class BaseExporter(object):
             f.write(s)
 
 class NumpyExporter(BaseExporter):
+    '''Writes the spectrum data as ``.npz``
+
+    By default the data is written in the compact form of
+    :meth:`SampleArray.to_compact <wwb_scanner.scan_objects.SampleArray.to_compact>`
+    (levels rounded to 0.01 dB). Pass ``compact=False`` to write the full
+    array as ``sample_data`` or ``compress=True`` to zlib compress the file.
+    '''
     _extension = 'npz'
+    def __init__(self, **kwargs):
+        super(NumpyExporter, self).__init__(**kwargs)
+        self.compact = kwargs.get('compact', True)
+        self.compress = kwargs.get('compress', False)
     def build_data(self):
-        pass
+        from wwb_scanner.scan_objects import SampleArray
+        data = self.spectrum.snapshot.data
+        if self.compact:
+            return SampleArray(data).to_compact()
+        return dict(sample_data=data)
     def write_file(self):
-        np.savez(self.filename, sample_data=self.spectrum.sample_data)
+        data = self.build_data()
+        if self.compress:
+            np.savez_compressed(self.filename, **data)
+        else:
+            np.savez(self.filename, **data)
 
 class CSVExporter(BaseExporter):
     _extension = 'csv'
@@ -74,8 +93,9 @@ class CSVExporter(BaseExporter):
         delim = self.delimiter_char
         frequency_format = self.frequency_format
         lines = []
-        freqs = np.around(self.spectrum.sample_data['frequency'], decimals=3)
-        dB = np.around(self.spectrum.sample_data['dbFS'], decimals=1)
+        snapshot = self.spectrum.snapshot
+        freqs = np.around(snapshot.frequency, decimals=3)
+        dB = np.around(snapshot.dbFS, decimals=1)
         for f, v in zip(freqs, dB):
             lines.append(delim.join([str(f), str(v)]))
         return newline_chars.join(lines)
@@ -110,12 +130,13 @@ class BaseWWBExporter(BaseExporter):
         if spectrum.step_size is None:
             spectrum.smooth(11)
             spectrum.interpolate()
+        freqs = spectrum.snapshot.frequency
         d['data_set'] = dict(
             index='0',
             freq_units='KHz',
             ampl_units='dBm',
-            start_freq=str(min(spectrum.samples.keys()) * 1000),
-            stop_freq=str(max(spectrum.samples.keys()) * 1000),
+            start_freq=str(float(freqs.min()) * 1000),
+            stop_freq=str(float(freqs.max()) * 1000),
             step_freq=str(spectrum.step_size * 1000),
             res_bandwidth='TODO',
             scale_factor='1',
@@ -152,8 +173,7 @@ class WWBLegacyExporter(BaseWWBExporter):
         attribs = self.attribs
         data_sets = root.find('data_sets')
         data_set = ET.SubElement(data_sets, 'data_set', attribs['data_set'])
-        freqs = np.around(self.spectrum.sample_data['frequency'], decimals=3)
-        dB = np.around(self.spectrum.sample_data['dbFS'], decimals=1)
+        dB = np.around(spectrum.snapshot.dbFS, decimals=1)
         for val in dB:
             v = ET.SubElement(data_set, 'v')
             v.text = str(val)
@@ -168,8 +188,9 @@ class WWBExporter(BaseWWBExporter):
         data_sets = root.find('data_sets')
         freq_set = ET.SubElement(data_sets, 'freq_set')
         data_set = ET.SubElement(data_sets, 'data_set', self.attribs['data_set'])
-        freqs = self.spectrum.sample_data['frequency'] * 1000
-        dB = np.around(self.spectrum.sample_data['dbFS'], decimals=1)
+        snapshot = spectrum.snapshot
+        freqs = snapshot.frequency * 1000
+        dB = np.around(snapshot.dbFS, decimals=1)
         nanix = np.flatnonzero(np.isnan(dB) | np.isinf(dB))
         dB[nanix] = -140.
         for freq, val in zip(freqs, dB):
@@ -5,7 +5,7 @@ import itertools
 
 import numpy as np
 
-from wwb_scanner.scan_objects import Spectrum
+from wwb_scanner.scan_objects import Spectrum, SampleArray
 
 class BaseImporter(object):
     def __init__(self, **kwargs):
@@ -39,10 +39,14 @@ class BaseImporter(object):
 class NumpyImporter(BaseImporter):
     _extension = 'npz'
     def __call__(self):
-        data = np.load(self.filename)
+        with np.load(self.filename) as data:
+            if 'sample_data' in data.files:
+                sample_data = data['sample_data']
+            else:
+                sample_data = SampleArray.from_compact(data).data
         spectrum = self.spectrum
         spectrum.name = os.path.basename(self.filename)
-        spectrum.add_sample_set(data=data['sample_data'])
+        spectrum.add_sample_set(data=sample_data)
         return spectrum
 
 
@@ -1,3 +1,4 @@
 from .samplearray import SampleArray
 from .sample import Sample, TimeBasedSample
-from .spectrum import Spectrum, TimeBasedSpectrum
+from .spectrum import Spectrum, TimeBasedSpectrum, SpectrumSnapshot
+from .history import SpectrumHistory
@@ -0,0 +1,203 @@
+import time
+import threading
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+class SpectrumHistory(object):
+    '''Fixed size ring buffer of sweeps over time (a waterfall)
+
+    Each row holds the dB values of one sweep as float32 on a fixed integer
+    Hz frequency axis, along with the time the sweep started. Once the
+    buffer is full the oldest row is overwritten, so memory use is bounded
+    no matter how long monitoring runs.
+
+    Rows are filled one hop at a time between :meth:`begin_row` and
+    :meth:`commit_row`. Only committed rows are visible to readers, so
+    rows can be read from another thread while a sweep is in progress.
+
+    Timestamps are expected to increase from row to row. They're used to
+    look rows up by time with a binary search.
+
+    params:
+        max_bytes: (int) size budget for the dB values. Used to calculate
+            :attr:`max_rows` when that isn't given
+        max_rows: (int) number of rows to keep
+        filename: path of a file to store the rows in (through a memmap).
+            The OS can then page out older rows, so *max_bytes* can be set
+            well above the available memory
+        frequency_hz: the frequency axis. If not given here, it's set by
+            :meth:`allocate` or the first :meth:`append`
+    '''
+    dtype = np.dtype(np.float32)
+    def __init__(self, **kwargs):
+        self.max_bytes = kwargs.get('max_bytes', DEFAULT_MAX_BYTES)
+        self.max_rows = kwargs.get('max_rows')
+        self.filename = kwargs.get('filename')
+        self.frequency_hz = None
+        self.data = None
+        self.timestamps = None
+        self.lock = threading.Lock()
+        self._head = 0
+        self._count = 0
+        self._row_pending = False
+        frequency_hz = kwargs.get('frequency_hz')
+        if frequency_hz is not None:
+            self.allocate(frequency_hz)
+    @property
+    def allocated(self):
+        return self.data is not None
+    @property
+    def num_columns(self):
+        if self.frequency_hz is None:
+            return 0
+        return self.frequency_hz.size
+    @property
+    def frequency(self):
+        return self.frequency_hz / 1e6
+    def allocate(self, frequency_hz):
+        '''Allocates the buffer for the given frequency axis (sorted, in
+        integer Hz)
+        '''
+        frequency_hz = np.asarray(frequency_hz, dtype=np.int64)
+        num_columns = max(frequency_hz.size, 1)
+        max_rows = self.max_rows
+        if max_rows is None:
+            max_rows = self.max_bytes // (num_columns * self.dtype.itemsize)
+        max_rows = self.max_rows = max(int(max_rows), 1)
+        shape = (max_rows, frequency_hz.size)
+        if self.filename is not None:
+            data = np.memmap(self.filename, dtype=self.dtype, mode='w+', shape=shape)
+        else:
+            data = np.empty(shape, dtype=self.dtype)
+        with self.lock:
+            self.frequency_hz = frequency_hz
+            self.data = data
+            self.timestamps = np.full(max_rows, np.nan)
+            self._head = 0
+            self._count = 0
+            self._row_pending = False
+    def __len__(self):
+        return self._count
+    def begin_row(self, timestamp=None):
+        '''Starts a new row (filled with NaN) for the next sweep
+        '''
+        if not self.allocated:
+            raise ValueError('History buffer has not been allocated')
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            ix = self._head
+            if self._count == self.max_rows:
+                # The oldest row is about to be overwritten
+                self._count -= 1
+            self.data[ix] = np.nan
+            self.timestamps[ix] = timestamp
+            self._row_pending = True
+    def add_hop(self, frequency_hz, dbFS):
+        '''Writes the values of one hop into the pending row
+
+        Values for frequencies that are already set are averaged, the same
+        way overlapping hops are merged into a :class:`Spectrum`.
+        Frequencies not on the axis are ignored.
+        '''
+        if not self._row_pending:
+            raise ValueError('No row has been started')
+        axis = self.frequency_hz
+        frequency_hz = np.asarray(frequency_hz)
+        ix = np.searchsorted(axis, frequency_hz)
+        valid = ix < axis.size
+        valid[valid] = axis[ix[valid]] == frequency_hz[valid]
+        ix = ix[valid]
+        values = np.asarray(dbFS, dtype=self.dtype)[valid]
+        row = self.data[self._head]
+        cur = row[ix]
+        row[ix] = np.where(np.isnan(cur), values, (cur + values) / 2)
+    def commit_row(self):
+        '''Makes the pending row visible and returns its timestamp
+        '''
+        if not self._row_pending:
+            return None
+        with self.lock:
+            ix = self._head
+            self._head = (ix + 1) % self.max_rows
+            self._count += 1
+            self._row_pending = False
+        return self.timestamps[ix]
+    def append(self, dbFS, frequency_hz=None, timestamp=None):
+        '''Adds a full sweep as a new row
+
+        If *frequency_hz* is given and differs from the axis, the values are
+        placed by frequency. If the buffer hasn't been allocated yet, it's
+        allocated using *frequency_hz*.
+        '''
+        if not self.allocated:
+            if frequency_hz is None:
+                raise ValueError('frequency_hz is required to allocate the buffer')
+            self.allocate(frequency_hz)
+        self.begin_row(timestamp)
+        if frequency_hz is None:
+            self.data[self._head] = dbFS
+        else:
+            self.add_hop(frequency_hz, dbFS)
+        return self.commit_row()
+    def add_spectrum(self, spectrum, timestamp=None):
+        snapshot = spectrum.snapshot
+        return self.append(snapshot.dbFS, snapshot.frequency_hz, timestamp)
+    def _physical_index(self, ix):
+        return (self._head - self._count + ix) % self.max_rows
+    def get_timestamps(self):
+        '''Timestamps of all rows, oldest first
+        '''
+        with self.lock:
+            return self.timestamps[self._physical_index(np.arange(self._count))]
+    def index_of_time(self, timestamp, side='left'):
+        return int(np.searchsorted(self.get_timestamps(), timestamp, side=side))
+    def get_rows(self, start=0, stop=None):
+        '''Returns copies of the timestamps and rows from *start* to *stop*
+        (oldest first, with negative indices counted from the newest)
+        '''
+        with self.lock:
+            start, stop, _ = slice(start, stop).indices(self._count)
+            ix = self._physical_index(np.arange(start, stop))
+            return self.timestamps[ix], self.data[ix]
+    def get_row(self, ix):
+        timestamps, rows = self.get_rows(ix, ix + 1 if ix != -1 else None)
+        if not timestamps.size:
+            raise IndexError(ix)
+        return timestamps[0], rows[0]
+    def _time_range(self, start_ts=None, end_ts=None):
+        timestamps = self.get_timestamps()
+        start = 0
+        stop = timestamps.size
+        if start_ts is not None:
+            start = int(np.searchsorted(timestamps, start_ts, side='left'))
+        if end_ts is not None:
+            stop = int(np.searchsorted(timestamps, end_ts, side='right'))
+        return start, stop
+    def time_slice(self, start_ts=None, end_ts=None):
+        '''Returns the timestamps and rows between *start_ts* and *end_ts*
+        (inclusive)
+        '''
+        return self.get_rows(*self._time_range(start_ts, end_ts))
+    def max_hold(self, start_ts=None, end_ts=None, chunk_rows=64):
+        '''Maximum dB value of each frequency over a time range
+        '''
+        start, stop = self._time_range(start_ts, end_ts)
+        result = np.full(self.num_columns, np.nan, dtype=self.dtype)
+        for chunk_start in range(start, stop, chunk_rows):
+            _, rows = self.get_rows(chunk_start, min(chunk_start + chunk_rows, stop))
+            np.fmax(result, np.fmax.reduce(rows, axis=0), out=result)
+        return result
+    def flush(self):
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.data = None
+            self.frequency_hz = None
+            self.timestamps = None
+            self._count = 0
+            self._row_pending = False
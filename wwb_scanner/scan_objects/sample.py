@@ -6,6 +6,11 @@ from wwb_scanner.core import JSONMixin
 from wwb_scanner.utils import dbmath
 
 class Sample(JSONMixin):
+    '''View of a single frequency in a :class:`Spectrum`'s sample data
+
+    Values are not stored on the instance. They are looked up in (or
+    written to) :attr:`Spectrum.sample_data` on each access.
+    '''
     def __init__(self, **kwargs):
         self.init_complete = kwargs.get('init_complete', False)
         self.spectrum = kwargs.get('spectrum')
@@ -17,10 +22,12 @@ class Sample(JSONMixin):
         self.init_complete = True
     @property
     def spectrum_index(self):
-        f = self.spectrum.sample_data['frequency']
-        if self.frequency not in f:
-            return None
-        return np.argwhere(f == self.frequency)[0][0]
+        return self.spectrum.sample_data.index_of(self.frequency)
+    def _set_values(self, **kwargs):
+        spectrum = self.spectrum
+        with spectrum.data_update_lock:
+            ix = self.spectrum_index
+            spectrum.sample_data.set_values(ix, **kwargs)
     @property
     def frequency(self):
         return getattr(self, '_frequency', None)
@@ -50,8 +57,7 @@ class Sample(JSONMixin):
         if isinstance(value, (list, tuple)):
             i, q = value
             value = np.complex128(float(i) + 1j*float(q))
-        ix = self.spectrum_index
-        self.spectrum.sample_data['iq'][ix] = value
+        self._set_values(iq=value)
         if not self.init_complete:
             return
         self.spectrum.on_sample_change(sample=self, iq=value, old=old)
@@ -73,8 +79,7 @@ class Sample(JSONMixin):
                 return
         if not isinstance(value, float):
             value = float(value)
-        ix = self.spectrum_index
-        self.spectrum.sample_data['magnitude'][ix] = value
+        self._set_values(magnitude=value)
         if not self.init_complete:
             return
         self.spectrum.on_sample_change(sample=self, magnitude=value, old=old)
@@ -95,9 +100,7 @@ class Sample(JSONMixin):
         if not isinstance(value, numbers.Number):
             return
         m = dbmath.from_dB(value)
-        ix = self.spectrum_index
-        self.spectrum.sample_data['dbFS'][ix] = value
-        self.spectrum.sample_data['magnitude'][ix] = m
+        self._set_values(dbFS=value, magnitude=m)
         if not self.init_complete:
             return
         self.spectrum.on_sample_change(sample=self, dbFS=value, old=old)
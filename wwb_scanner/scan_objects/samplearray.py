@@ -5,20 +5,85 @@ import jsonfactory
 from wwb_scanner.core import JSONMixin
 from wwb_scanner.utils import dbmath
 
+def mhz_to_hz(freqs):
+    '''Converts MHz values to the nearest integer Hz (as int64)
+    '''
+    return np.rint(np.asarray(freqs, dtype=np.float64) * 1e6).astype(np.int64)
+
 class SampleArray(JSONMixin):
+    '''Structured array of spectrum data sorted by frequency
+
+    Frequencies are stored in integer Hz (the ``frequency_hz`` field) so
+    merging hops is an exact integer comparison. ``frequency`` (in MHz) is
+    still accepted everywhere a field name is and is derived from
+    ``frequency_hz`` on access, so writes to the returned array are not
+    stored. Assign to ``self['frequency']`` instead.
+
+    Read-only data (such as arrays decoded without copying) is used as is
+    and only copied the first time the array is modified.
+    '''
     dtype = np.dtype([
-        ('frequency', np.float64),
+        ('frequency_hz', np.int64),
         ('iq', np.complex128),
         ('magnitude', np.float64),
         ('dbFS', np.float64)
     ])
+    #: dB per unit of the int16 levels in :meth:`to_compact`
+    COMPACT_DB_SCALE = .01
+    COMPACT_DB_NAN = np.iinfo(np.int16).min
     def __init__(self, data=None, keep_sorted=True):
         self.keep_sorted = keep_sorted
         if data is None:
             data = np.empty([0], dtype=self.dtype)
-        self.data = data
+        self.data = self._coerce_data(data)
         if keep_sorted:
-            self.data = np.sort(self.data, order='frequency')
+            f = self.data['frequency_hz']
+            if np.any(f[1:] < f[:-1]):
+                self.data = np.sort(self.data, order='frequency_hz')
+    @classmethod
+    def _coerce_data(cls, data):
+        # Convert arrays stored before frequencies were kept in integer Hz
+        data = np.asarray(data)
+        if data.dtype == cls.dtype:
+            return data
+        names = data.dtype.names or ()
+        if 'frequency' not in names or 'frequency_hz' in names:
+            raise Exception('Cannot convert data with dtype {}'.format(data.dtype))
+        out = np.zeros(data.size, dtype=cls.dtype)
+        out['frequency_hz'] = mhz_to_hz(data['frequency'])
+        for key in ['iq', 'magnitude', 'dbFS']:
+            if key in names:
+                out[key] = data[key]
+        return out
+    @property
+    def data(self):
+        return self._buffer[:self._size]
+    @data.setter
+    def data(self, value):
+        self._buffer = value
+        self._size = value.size
+    @property
+    def capacity(self):
+        return self._buffer.size
+    def _make_writable(self):
+        buf = self._buffer
+        if not buf.flags.writeable:
+            self._buffer = buf.copy()
+    def reserve(self, capacity):
+        '''Preallocates room for at least *capacity* items
+        '''
+        if capacity <= self.capacity:
+            return
+        buf = np.zeros(capacity, dtype=self._buffer.dtype)
+        buf[:self._size] = self._buffer[:self._size]
+        self._buffer = buf
+    def _grow(self, num_items):
+        self._make_writable()
+        size = self._size + num_items
+        if size > self.capacity:
+            self.reserve(max(size, self.capacity * 2, 1024))
+        self._size = size
+        return self._buffer[:size]
     @classmethod
     def create(cls, keep_sorted=True, **kwargs):
         data = kwargs.get('data')
@@ -27,17 +92,19 @@ class SampleArray(JSONMixin):
             obj.set_fields(**kwargs)
         return obj
     def set_fields(self, **kwargs):
-        f = kwargs.get('frequency')
+        f = kwargs.get('frequency_hz')
         if f is None:
-            raise Exception('frequency array must be provided')
-        if not isinstance(f, np.ndarray):
-            f = np.array([f])
+            f = kwargs.get('frequency')
+            if f is None:
+                raise Exception('frequency array must be provided')
+            f = mhz_to_hz(f)
+        f = np.atleast_1d(f)
         data = np.zeros(f.size, dtype=self.dtype)
-        data['frequency'] = f
+        data['frequency_hz'] = f
         for key, val in kwargs.items():
             if key not in self.dtype.fields:
                 continue
-            if key == 'frequency':
+            if key == 'frequency_hz':
                 continue
             if not isinstance(val, np.ndarray):
                 val = np.array([val])
@@ -57,19 +124,41 @@ class SampleArray(JSONMixin):
         if mag is not None and dbFS is None:
             data['dbFS'] = dbmath.to_dB(mag)
 
-        self.append(data)
+        return self.append(data)
     def __getattr__(self, attr):
+        if attr == 'frequency':
+            return self['frequency']
         if attr in self.dtype.fields.keys():
             return self.data[attr]
         raise AttributeError
     def __setattr__(self, attr, val):
+        if attr == 'frequency':
+            self['frequency'] = val
+            return
         if attr in self.dtype.fields.keys():
+            self._make_writable()
             self.data[attr] = val
         super(SampleArray, self).__setattr__(attr, val)
     def __getitem__(self, key):
+        if isinstance(key, str) and key == 'frequency':
+            return self.data['frequency_hz'] / 1e6
         return self.data[key]
     def __setitem__(self, key, value):
+        if isinstance(key, str) and key == 'frequency':
+            key = 'frequency_hz'
+            value = mhz_to_hz(value)
+        self._make_writable()
         self.data[key] = value
+    def set_values(self, ix, **kwargs):
+        '''Sets fields of the item at index *ix*
+
+        The data is copied first if it's read-only (e.g. when it was
+        decoded from JSON).
+        '''
+        self._make_writable()
+        data = self.data
+        for key, val in kwargs.items():
+            data[key][ix] = val
     def __len__(self):
         return len(self.data)
     def __iter__(self):
@@ -80,42 +169,95 @@ class SampleArray(JSONMixin):
     @property
     def shape(self):
         return self.data.shape
+    def index_of(self, frequency):
+        '''Returns the index of *frequency* (in MHz) in the array or None if
+        not present
+        '''
+        return self.index_of_hz(mhz_to_hz(frequency))
+    def index_of_hz(self, frequency):
+        f = self.data['frequency_hz']
+        if self.keep_sorted:
+            ix = np.searchsorted(f, frequency)
+            if ix < f.size and f[ix] == frequency:
+                return int(ix)
+            return None
+        ix = np.flatnonzero(f == frequency)
+        if not ix.size:
+            return None
+        return int(ix[0])
     def _check_obj_type(self, other):
         if isinstance(other, SampleArray):
             data = other.data
         else:
-            if isinstance(other, np.ndarray) and other.dtype == self.dtype:
-                data = other
+            if isinstance(other, np.ndarray) and other.dtype.names:
+                data = self._coerce_data(other)
             else:
                 raise Exception('Cannot extend this object type: {}'.format(other))
         return data
     def append(self, other):
+        '''Adds *other* to the array and returns the ``(start, stop)`` index
+        range that changed
+        '''
         if self.keep_sorted:
-            self.insert_sorted(other)
-        else:
-            data = self._check_obj_type(other)
-            self.data = np.append(self.data, data)
+            return self.insert_sorted(other)
+        data = self._check_obj_type(other)
+        return self._extend(data)
+    def _extend(self, data):
+        size = self._size
+        self._grow(data.size)[size:] = data
+        return size, self._size
     def insert_sorted(self, other):
+        '''Merges *other* into the array, keeping it sorted by frequency
+
+        Values at frequencies that already exist are averaged in place.
+        Only the part of the array that overlaps *other* is searched, and
+        new items past the current end are appended without moving
+        anything, so merging hops in ascending order costs O(len(other)).
+
+        Returns the ``(start, stop)`` index range that changed. If items
+        were inserted before the end, everything after *start* moved so
+        *stop* is the new size.
+        '''
         data = self._check_obj_type(other)
-        in_ix_self = np.flatnonzero(np.in1d(self.frequency, data['frequency']))
-        in_ix_data = np.flatnonzero(np.in1d(data['frequency'], self.frequency))
-        if in_ix_self.size:
-            self.iq[in_ix_self] = np.mean([
-                self.iq[in_ix_self], data['iq'][in_ix_data]
-            ], axis=0)
-            self.magnitude[in_ix_self] = np.mean([
-                self.magnitude[in_ix_self], data['magnitude'][in_ix_data]
-            ], axis=0)
-            self.dbFS[in_ix_self] = np.mean([
-                self.dbFS[in_ix_self], data['dbFS'][in_ix_data]
-            ], axis=0)
-
-        nin_ix = np.flatnonzero(np.in1d(data['frequency'], self.frequency, invert=True))
-
-        if nin_ix.size:
-            d = np.append(self.data, data[nin_ix])
-            d = np.sort(d, order='frequency')
-            self.data = d
+        if not data.size:
+            return self._size, self._size
+        nf = data['frequency_hz']
+        if np.any(nf[1:] < nf[:-1]):
+            data = np.sort(data, order='frequency_hz')
+            nf = data['frequency_hz']
+        cur = self.data
+        f = cur['frequency_hz']
+        if not f.size or nf[0] > f[-1]:
+            return self._extend(data)
+        lo = np.searchsorted(f, nf[0], side='left')
+        hi = np.searchsorted(f, nf[-1], side='right')
+        pos = np.searchsorted(f[lo:hi], nf) + lo
+        matched = np.zeros(nf.size, dtype=bool)
+        in_range = pos < hi
+        matched[in_range] = f[pos[in_range]] == nf[in_range]
+        start = stop = self._size
+        if np.any(matched):
+            self._make_writable()
+            cur = self.data
+            ix_self = pos[matched]
+            for key in ['iq', 'magnitude', 'dbFS']:
+                v = cur[key]
+                v[ix_self] = (v[ix_self] + data[key][matched]) / 2
+            start = int(ix_self[0])
+            stop = int(ix_self[-1]) + 1
+        if np.all(matched):
+            return start, stop
+        unmatched = ~matched
+        new_data = data[unmatched]
+        if new_data['frequency_hz'][0] > f[-1]:
+            _, stop = self._extend(new_data)
+            return min(start, f.size), stop
+        # Shift only the tail after the first insertion point
+        ins = pos[unmatched]
+        ins_start = ins[0]
+        tail = np.insert(cur[ins_start:], ins - ins_start, new_data)
+        self._grow(new_data.size)[ins_start:] = tail
+        return min(start, int(ins_start)), self._size
     def smooth(self, window_size):
         x = self.magnitude
         w = np.hanning(window_size)
@@ -128,6 +270,7 @@ class SampleArray(JSONMixin):
         if m.size != x.size:
             raise Exception('Smooth result size {} != data size {}'.format(m.size, x.size))
 
+        self._make_writable()
         self.data['magnitude'] = m
         self.data['dbFS'] = dbmath.to_dB(m)
     def interpolate(self, spacing=0.025):
@@ -143,10 +286,66 @@ class SampleArray(JSONMixin):
 
         ys = cs(xs)
         data = np.zeros(xs.size, dtype=self.dtype)
-        data['frequency'] = xs
+        data['frequency_hz'] = mhz_to_hz(xs)
         data['magnitude'] = ys
         data['dbFS'] = dbmath.to_dB(ys)
         self.data = data
+    def to_compact(self):
+        '''Encodes the array for storage as a dict of smaller arrays
+
+        * ``frequency_axis``: ``[start_hz, step_hz, count]`` if the
+          frequencies are evenly spaced (otherwise ``frequency_hz``)
+        * ``dbFS``: int16 in units of :attr:`COMPACT_DB_SCALE` dB
+          (``NaN`` is stored as :attr:`COMPACT_DB_NAN`)
+        * ``iq``: only included if any values are nonzero
+
+        ``magnitude`` is rebuilt from ``dbFS`` by :meth:`from_compact`.
+        Levels are rounded to 0.01 dB, so the result round-trips exactly
+        once it has been through this encoding.
+        '''
+        data = self.data
+        f = data['frequency_hz']
+        d = {}
+        step = int(f[1] - f[0]) if f.size > 1 else 0
+        if f.size < 2 or (step > 0 and np.all(np.diff(f) == step)):
+            start = int(f[0]) if f.size else 0
+            d['frequency_axis'] = np.array([start, step, f.size], dtype=np.int64)
+        else:
+            d['frequency_hz'] = np.array(f, dtype=np.int64)
+        d['dbFS'] = self.quantize_dB(data['dbFS'])
+        if np.any(data['iq']):
+            d['iq'] = np.array(data['iq'])
+        return d
+    @classmethod
+    def quantize_dB(cls, dB):
+        '''Converts dB values to the int16 units used by :meth:`to_compact`
+        '''
+        limit = np.iinfo(np.int16).max
+        with np.errstate(invalid='ignore'):
+            q = np.clip(np.rint(np.asarray(dB) / cls.COMPACT_DB_SCALE), -limit, limit)
+        q[np.isnan(q)] = cls.COMPACT_DB_NAN
+        return q.astype(np.int16)
+    @classmethod
+    def from_compact(cls, d, keep_sorted=True):
+        '''Builds an instance from the output of :meth:`to_compact`
+        (a dict or an :class:`~numpy.lib.npyio.NpzFile`)
+        '''
+        q = np.asarray(d['dbFS'])
+        data = np.empty(q.size, dtype=cls.dtype)
+        if 'frequency_axis' in d:
+            start, step, count = (int(v) for v in d['frequency_axis'])
+            if count != q.size:
+                raise Exception('Frequency axis size {} != data size {}'.format(count, q.size))
+            data['frequency_hz'] = start + np.arange(count, dtype=np.int64) * step
+        else:
+            data['frequency_hz'] = d['frequency_hz']
+        data['iq'] = d['iq'] if 'iq' in d else 0
+        dB = q * cls.COMPACT_DB_SCALE
+        dB[q == cls.COMPACT_DB_NAN] = np.nan
+        data['dbFS'] = dB
+        # exp(x * ln(10) / 10) is dbmath.from_dB(x), but faster
+        data['magnitude'] = np.exp(dB * (np.log(10) / 10))
+        return cls(data, keep_sorted)
 
     def _serialize(self):
         return {'data':self.data, 'keep_sorted':self.keep_sorted}
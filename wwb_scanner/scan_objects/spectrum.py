@@ -1,6 +1,7 @@
 import threading
 import datetime
 import time
+from collections.abc import Mapping
 
 import numpy as np
 from scipy import signal
@@ -10,6 +11,7 @@ from wwb_scanner.utils import dbmath
 from wwb_scanner.utils.dbstore import db_store
 from wwb_scanner.utils.color import Color
 from wwb_scanner.scan_objects import SampleArray, Sample, TimeBasedSample
+from wwb_scanner.scan_objects.samplearray import mhz_to_hz
 try:
     from wwb_scanner import file_handlers
 except ImportError:
@@ -39,7 +41,151 @@ def get_spectrum_plot():
         SpectrumPlot = _SpectrumPlot
     return SpectrumPlot
 
+class SpectrumSamples(Mapping):
+    '''Read-only mapping of frequency to :class:`Sample` for a spectrum
+
+    Samples are created on access as views into :attr:`Spectrum.sample_data`,
+    so nothing is stored per frequency.
+    '''
+    __slots__ = ('spectrum',)
+    def __init__(self, spectrum):
+        self.spectrum = spectrum
+    def __getitem__(self, key):
+        spectrum = self.spectrum
+        if spectrum.sample_data.index_of(key) is None:
+            raise KeyError(key)
+        return spectrum._build_sample(spectrum=spectrum, init_complete=True, frequency=key)
+    def __contains__(self, key):
+        return self.spectrum.sample_data.index_of(key) is not None
+    def __len__(self):
+        return self.spectrum.sample_data.size
+    def __iter__(self):
+        return iter(self.spectrum.sample_data['frequency'].tolist())
+
+class SpectrumSnapshot(object):
+    '''Immutable copy of a spectrum's sample data as of :attr:`version`
+
+    Snapshots are published by :class:`Spectrum` and can be read from any
+    thread without holding :attr:`Spectrum.data_update_lock`.
+
+    The data is copied in chunks of :attr:`chunk_size` items. When a
+    *previous* snapshot is given, only the chunks overlapping the range
+    that changed since it are copied and the rest are shared with it.
+    :attr:`data` joins the chunks the first time it's accessed (outside
+    of the update lock). :meth:`get_range` only joins the chunks it needs.
+
+    attributes:
+        version: (int) the :attr:`Spectrum.version` the data was copied at
+        size: (int) number of items
+        chunks: (tuple) read-only arrays of at most :attr:`chunk_size` items
+        changes: (tuple) the most recent ``(version, start, stop)`` index
+            ranges recorded by :meth:`Spectrum.set_data_updated`
+        timestamp: (float) time the snapshot was taken
+    '''
+    __slots__ = ('version', 'size', 'chunks', 'changes', 'timestamp', '_data')
+    chunk_size = 4096
+    def __init__(self, version, data, changes=(), previous=None):
+        _set = super(SpectrumSnapshot, self).__setattr__
+        _set('version', version)
+        _set('size', data.size)
+        _set('changes', tuple(changes))
+        _set('timestamp', time.time())
+        _set('_data', None)
+        start, stop = 0, data.size
+        if previous is not None:
+            start, stop = self.changed_range(previous.version)
+        n = self.chunk_size
+        chunks = []
+        for chunk_start in range(0, data.size, n):
+            chunk_stop = min(chunk_start + n, data.size)
+            ix = chunk_start // n
+            if previous is not None and (chunk_stop <= start or chunk_start >= stop):
+                if ix < len(previous.chunks) and previous.chunks[ix].size == chunk_stop - chunk_start:
+                    chunks.append(previous.chunks[ix])
+                    continue
+            chunk = data[chunk_start:chunk_stop].copy()
+            chunk.flags.writeable = False
+            chunks.append(chunk)
+        _set('chunks', tuple(chunks))
+    def __setattr__(self, key, value):
+        raise AttributeError('SpectrumSnapshot is immutable')
+    def __len__(self):
+        return self.size
+    @property
+    def data(self):
+        '''Read-only array of all items
+        '''
+        data = self._data
+        if data is None:
+            chunks = self.chunks
+            if len(chunks) == 1:
+                data = chunks[0]
+            elif not chunks:
+                data = np.zeros(0, dtype=SampleArray.dtype)
+            else:
+                data = np.concatenate(chunks)
+            data.flags.writeable = False
+            super(SpectrumSnapshot, self).__setattr__('_data', data)
+        return data
+    def get_range(self, start, stop=None):
+        '''Returns the items from *start* to *stop* (a read-only array)
+        without joining any chunks outside of that range
+        '''
+        if stop is None or stop > self.size:
+            stop = self.size
+        if self._data is not None or start >= stop:
+            return self.data[start:stop]
+        n = self.chunk_size
+        first, last = start // n, (stop - 1) // n
+        if first == last:
+            return self.chunks[first][start - first * n:stop - first * n]
+        data = np.concatenate(self.chunks[first:last + 1])
+        data.flags.writeable = False
+        return data[start - first * n:stop - first * n]
+    @property
+    def frequency_hz(self):
+        return self.data['frequency_hz']
+    @property
+    def frequency(self):
+        return self.data['frequency_hz'] / 1e6
+    @property
+    def magnitude(self):
+        return self.data['magnitude']
+    @property
+    def dbFS(self):
+        return self.data['dbFS']
+    def changed_range(self, version):
+        '''Returns the ``(start, stop)`` index range that changed between
+        *version* and this snapshot
+
+        Indices before *start* are the same as they were at *version*. If
+        the changes since *version* are no longer recorded (or *version* is
+        None), the whole range is returned.
+        '''
+        size = self.size
+        if version == self.version:
+            return size, size
+        changes = self.changes
+        if version is None or not changes or version < changes[0][0] - 1:
+            return 0, size
+        start, stop = size, 0
+        for change_version, change_start, change_stop in changes:
+            if change_version <= version:
+                continue
+            if change_stop is None:
+                change_stop = size
+            start = min(start, change_start)
+            stop = max(stop, change_stop)
+        stop = min(stop, size)
+        if start >= stop:
+            return size, size
+        return start, stop
+
 class Spectrum(JSONMixin):
+    #: Number of change ranges kept for :meth:`SpectrumSnapshot.changed_range`
+    max_changes = 256
+    #: Default for the *lazy* argument of :meth:`from_dbstore`
+    lazy_dbstore_load = True
     _serialize_attrs = [
         'name', 'color', 'timestamp_utc', 'step_size',
         'center_frequencies', 'scan_config_eid',
@@ -72,10 +218,14 @@ class Spectrum(JSONMixin):
                 timestamp_utc = time.time()
             self.timestamp_utc = timestamp_utc
         self.step_size = kwargs.get('step_size')
-        self.data_updated = threading.Event()
+        self.version = 0
         self.data_update_lock = threading.RLock()
-        self.samples = {}
+        self.samples = SpectrumSamples(self)
+        self._sample_data_loader = None
         self.sample_data = SampleArray()
+        self._changes = ()
+        self._snapshot = SpectrumSnapshot(self.version, self.sample_data.data)
+        self._snapshot_requested = False
         self.center_frequencies = kwargs.get('center_frequencies', [])
     @property
     def datetime_utc(self):
@@ -105,6 +255,31 @@ class Spectrum(JSONMixin):
         if dt != self.datetime_utc:
             self.datetime_utc = dt
     @property
+    def sample_data(self):
+        if self._sample_data_loader is not None:
+            self._load_sample_data()
+        return self._sample_data
+    @sample_data.setter
+    def sample_data(self, value):
+        self._sample_data_loader = None
+        self._sample_data = value
+    @property
+    def sample_data_loaded(self):
+        '''False until the data of a lazily loaded spectrum has been read
+        (see :meth:`from_dbstore`)
+        '''
+        return self._sample_data_loader is None
+    def _load_sample_data(self):
+        with self.data_update_lock:
+            loader = self._sample_data_loader
+            if loader is None:
+                return
+            sample_data = loader()
+            self._sample_data_loader = None
+            if sample_data is not None:
+                self._sample_data = sample_data
+                self.set_data_updated()
+    @property
     def scan_config(self):
         return getattr(self, '_scan_config', None)
     @scan_config.setter
@@ -141,13 +316,9 @@ class Spectrum(JSONMixin):
         sample_data = kwargs.get('sample_data')
         samples = kwargs.get('samples')
         if sample_data is not None:
-            self.sample_data = sample_data
-            self.samples.clear()
-            skwargs = dict(spectrum=self, init_complete=True)
-            for f in sample_data.frequency:
-                skwargs['frequency'] = f
-                sample = self._build_sample(**skwargs)
-                self.samples[f] = sample
+            with self.data_update_lock:
+                self.sample_data = sample_data
+                self.set_data_updated()
         elif samples is not None:
             if isinstance(samples, dict):
                 for key, data in samples.items():
@@ -176,21 +347,15 @@ class Spectrum(JSONMixin):
             if N % 2 != 0:
                 N += 1
             self.sample_data.smooth(N)
-        self.set_data_updated()
+            self.set_data_updated()
     def interpolate(self, spacing=0.025):
         with self.data_update_lock:
             self.sample_data.interpolate(spacing)
-            self.samples.clear()
-            kwargs = {'spectrum':self, 'init_complete':True}
-            for freq in self.sample_data.frequency:
-                kwargs['frequency'] = freq
-                sample = self._build_sample(**kwargs)
-                self.samples[freq] = sample
             self.step_size = spacing
-        self.set_data_updated()
+            self.set_data_updated()
     def scale(self, min_dB, max_dB):
         with self.data_update_lock:
-            y = self.sample_data['dbFS']
+            y = self.sample_data['dbFS'].copy()
             ymin = y.min()
             ymax = y.max()
             y -= ymin
@@ -201,7 +366,7 @@ class Spectrum(JSONMixin):
             y += min_dB
             self.sample_data['magnitude'] = dbmath.from_dB(y)
             self.sample_data['dbFS'] = y
-        self.set_data_updated()
+            self.set_data_updated()
     def add_sample(self, **kwargs):
         f = kwargs.get('frequency')
         iq = kwargs.get('iq')
@@ -211,84 +376,159 @@ class Spectrum(JSONMixin):
         if kwargs.get('is_center_frequency') and f not in self.center_frequencies:
             self.center_frequencies.append(f)
         if f in self.samples:
-            sample = self.samples[f]
             if kwargs.get('force_magnitude'):
                 self.sample_data.set_fields(**kwargs)
-            return sample
-        if len(self.samples) and f < max(self.samples.keys()):
+            return self.samples[f]
+        freqs = self.sample_data['frequency_hz']
+        if freqs.size and mhz_to_hz(f) < freqs.max():
             if not kwargs.get('force_lower_freq', True):
                 return
         with self.data_update_lock:
-            if f not in self.sample_data['frequency']:
-                self.sample_data.set_fields(**kwargs)
-                skwargs = {'spectrum':self, 'init_complete':True, 'frequency':f}
-                sample = self._build_sample(**skwargs)
-                self.samples[f] = sample
-        self.set_data_updated()
+            changed = self.sample_data.set_fields(**kwargs)
+            sample = self._build_sample(spectrum=self, init_complete=True, frequency=f)
+            self.set_data_updated(*changed)
         return sample
     def add_sample_set(self, **kwargs):
         with self.data_update_lock:
-            self._add_sample_set(**kwargs)
-        self.set_data_updated()
+            changed = self._add_sample_set(**kwargs)
+            self.set_data_updated(*changed)
     def _add_sample_set(self, **kwargs):
+        '''Merges a sample set into :attr:`sample_data` and returns the
+        ``(start, stop)`` index range that changed
+        '''
         force_lower_freq = kwargs.get('force_lower_freq')
         a = SampleArray.create(**kwargs)
 
         sdata = self.sample_data
 
-        if not force_lower_freq and sdata['frequency'].size:
-            r_ix = np.flatnonzero(np.greater_equal(a['frequency'], [sdata['frequency'].max()]))
+        if not force_lower_freq and sdata.size:
+            r_ix = np.flatnonzero(np.greater_equal(a['frequency_hz'], sdata['frequency_hz'].max()))
             a = a[r_ix]
-        self.sample_data.insert_sorted(a)
-
-        skwargs = {'spectrum':self, 'init_complete':True}
-        for f in a['frequency']:
-            if f in self.samples:
-                continue
-            skwargs['frequency'] = f
-            sample = self._build_sample(**skwargs)
-            self.samples[f] = sample
+        return self.sample_data.insert_sorted(a)
     def _build_sample(self, **kwargs):
-        sample = Sample(**kwargs)
-        self.samples[sample.frequency] = sample
-        return sample
+        return Sample(**kwargs)
     def iter_frequencies(self):
-        for key in sorted(self.samples.keys()):
+        for key in (np.sort(self.sample_data['frequency_hz']) / 1e6).tolist():
             yield key
     def iter_samples(self):
         for key in self.iter_frequencies():
             yield self.samples[key]
     def on_sample_change(self, **kwargs):
         sample = kwargs.get('sample')
-        if sample.frequency not in self.samples:
+        ix = self.sample_data.index_of(sample.frequency)
+        if ix is None:
             return
-        self.set_data_updated()
-    def set_data_updated(self):
+        self.set_data_updated(ix, ix + 1)
+    @property
+    def snapshot(self):
+        '''The most recent :class:`SpectrumSnapshot`
+
+        This never waits on writers. If the published snapshot is older than
+        :attr:`version` a new one is taken when the lock is free, otherwise
+        the writer holding it publishes one when it's done and the previous
+        snapshot is returned in the meantime.
+        '''
+        if self._sample_data_loader is not None:
+            self._load_sample_data()
+        snapshot = self._snapshot
+        if snapshot.version == self.version:
+            return snapshot
+        self._snapshot_requested = True
+        lock = self.data_update_lock
+        if lock.acquire(blocking=False):
+            try:
+                snapshot = self._publish_snapshot()
+            finally:
+                lock.release()
+        return snapshot
+    def _publish_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot.version != self.version:
+            snapshot = SpectrumSnapshot(
+                self.version, self.sample_data.data, self._changes, previous=snapshot,
+            )
+            self._snapshot = snapshot
+        self._snapshot_requested = False
+        return snapshot
+    def set_data_updated(self, start=0, stop=None):
+        '''Increments :attr:`version` after a change to :attr:`sample_data`
+
+        *start* and *stop* are the index range that changed (if *stop* is
+        None, everything from *start* on). They're recorded so readers can
+        update only that part of their copy of the data.
+        '''
         with self.data_update_lock:
-            self.data_updated.set()
+            self.version += 1
+            changes = self._changes[-(self.max_changes - 1):]
+            self._changes = changes + ((self.version, start, stop),)
+            if self._snapshot_requested:
+                self._publish_snapshot()
     def save_to_dbstore(self):
         db_store.add_scan(self)
     def update_dbstore(self, *attrs):
+        '''Stores the given fields (or all of them) in the background.
+        Repeated updates are combined (see :class:`~wwb_scanner.utils.writebehind.ScanWriter`)
+        '''
         if self.eid is None:
             return
         if not len(attrs):
             attrs = self._serialize_attrs
         d = {attr:getattr(self, attr) for attr in attrs}
-        db_store.update_scan(self.eid, **d)
+        db_store.writer.update_scan(self.eid, **d)
     @classmethod
-    def from_dbstore(cls, dbdata=None, eid=None):
+    def from_dbstore(cls, dbdata=None, eid=None, lazy=None):
+        '''Loads a spectrum from the :class:`DBStore`
+
+        If *lazy* is True (the default for :class:`Spectrum`), only its
+        fields are read here. :attr:`sample_data` is read the first time
+        it's accessed, e.g. when the spectrum is plotted or exported.
+        '''
+        if lazy is None:
+            lazy = cls.lazy_dbstore_load
         if dbdata is None:
             assert eid is not None
-            dbdata = db_store.get_scan(eid)
+            if lazy:
+                dbdata = db_store.get_scan_attrs(eid)
+            else:
+                dbdata = db_store.get_scan(eid)
         else:
             eid = dbdata.eid
-        return cls.from_json(dbdata, eid=eid)
+            lazy = False
+        spectrum = cls.from_json(dbdata, eid=eid)
+        if lazy and 'samples' not in dbdata:
+            spectrum._sample_data_loader = lambda: db_store.get_scan_data(eid)
+        return spectrum
     def _serialize(self):
         d = {attr: getattr(self, attr) for attr in self._serialize_attrs}
         d['sample_data'] = self.sample_data
         return d
 
 class TimeBasedSpectrum(Spectrum):
+    # Samples are built from the data when it's deserialized
+    lazy_dbstore_load = False
+    def __init__(self, **kwargs):
+        super(TimeBasedSpectrum, self).__init__(**kwargs)
+        self.samples = {}
+    def _deserialize(self, **kwargs):
+        super(TimeBasedSpectrum, self)._deserialize(**kwargs)
+        sample_data = kwargs.get('sample_data')
+        if sample_data is not None:
+            self.samples.clear()
+            for f in sample_data.frequency:
+                self._build_sample(spectrum=self, init_complete=True, frequency=f)
+    def interpolate(self, spacing=0.025):
+        super(TimeBasedSpectrum, self).interpolate(spacing)
+        with self.data_update_lock:
+            self.samples.clear()
+            for f in self.sample_data.frequency:
+                self._build_sample(spectrum=self, init_complete=True, frequency=f)
+    def _add_sample_set(self, **kwargs):
+        start, stop = super(TimeBasedSpectrum, self)._add_sample_set(**kwargs)
+        for f in self.sample_data['frequency'][start:stop]:
+            if f in self.samples:
+                continue
+            self._build_sample(spectrum=self, init_complete=True, frequency=f)
+        return start, stop
     def _build_sample(self, **kwargs):
         sample = TimeBasedSample(**kwargs)
         if sample.frequency not in self.samples:
@@ -318,10 +558,12 @@ class TimeBasedSpectrum(Spectrum):
 
 def compare_spectra(spec1, spec2):
     diff_spec = Spectrum()
-    for sample in spec1.iter_samples():
-        other_sample = spec2.samples.get(sample.frequency)
-        if other_sample is None:
-            continue
-        magnitude = sample.magnitude - other_sample.magnitude
-        diff_spec.add_sample(frequency=sample.frequency, magnitude=magnitude)
+    data1 = spec1.sample_data
+    data2 = spec2.sample_data
+    freqs, ix1, ix2 = np.intersect1d(
+        data1['frequency_hz'], data2['frequency_hz'], assume_unique=True, return_indices=True,
+    )
+    if freqs.size:
+        magnitude = data1['magnitude'][ix1] - data2['magnitude'][ix2]
+        diff_spec.add_sample_set(frequency_hz=freqs, magnitude=magnitude)
     return diff_spec
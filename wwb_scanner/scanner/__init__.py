@@ -1,3 +1,5 @@
 from . import sample_processing
 from .main import Scanner
+from .multi import MultiScanner
 from .rtlpower_scan import RtlPowerScanner
+from .replay import ReplayScanner
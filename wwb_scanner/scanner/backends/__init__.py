@@ -0,0 +1,17 @@
+from .base import SampleSource
+from .rtl import RtlSdrSource, RtlSdrTcpSource
+from .synthetic import SyntheticSource
+
+BACKENDS = {
+    'rtlsdr':RtlSdrSource,
+    'rtl_tcp':RtlSdrTcpSource,
+    'synthetic':SyntheticSource,
+}
+
+def get_source_class(device_config):
+    if device_config.get('is_remote'):
+        return RtlSdrTcpSource
+    name = device_config.get('backend')
+    if name is None:
+        name = 'rtlsdr'
+    return BACKENDS[name]
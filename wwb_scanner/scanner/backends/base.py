@@ -0,0 +1,94 @@
+import numpy as np
+
+DEFAULT_READ_SIZE = 1024
+
+def packed_bytes_to_iq(values):
+    # Same conversion used by pyrtlsdr's ``packed_bytes_to_iq``
+    data = np.frombuffer(values, dtype=np.uint8)
+    iq = data.astype(np.float64).view(np.complex128)
+    iq /= 127.5
+    iq -= (1 + 1j)
+    return iq
+
+class SampleSource(object):
+    '''Base class for devices that provide IQ samples to the scanner
+
+    The interface mirrors the subset of :class:`rtlsdr.RtlSdr` used by the
+    scanner so an instance can be used wherever ``scanner.sdr`` is expected.
+    Subclasses must implement :meth:`open`, :meth:`close`,
+    :meth:`set_center_freq`, :meth:`read_bytes` and :meth:`read_bytes_async`.
+    '''
+    def __init__(self, **kwargs):
+        self.serial_number = kwargs.get('serial_number')
+        self.device_opened = False
+        self.read_async_canceling = False
+    @classmethod
+    def from_device_config(cls, device_config, **kwargs):
+        options = device_config.get('backend_options') or {}
+        kwargs.setdefault('serial_number', device_config.get('serial_number'))
+        for key, val in options.items():
+            kwargs.setdefault(key, val)
+        return cls(**kwargs)
+    def open(self):
+        raise NotImplementedError('method must be implemented by subclasses')
+    def close(self):
+        raise NotImplementedError('method must be implemented by subclasses')
+    def get_sample_rate(self):
+        raise NotImplementedError('method must be implemented by subclasses')
+    def set_sample_rate(self, value):
+        raise NotImplementedError('method must be implemented by subclasses')
+    @property
+    def sample_rate(self):
+        return self.get_sample_rate()
+    @sample_rate.setter
+    def sample_rate(self, value):
+        self.set_sample_rate(value)
+    def get_gain(self):
+        raise NotImplementedError('method must be implemented by subclasses')
+    def set_gain(self, value):
+        raise NotImplementedError('method must be implemented by subclasses')
+    @property
+    def gain(self):
+        return self.get_gain()
+    @gain.setter
+    def gain(self, value):
+        self.set_gain(value)
+    def get_gains(self):
+        '''Available gain values in tenths of a dB (as reported by librtlsdr)
+        '''
+        return None
+    def get_freq_correction(self):
+        return 0
+    def set_freq_correction(self, value):
+        pass
+    @property
+    def freq_correction(self):
+        return self.get_freq_correction()
+    @freq_correction.setter
+    def freq_correction(self, value):
+        self.set_freq_correction(value)
+    def get_center_freq(self):
+        raise NotImplementedError('method must be implemented by subclasses')
+    def set_center_freq(self, value):
+        raise NotImplementedError('method must be implemented by subclasses')
+    @property
+    def center_freq(self):
+        return self.get_center_freq()
+    @center_freq.setter
+    def center_freq(self, value):
+        self.set_center_freq(value)
+    def read_bytes(self, num_bytes=DEFAULT_READ_SIZE):
+        raise NotImplementedError('method must be implemented by subclasses')
+    def read_samples(self, num_samples=DEFAULT_READ_SIZE):
+        return packed_bytes_to_iq(self.read_bytes(2 * num_samples))
+    def read_bytes_async(self, callback, num_bytes=DEFAULT_READ_SIZE, context=None):
+        '''Continuously call ``callback(values, context)`` with raw uint8 IQ
+        buffers until :meth:`cancel_read_async` is called
+        '''
+        raise NotImplementedError('method must be implemented by subclasses')
+    def read_samples_async(self, callback, num_samples=DEFAULT_READ_SIZE, context=None):
+        def on_bytes(values, _context):
+            callback(packed_bytes_to_iq(values), _context)
+        self.read_bytes_async(on_bytes, 2 * num_samples, context)
+    def cancel_read_async(self):
+        self.read_async_canceling = True
@@ -0,0 +1,101 @@
+try:
+    from rtlsdr import RtlSdr
+except ImportError:
+    RtlSdr = None
+try:
+    from rtlsdr import RtlSdrTcpClient
+except ImportError:
+    RtlSdrTcpClient = None
+
+from wwb_scanner.scanner.backends.base import SampleSource, DEFAULT_READ_SIZE
+
+class RtlSdrSource(SampleSource):
+    '''Sample source backed by a local device through :mod:`rtlsdr`
+    '''
+    def __init__(self, **kwargs):
+        super(RtlSdrSource, self).__init__(**kwargs)
+        self.sdr = None
+    def _build_sdr(self):
+        if RtlSdr is None:
+            raise IOError('librtlsdr not available')
+        return RtlSdr(serial_number=self.serial_number)
+    def open(self):
+        self.sdr = self._build_sdr()
+        self.device_opened = True
+    def close(self):
+        sdr = self.sdr
+        self.sdr = None
+        self.device_opened = False
+        if sdr is not None:
+            sdr.close()
+    @property
+    def device_opened(self):
+        sdr = getattr(self, 'sdr', None)
+        if sdr is None:
+            return False
+        return sdr.device_opened
+    @device_opened.setter
+    def device_opened(self, value):
+        pass
+    @property
+    def read_async_canceling(self):
+        sdr = getattr(self, 'sdr', None)
+        if sdr is None:
+            return False
+        return sdr.read_async_canceling
+    @read_async_canceling.setter
+    def read_async_canceling(self, value):
+        pass
+    def get_sample_rate(self):
+        return self.sdr.get_sample_rate()
+    def set_sample_rate(self, value):
+        self.sdr.set_sample_rate(value)
+    def get_gain(self):
+        return self.sdr.get_gain()
+    def set_gain(self, value):
+        self.sdr.set_gain(value)
+    def get_gains(self):
+        return self.sdr.get_gains()
+    def get_freq_correction(self):
+        return self.sdr.get_freq_correction()
+    def set_freq_correction(self, value):
+        self.sdr.set_freq_correction(value)
+    def get_center_freq(self):
+        return self.sdr.get_center_freq()
+    def set_center_freq(self, value):
+        self.sdr.set_center_freq(value)
+    def read_bytes(self, num_bytes=DEFAULT_READ_SIZE):
+        return self.sdr.read_bytes(num_bytes)
+    def read_samples(self, num_samples=DEFAULT_READ_SIZE):
+        return self.sdr.read_samples(num_samples)
+    def read_bytes_async(self, callback, num_bytes=DEFAULT_READ_SIZE, context=None):
+        self.sdr.read_bytes_async(callback, num_bytes=num_bytes, context=context)
+    def read_samples_async(self, callback, num_samples=DEFAULT_READ_SIZE, context=None):
+        self.sdr.read_samples_async(callback, num_samples=num_samples, context=context)
+    def cancel_read_async(self):
+        self.sdr.cancel_read_async()
+
+class RtlSdrTcpSource(RtlSdrSource):
+    '''Sample source backed by an ``rtl_tcp`` compatible server
+    '''
+    def __init__(self, **kwargs):
+        super(RtlSdrTcpSource, self).__init__(**kwargs)
+        self.hostname = kwargs.get('hostname', '127.0.0.1')
+        self.port = kwargs.get('port', 1235)
+    @classmethod
+    def from_device_config(cls, device_config, **kwargs):
+        kwargs.setdefault('hostname', device_config.get('remote_hostname'))
+        kwargs.setdefault('port', device_config.get('remote_port'))
+        return super(RtlSdrTcpSource, cls).from_device_config(device_config, **kwargs)
+    def _build_sdr(self):
+        if RtlSdrTcpClient is None:
+            raise Exception('Tcp client not available')
+        sdr = RtlSdrTcpClient(hostname=self.hostname, port=self.port)
+        sdr.get_sample_rate()
+        return sdr
+    @property
+    def device_opened(self):
+        return getattr(self, 'sdr', None) is not None
+    @device_opened.setter
+    def device_opened(self, value):
+        pass
@@ -0,0 +1,146 @@
+import time
+
+import numpy as np
+
+from wwb_scanner.utils import dbmath
+from wwb_scanner.scanner.backends.base import SampleSource, DEFAULT_READ_SIZE
+
+# Gain steps of the R820T tuner (in tenths of a dB)
+R820T_GAINS = [
+    0, 9, 14, 27, 37, 77, 87, 125, 144, 157, 166, 197, 207, 229, 254,
+    280, 297, 328, 338, 364, 372, 386, 402, 421, 434, 439, 445, 480, 496,
+]
+
+class SyntheticSource(SampleSource):
+    '''Generates IQ samples for a simulated RF environment
+
+    All levels are in dBFS as seen at the output of the device, so they are
+    not affected by the gain setting.
+
+    params:
+        carriers: (list) dicts with ``frequency`` (Hz) and ``level`` (dBFS)
+            for narrow band carriers (e.g. wireless mics)
+        tv_channels: (list) dicts with ``frequency`` (center, Hz),
+            ``bandwidth`` (Hz, default 6e6) and ``level`` (total power in dBFS)
+            for wideband blocks
+        noise_floor: (float) noise power in dBFS (default -45)
+        seed: seed for the random number generator
+        realtime: (bool) if True (the default), buffers are delivered at the
+            pace of the USB timing model below. If False, they are generated
+            as fast as possible
+        usb_transfer_rate: (float) bytes per second delivered by the device
+            (defaults to the sample rate's wire rate of 2 bytes per sample)
+        usb_latency: (float) extra seconds per USB transfer
+        retune_time: (float) seconds for :meth:`set_center_freq` to settle
+    '''
+    def __init__(self, **kwargs):
+        super(SyntheticSource, self).__init__(**kwargs)
+        self.carriers = list(kwargs.get('carriers') or [])
+        self.tv_channels = list(kwargs.get('tv_channels') or [])
+        self.noise_floor = kwargs.get('noise_floor', -45.)
+        self.seed = kwargs.get('seed')
+        self.realtime = kwargs.get('realtime', True)
+        self.usb_transfer_rate = kwargs.get('usb_transfer_rate')
+        self.usb_latency = kwargs.get('usb_latency', .0005)
+        self.retune_time = kwargs.get('retune_time', .01)
+        self._sample_rate = kwargs.get('sample_rate', 2.048e6)
+        self._gain = kwargs.get('gain', 0.)
+        self._freq_correction = 0
+        self._center_freq = kwargs.get('center_freq', 100e6)
+        self._sample_index = 0
+        self.random_state = np.random.RandomState(self.seed)
+    def open(self):
+        self.device_opened = True
+    def close(self):
+        self.device_opened = False
+    def get_sample_rate(self):
+        return self._sample_rate
+    def set_sample_rate(self, value):
+        self._sample_rate = float(value)
+    def get_gain(self):
+        return self._gain
+    def set_gain(self, value):
+        self._gain = value
+    def get_gains(self):
+        return list(R820T_GAINS)
+    def get_freq_correction(self):
+        return self._freq_correction
+    def set_freq_correction(self, value):
+        self._freq_correction = value
+    def get_center_freq(self):
+        return self._center_freq
+    def set_center_freq(self, value):
+        self._center_freq = float(value)
+        if self.realtime and self.retune_time:
+            time.sleep(self.retune_time)
+    def _complex_noise(self, num_samples, power):
+        rng = self.random_state
+        scale = np.sqrt(power / 2.)
+        noise = np.empty(num_samples, dtype=np.complex128)
+        noise.real = rng.standard_normal(num_samples)
+        noise.imag = rng.standard_normal(num_samples)
+        noise *= scale
+        return noise
+    def generate_samples(self, num_samples):
+        rs = self.sample_rate
+        fc = self.center_freq
+        n0 = self._sample_index
+        self._sample_index += num_samples
+
+        iq = self._complex_noise(num_samples, dbmath.from_dB(self.noise_floor))
+
+        t = (np.arange(num_samples) + n0) / rs
+        for carrier in self.carriers:
+            offset = carrier['frequency'] - fc
+            if abs(offset) >= rs / 2.:
+                continue
+            amplitude = dbmath.dB_to_amplitude(carrier['level'])
+            iq += amplitude * np.exp(2j * np.pi * offset * t)
+
+        if len(self.tv_channels):
+            bin_freqs = np.fft.fftfreq(num_samples, 1. / rs) + fc
+            for channel in self.tv_channels:
+                bw = channel.get('bandwidth', 6e6)
+                f_lo = channel['frequency'] - bw / 2.
+                f_hi = channel['frequency'] + bw / 2.
+                mask = (bin_freqs >= f_lo) & (bin_freqs < f_hi)
+                if not np.any(mask):
+                    continue
+                # White noise whose density matches the channel's, then
+                # keep only the bins that fall inside the channel
+                power = dbmath.from_dB(channel['level']) * rs / bw
+                X = np.fft.fft(self._complex_noise(num_samples, power))
+                X[~mask] = 0
+                iq += np.fft.ifft(X)
+        return iq
+    def read_bytes(self, num_bytes=DEFAULT_READ_SIZE):
+        iq = self.generate_samples(num_bytes // 2)
+        values = np.empty(iq.size * 2, dtype=np.float64)
+        values[0::2] = iq.real
+        values[1::2] = iq.imag
+        values += 1
+        values *= 127.5
+        np.rint(values, out=values)
+        np.clip(values, 0, 255, out=values)
+        return values.astype(np.uint8)
+    def read_bytes_async(self, callback, num_bytes=DEFAULT_READ_SIZE, context=None):
+        if context is None:
+            context = self
+        num_bytes = int(num_bytes)
+        transfer_rate = self.usb_transfer_rate
+        if transfer_rate is None:
+            transfer_rate = self.sample_rate * 2
+        transfer_time = num_bytes / transfer_rate + self.usb_latency
+        self.read_async_canceling = False
+        next_ts = time.perf_counter()
+        while not self.read_async_canceling:
+            values = self.read_bytes(num_bytes)
+            if self.realtime:
+                next_ts += transfer_time
+                wait = next_ts - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            if self.read_async_canceling:
+                break
+            callback(values, context)
+        self.read_async_canceling = False
@@ -0,0 +1,136 @@
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+from scipy.signal import get_window
+
+from wwb_scanner.scanner.main import Scanner
+from wwb_scanner.scanner.config import ScanConfig
+from wwb_scanner.scanner.plan import ScanPlan
+from wwb_scanner.scan_objects import Spectrum
+
+DEFAULT_SCENE = dict(
+    carriers=[
+        {'frequency':472.125e6, 'level':-20.},
+        {'frequency':518.4e6, 'level':-35.},
+        {'frequency':554.9e6, 'level':-25.},
+        {'frequency':601.55e6, 'level':-40.},
+        {'frequency':648.3e6, 'level':-30.},
+    ],
+    tv_channels=[
+        {'frequency':503e6, 'level':-30.},
+        {'frequency':587e6, 'level':-25.},
+        {'frequency':671e6, 'level':-35.},
+    ],
+    noise_floor=-45.,
+)
+
+def build_config(scan_range=(470., 700.), realtime=True, seed=1, **kwargs):
+    config = ScanConfig(scan_range=list(scan_range))
+    config.device.backend = 'synthetic'
+    options = dict(DEFAULT_SCENE)
+    options.update(kwargs.pop('backend_options', {}))
+    options['realtime'] = realtime
+    options['seed'] = seed
+    config.device.backend_options = options
+    config.sampling.window_size = kwargs.pop('window_size', 128)
+    config.sampling.update(kwargs)
+    return config
+
+def benchmark_scan(config=None, trace_memory=True, **kwargs):
+    '''Runs a full scan using the synthetic backend and returns its throughput
+
+    The returned dict contains the number of hops, wall-clock and CPU time,
+    ``hops_per_second``, ``cpu_per_hop`` (seconds), ``peak_memory``
+    (bytes allocated through Python/numpy, if *trace_memory* is set) and the
+    :class:`~wwb_scanner.scanner.progress.ScanProgress` of the scan as
+    ``progress``.
+    '''
+    if config is None:
+        config = build_config(**kwargs)
+    scanner = Scanner(config=config, autosave=False)
+    if trace_memory:
+        tracemalloc.start()
+    start_ts = time.perf_counter()
+    start_cpu = time.process_time()
+    scanner.run_scan()
+    elapsed = time.perf_counter() - start_ts
+    cpu_time = time.process_time() - start_cpu
+    peak_memory = None
+    if trace_memory:
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    num_hops = scanner.sample_collection.num_processed
+    return dict(
+        num_hops=num_hops,
+        elapsed=elapsed,
+        cpu_time=cpu_time,
+        hops_per_second=num_hops / elapsed,
+        cpu_per_hop=cpu_time / num_hops,
+        peak_memory=peak_memory,
+        progress=scanner.scan_progress,
+        spectrum=scanner.spectrum,
+    )
+
+def benchmark_merge(num_hops=2000, window_size=128, sample_rate=2.048e6, reserve=False):
+    '''Times :meth:`Spectrum.add_sample_set` for each hop of a simulated scan
+
+    Returns an array of the seconds spent merging each hop, which should
+    stay flat as the spectrum grows.
+    '''
+    plan = ScanPlan(
+        scan_range=[470., 470. + num_hops], sample_rate=sample_rate,
+        window=get_window('hann', window_size),
+    )
+    hop_centers = plan.hop_centers[:num_hops]
+    spectrum = Spectrum()
+    if reserve:
+        spectrum.sample_data.reserve(plan.num_bins)
+    rng = np.random.RandomState(0)
+    magnitudes = rng.uniform(1e-9, 1e-6, (hop_centers.size, plan.nfft))
+    times = np.zeros(hop_centers.size)
+    for i, fc in enumerate(hop_centers):
+        freqs = plan.hop_frequencies(fc)
+        start_ts = time.perf_counter()
+        spectrum.add_sample_set(
+            frequency_hz=freqs, magnitude=magnitudes[i], force_lower_freq=True,
+        )
+        times[i] = time.perf_counter() - start_ts
+    return times
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='Benchmark a scan using simulated devices')
+    p.add_argument('--start', type=float, default=470.)
+    p.add_argument('--end', type=float, default=700.)
+    p.add_argument('--no-realtime', dest='realtime', action='store_false',
+        help='Generate samples as fast as possible instead of at the USB rate')
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--no-trace-memory', dest='trace_memory', action='store_false')
+    p.add_argument('--merge', type=int, metavar='NUM_HOPS',
+        help='Only benchmark merging NUM_HOPS simulated hops into a spectrum')
+    args = p.parse_args(argv)
+    if args.merge:
+        times = benchmark_merge(args.merge)
+        n = max(times.size // 10, 1)
+        print('merge per hop (first {n}): {:.1f}us'.format(np.median(times[:n]) * 1e6, n=n))
+        print('merge per hop (last {n}): {:.1f}us'.format(np.median(times[-n:]) * 1e6, n=n))
+        return
+    result = benchmark_scan(
+        scan_range=(args.start, args.end), realtime=args.realtime, seed=args.seed,
+        trace_memory=args.trace_memory,
+    )
+    print('hops: {num_hops}'.format(**result))
+    print('elapsed: {elapsed:.3f}s, cpu: {cpu_time:.3f}s'.format(**result))
+    print('hops/s: {hops_per_second:.2f}'.format(**result))
+    print('cpu per hop: {:.2f}ms'.format(result['cpu_per_hop'] * 1000))
+    progress = result['progress']
+    print('tune/read/dsp per hop: {:.2f}/{:.2f}/{:.2f}ms'.format(
+        progress.mean_tune_time * 1000, progress.mean_read_time * 1000,
+        progress.mean_dsp_time * 1000,
+    ))
+    if result['peak_memory'] is not None:
+        print('peak memory: {:.1f}MB'.format(result['peak_memory'] / 1e6))
+
+if __name__ == '__main__':
+    main()
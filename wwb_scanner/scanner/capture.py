@@ -0,0 +1,181 @@
+import os
+import time
+import threading
+
+import numpy as np
+
+HOP_MAGIC = b'WWBH'
+
+HOP_HEADER_DTYPE = np.dtype([
+    ('magic', 'S4'),
+    ('header_size', '<u4'),
+    ('center_frequency', '<i8'),
+    ('sample_rate', '<f8'),
+    ('gain', '<f8'),
+    ('timestamp', '<f8'),
+    ('offset', '<i8'),
+    ('num_sweeps', '<u4'),
+    ('samples_per_sweep', '<u4'),
+    ('sample_dtype', 'S8'),
+])
+
+# Hop data always starts on a multiple of this
+DATA_ALIGNMENT = 64
+
+def _align(value, alignment=DATA_ALIGNMENT):
+    return -(-value // alignment) * alignment
+
+HEADER_SIZE = _align(HOP_HEADER_DTYPE.itemsize)
+
+class RawCaptureWriter(object):
+    '''Append-only, memory-mapped container for the raw IQ of each hop
+
+    Each hop is stored as a fixed size header (:data:`HOP_HEADER_DTYPE`)
+    followed by its samples. :meth:`allocate_hop` reserves the space for a
+    hop and returns a writable array mapped directly onto the file, so the
+    samples are written to the page cache as they arrive from the device
+    and flushed by the OS in the background.
+
+    The file is grown in chunks of *chunk_size* bytes and truncated to the
+    used size on :meth:`close`.
+    '''
+    def __init__(self, filename, chunk_size=64 * 1024 * 1024):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        dirname = os.path.dirname(os.path.abspath(filename))
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        if os.path.exists(filename):
+            self.fileobj = open(filename, 'r+b')
+            self.size = os.path.getsize(filename)
+        else:
+            self.fileobj = open(filename, 'w+b')
+            self.size = 0
+        self.capacity = self.size
+        self.num_hops = 0
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+    @property
+    def closed(self):
+        return self.fileobj is None
+    def _reserve(self, nbytes):
+        with self.lock:
+            offset = self.size
+            end = offset + nbytes
+            if end > self.capacity:
+                capacity = max(end, self.capacity + self.chunk_size)
+                self.fileobj.truncate(capacity)
+                self.capacity = capacity
+            self.size = end
+            self.num_hops += 1
+        return offset
+    def allocate_hop(self, center_frequency, sample_rate, gain, shape, dtype, timestamp=None):
+        '''Reserves space for a hop and returns ``(header, data)``
+
+        *data* is a writable array of the given *shape* and *dtype* mapped
+        onto the file. *header* is the mapped header record.
+        '''
+        if self.closed:
+            raise ValueError('Capture file is closed')
+        dtype = np.dtype(dtype)
+        num_sweeps, samples_per_sweep = shape
+        nbytes = num_sweeps * samples_per_sweep * dtype.itemsize
+        offset = self._reserve(HEADER_SIZE + _align(nbytes))
+        data_offset = offset + HEADER_SIZE
+        m = np.memmap(
+            self.fileobj, dtype=np.uint8, mode='r+', offset=offset,
+            shape=(HEADER_SIZE + nbytes,),
+        )
+        header = m[:HOP_HEADER_DTYPE.itemsize].view(HOP_HEADER_DTYPE)[0]
+        if timestamp is None:
+            timestamp = time.time()
+        header['magic'] = HOP_MAGIC
+        header['header_size'] = HEADER_SIZE
+        header['center_frequency'] = int(round(center_frequency))
+        header['sample_rate'] = sample_rate
+        header['gain'] = gain if gain is not None else np.nan
+        header['timestamp'] = timestamp
+        header['offset'] = data_offset
+        header['num_sweeps'] = num_sweeps
+        header['samples_per_sweep'] = samples_per_sweep
+        header['sample_dtype'] = dtype.str.encode()
+        data = m[HEADER_SIZE:].view(dtype).reshape(shape)
+        return header, data
+    def flush(self):
+        if not self.closed:
+            self.fileobj.flush()
+    def close(self):
+        if self.closed:
+            return
+        with self.lock:
+            self.fileobj.truncate(self.size)
+            self.fileobj.close()
+            self.fileobj = None
+
+class RawCaptureReader(object):
+    '''Reads hops written by :class:`RawCaptureWriter`
+
+    Samples are returned as read-only views into a memory map of the file.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        if os.path.getsize(filename):
+            self.mmap = np.memmap(filename, dtype=np.uint8, mode='r')
+        else:
+            self.mmap = np.zeros(0, dtype=np.uint8)
+        self.headers = self._read_headers()
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+    def close(self):
+        '''Unmaps the file. :attr:`headers` can still be used
+        '''
+        self.mmap = None
+    @property
+    def closed(self):
+        return self.mmap is None
+    def _read_headers(self):
+        m = self.mmap
+        headers = []
+        offset = 0
+        header_itemsize = HOP_HEADER_DTYPE.itemsize
+        while offset + header_itemsize <= m.size:
+            header = m[offset:offset+header_itemsize].view(HOP_HEADER_DTYPE)[0]
+            if header['magic'] == b'':
+                # Unused space preallocated by a writer that is still open
+                break
+            if header['magic'] != HOP_MAGIC:
+                raise ValueError('Invalid hop header at offset {}'.format(offset))
+            nbytes = self._data_nbytes(header)
+            if header['offset'] + nbytes > m.size:
+                # Incomplete hop at the end of an interrupted capture
+                break
+            headers.append(header)
+            offset = int(header['offset']) + _align(nbytes)
+        return np.array(headers, dtype=HOP_HEADER_DTYPE)
+    def _data_nbytes(self, header):
+        dtype = np.dtype(header['sample_dtype'].decode())
+        return int(header['num_sweeps']) * int(header['samples_per_sweep']) * dtype.itemsize
+    def __len__(self):
+        return self.headers.size
+    def __getitem__(self, ix):
+        header = self.headers[ix]
+        return header, self.get_samples(header)
+    def __iter__(self):
+        for ix in range(len(self)):
+            yield self[ix]
+    def get_samples(self, header):
+        if self.closed:
+            raise ValueError('I/O operation on closed capture')
+        dtype = np.dtype(header['sample_dtype'].decode())
+        offset = int(header['offset'])
+        nbytes = self._data_nbytes(header)
+        shape = (int(header['num_sweeps']), int(header['samples_per_sweep']))
+        return self.mmap[offset:offset+nbytes].view(dtype).reshape(shape)
+    @property
+    def center_frequencies(self):
+        return self.headers['center_frequency']
@@ -4,6 +4,7 @@ class ScanConfig(Config):
     DEFAULTS = dict(
         scan_range=[400., 900.],
         save_raw_values=False,
+        raw_values_path=None,
     )
     def __init__(self, initdict=None, **kwargs):
         kwargs.setdefault('_child_conf_keys', ['device', 'sampling', 'processing'])
@@ -26,6 +27,8 @@ class ScanConfig(Config):
 class DeviceConfig(Config):
     DEFAULTS = dict(
         serial_number=None,
+        backend='rtlsdr',
+        backend_options=None,
         gain=30.,
         freq_correction=0,
         is_remote=False,
@@ -42,6 +45,11 @@ class SamplingConfig(Config):
         window_size=None,
         fft_size=1024,
         window_type='boxcar',
+        window_overlap=.5,
+        accumulate_sweeps=False,
+        single_precision=False,
+        pipeline_processing=True,
+        processing_queue_size=4,
         rtl_bin_size=0.025,
         rtl_crop=50,
         rtl_fir_size=4,
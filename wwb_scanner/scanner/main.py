@@ -1,3 +1,4 @@
+import time
 import threading
 
 import numpy as np
@@ -6,39 +7,34 @@ import logging
 logger = logging.getLogger(__name__)
 
 from wwb_scanner.core import JSONMixin
+from wwb_scanner.utils import dbmath
 from wwb_scanner.utils.dbstore import db_store
 from wwb_scanner.scanner.sdrwrapper import SdrWrapper
 from wwb_scanner.scanner.config import ScanConfig
+from wwb_scanner.scanner.progress import ScanProgress
+from wwb_scanner.scanner.plan import (
+    ScanPlan,
+    mhz_to_hz,
+    hz_to_mhz,
+    calc_relative_freqs,
+    calc_freq_resolution,
+    check_equal_spacing,
+    calc_step_size,
+)
 from wwb_scanner.scanner.sample_processing import (
     SampleCollection,
     calc_num_samples,
     WINDOW_TYPES,
 )
-from wwb_scanner.scan_objects import Spectrum
-
-def mhz_to_hz(mhz):
-    return mhz * 1000000.0
-def hz_to_mhz(hz):
-    return hz / 1000000.0
+from wwb_scanner.scan_objects import Spectrum, SpectrumHistory
 
 def get_freq_resolution(nfft, fs):
-    freqs = np.fft.fftfreq(nfft, 1/fs)
-    freqs = np.fft.fftshift(freqs)
-    r = np.unique(np.diff(np.around(freqs)))
-    if r.size != 1:
-        logger.error(f'!!! Not unique: {r}')
-        return r.mean()
-    return r[0]
+    rel_freqs, _ = calc_relative_freqs(fs, nfft)
+    return calc_freq_resolution(rel_freqs)
 
 def is_equal_spacing(nfft, fs, step_size):
-    freqs = np.fft.fftfreq(nfft, 1/fs)
-    freqs = np.fft.fftshift(freqs)
-
-    freqs2 = freqs + step_size
-    all_freqs = np.unique(np.around(np.append(freqs, freqs2)))
-    diff = np.unique(np.diff(np.around(all_freqs)))
-    logger.debug(f'freq spacing diff={diff}')
-    return diff.size == 1
+    rel_freqs, _ = calc_relative_freqs(fs, nfft)
+    return check_equal_spacing(rel_freqs, np.around(step_size))
 
 class StopScanner(Exception):
     pass
@@ -49,7 +45,9 @@ class ScannerBase(JSONMixin):
         self._running = threading.Event()
         self._stopped = threading.Event()
         self._current_freq = None
-        self._progress = 0.
+        self.scan_progress = ScanProgress()
+        self.autosave = kwargs.get('autosave', True)
+        self.write_behind = kwargs.get('write_behind', True)
         ckwargs = kwargs.get('config')
         if not ckwargs:
             ckwargs = db_store.get_scan_config()
@@ -79,28 +77,64 @@ class ScannerBase(JSONMixin):
         pass
     @property
     def progress(self):
-        return self._progress
+        return self.scan_progress.fraction
     @progress.setter
     def progress(self, value):
-        if value == self._progress:
+        if value == self.scan_progress.fraction:
             return
-        self._progress = value
-        self.on_progress(value)
-    def on_progress(self, value):
+        self.scan_progress.fraction = value
+        self.on_progress(self.scan_progress)
+    def on_progress(self, progress):
+        '''Called with :attr:`scan_progress` (a :class:`ScanProgress`) each
+        time the scan advances
+
+        This runs on the scanning thread and the object keeps changing, so
+        use :meth:`ScanProgress.copy` to hand it to another thread.
+        '''
+        pass
+    @property
+    def hops_per_second(self):
+        return self.scan_progress.hops_per_second
+    def on_spectrum_updated(self, version):
+        '''Called with the new :attr:`Spectrum.version` each time a hop is
+        merged into :attr:`spectrum`
+
+        This runs on whichever thread merged the hop, so implementations
+        should only hand the notification off (e.g. emit a queued signal).
+        '''
         pass
-    def build_sample_sets(self):
-        freq,  end_freq = self.config.scan_range
-        sample_collection = self.sample_collection
-        while freq <= end_freq:
-            sample_set = sample_collection.build_sample_set(mhz_to_hz(freq))
-            freq += self.step_size
+    @property
+    def plan(self):
+        '''The :class:`ScanPlan` for :attr:`config`
+
+        It's built when first used and rebuilt at the start of each scan
+        (see :meth:`reset_plan`) so config changes between scans apply.
+        '''
+        plan = getattr(self, '_plan', None)
+        if plan is None:
+            plan = self._plan = self.build_plan()
+        return plan
+    def reset_plan(self):
+        '''Discards :attr:`plan` so it's rebuilt from the current config
+        '''
+        self._plan = None
+    def build_plan(self):
+        return ScanPlan.from_config(self.config)
+    @property
+    def step_size(self):
+        return self.plan.step_size
+    @property
+    def equal_spacing(self):
+        return self.plan.equal_spacing
     def run_scan(self):
-        self.build_sample_sets()
+        self.reset_plan()
+        plan = self.sample_collection.plan = self.plan
+        self.spectrum.sample_data.reserve(plan.num_bins)
         running = self._running
         running.set()
         self.sample_collection.scan_all_freqs()
         self.sample_collection.stopped.wait()
-        if running.is_set():
+        if running.is_set() and self.autosave:
             self.save_to_dbstore()
         running.clear()
         self._stopped.set()
@@ -109,7 +143,16 @@ class ScannerBase(JSONMixin):
         self.sample_collection.cancel()
         self._stopped.wait()
     def save_to_dbstore(self):
-        self.spectrum.save_to_dbstore()
+        '''Saves :attr:`spectrum`. If :attr:`write_behind` is True (the
+        default) it's queued on :attr:`DBStore.writer` and this returns
+        without waiting for the write
+        '''
+        if not self.write_behind:
+            self.spectrum.save_to_dbstore()
+            return
+        writer = db_store.writer
+        writer.save_scan(self.spectrum)
+        logger.debug('Scan queued for saving ({} pending)'.format(writer.queue_depth))
     def _serialize(self):
         d = dict(
             config=self.config._serialize(),
@@ -158,40 +201,15 @@ class Scanner(ScannerBase):
     @samples_per_sweep.setter
     def samples_per_sweep(self, value):
         self.sampling_config.samples_per_sweep = value
-    @property
-    def step_size(self):
-        step_size = getattr(self, '_step_size', None)
-        if step_size is not None:
-            return step_size
+    def build_plan(self):
         c = self.sampling_config
-        overlap = c.sweep_overlap_ratio
         self.sdr.sample_rate = c.sample_rate
         rs = int(round(self.sdr.sample_rate))
 
         self.sample_rate = rs
-        nfft = self.window_size
-        resolution = get_freq_resolution(nfft, rs)
-
-        step_size = self._step_size = rs / 2. * overlap
-        self._equal_spacing = is_equal_spacing(nfft, rs, step_size)
-        if not self.equal_spacing:
-            step_size -= step_size % resolution
-            step_size = round(step_size)
-            if step_size <= 0:
-                step_size += resolution
-            self._equal_spacing = is_equal_spacing(nfft, rs, step_size)
-
-        step_size = hz_to_mhz(step_size)
-        self._step_size = step_size
-        logger.info(f'step_size: {step_size!r}, equal_spacing: {self._equal_spacing}')
-        return step_size
-    @property
-    def equal_spacing(self):
-        r = getattr(self, '_equal_spacing', None)
-        if r is not None:
-            return r
-        _ = self.step_size
-        return self._equal_spacing
+        plan = ScanPlan.from_config(self.config, sample_rate=rs)
+        logger.info(f'step_size: {plan.step_size!r}, equal_spacing: {plan.equal_spacing}, hops: {plan.num_hops}')
+        return plan
     @property
     def window_size(self):
         c = self.config
@@ -246,19 +264,35 @@ class Scanner(ScannerBase):
         else:
             force_lower_freq = False
         spectrum.add_sample_set(
-            frequency=freqs,
+            frequency_hz=freqs,
             magnitude=powers,
             center_frequency=center_freq,
             force_lower_freq=force_lower_freq,
         )
-        self.progress = self.sample_collection.calc_progress()
+        self.on_spectrum_updated(spectrum.version)
+        self.on_progress(self.scan_progress)
 
 class ThreadedScanner(threading.Thread, Scanner):
+    '''Scanner that runs in its own thread
+
+    If *run_once* is False, scans are repeated until :meth:`stop` is
+    called and each one is recorded as a row of :attr:`history`. The
+    history can be passed in as a :class:`SpectrumHistory`, or built
+    with *history_max_bytes* and *history_filename*.
+    '''
     def __init__(self, **kwargs):
         threading.Thread.__init__(self)
         Scanner.__init__(self, **kwargs)
         self.plot = kwargs.get('plot')
         self.run_once = kwargs.get('run_once', True)
+        self.history = kwargs.get('history')
+        if self.history is None and not self.run_once:
+            hkwargs = dict(filename=kwargs.get('history_filename'))
+            if kwargs.get('history_max_bytes') is not None:
+                hkwargs['max_bytes'] = kwargs['history_max_bytes']
+            self.history = SpectrumHistory(**hkwargs)
+        self._history_row_ts = None
+        self._history_axis_checked = False
         self.scan_wait_timeout = kwargs.get('scan_wait_timeout', 5.)
         self.scanning = threading.Event()
         self.waiting = threading.Event()
@@ -271,6 +305,42 @@ class ThreadedScanner(threading.Thread, Scanner):
             self.plot.update_plot()
         with self.need_update_lock:
             self.need_update.set()
+    def on_sample_set_processed(self, sample_set):
+        super(ThreadedScanner, self).on_sample_set_processed(sample_set)
+        history = self.history
+        if history is None:
+            return
+        if self._history_row_ts is not None:
+            # The plan (and the frequency axis) is only available once
+            # the device is open, so the row is started by the first hop.
+            # A history passed in may have been used with another range
+            if not self._history_axis_checked:
+                axis = self.plan.frequency_axis()
+                if not history.allocated or not np.array_equal(history.frequency_hz, axis):
+                    history.allocate(axis)
+                self._history_axis_checked = True
+            history.begin_row(self._history_row_ts)
+            self._history_row_ts = None
+        history.add_hop(sample_set.frequencies, dbmath.to_dB(sample_set.powers))
+    def run_scan(self):
+        history = self.history
+        if history is None:
+            return super(ThreadedScanner, self).run_scan()
+        self._history_row_ts = time.time()
+        # The plan is rebuilt for each scan and may have changed
+        self._history_axis_checked = False
+        try:
+            super(ThreadedScanner, self).run_scan()
+        finally:
+            self._history_row_ts = None
+            timestamp = history.commit_row()
+        if timestamp is not None:
+            self.on_history_row(timestamp)
+    def on_history_row(self, timestamp):
+        '''Called after each scan is added to :attr:`history` with the
+        timestamp of its row
+        '''
+        pass
     def run(self):
         scanning = self.scanning
         waiting = self.waiting
@@ -0,0 +1,132 @@
+import os
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+from wwb_scanner.scanner.main import ScannerBase, Scanner
+from wwb_scanner.scanner.config import ScanConfig
+from wwb_scanner.scanner.progress import ScanProgress
+
+class MultiScanner(ScannerBase):
+    '''Splits the scan range across several devices and scans them in parallel
+
+    Each sub-band is scanned by its own :attr:`scanner_cls` instance (with its
+    own :class:`SdrWrapper`) on a separate thread. Sub-bands are aligned to
+    the hop grid of a single-device scan so the hops at each boundary overlap
+    exactly as adjacent hops would. The devices share :attr:`spectrum` and
+    each hop is merged into it (only) as soon as its device has processed it.
+
+    If any device fails, the error is raised from :meth:`run_scan` once
+    all of them have stopped and the partial scan isn't saved.
+
+    params:
+        serial_numbers: (list) serial numbers of the devices to use
+        scanner_cls: scanner class used for each device (defaults to
+            :class:`Scanner`)
+    '''
+    scanner_cls = Scanner
+    def __init__(self, **kwargs):
+        super(MultiScanner, self).__init__(**kwargs)
+        scanner_cls = kwargs.get('scanner_cls')
+        if scanner_cls is not None:
+            self.scanner_cls = scanner_cls
+        self.serial_numbers = list(kwargs.get('serial_numbers', []))
+        if not len(self.serial_numbers):
+            self.serial_numbers = [self.device_config.serial_number]
+        self.scanners = []
+        self._child_progress = {}
+    def split_scan_range(self):
+        plans = self.plan.split(len(self.serial_numbers))
+        return [plan.scan_range for plan in plans]
+    def build_scanners(self):
+        self.scanners = []
+        self._child_progress.clear()
+        conf_data = self.config._serialize()
+        for key in ['eid', 'datetime']:
+            conf_data.pop(key, None)
+        raw_values_path = conf_data.get('raw_values_path')
+        ranges = self.split_scan_range()
+        for i, (serial_number, scan_range) in enumerate(zip(self.serial_numbers, ranges)):
+            config = ScanConfig(conf_data)
+            config.scan_range = scan_range
+            config.device.serial_number = serial_number
+            if raw_values_path is not None and len(ranges) > 1:
+                # Each device needs its own capture file
+                root, ext = os.path.splitext(raw_values_path)
+                config.raw_values_path = '{}_{}{}'.format(root, i, ext)
+            scanner = self.scanner_cls(config=config, autosave=False)
+            scanner.spectrum = self.spectrum
+            scanner.on_progress = self._build_progress_callback(scanner)
+            scanner.on_sample_set_processed = self._build_sample_set_callback(scanner)
+            self._child_progress[scanner] = scanner.scan_progress
+            self.scanners.append(scanner)
+        return self.scanners
+    def _build_progress_callback(self, scanner):
+        def on_progress(progress):
+            self._on_child_progress(scanner, progress)
+        return on_progress
+    def _build_sample_set_callback(self, scanner):
+        def on_sample_set_processed(sample_set):
+            self.on_sample_set_processed(scanner, sample_set)
+            scanner.on_progress(scanner.scan_progress)
+        return on_sample_set_processed
+    def on_sample_set_processed(self, scanner, sample_set):
+        '''Merges a hop processed by one of the :attr:`scanners` into
+        :attr:`spectrum`
+
+        This is called from the thread of the device that scanned it. Hops
+        from different devices arrive interleaved, so lower frequencies are
+        always merged.
+        '''
+        spectrum = self.spectrum
+        spectrum.add_sample_set(
+            frequency_hz=sample_set.frequencies,
+            magnitude=sample_set.powers,
+            center_frequency=sample_set.center_frequency,
+            force_lower_freq=True,
+        )
+        self.on_spectrum_updated(spectrum.version)
+    def _on_child_progress(self, scanner, progress):
+        self._child_progress[scanner] = progress
+        self.scan_progress = ScanProgress.combine(self._child_progress.values())
+        self.on_progress(self.scan_progress)
+    def run_scan(self):
+        running = self._running
+        self._stopped.clear()
+        self.reset_plan()
+        scanners = self.build_scanners()
+        self.spectrum.sample_data.reserve(self.plan.num_bins)
+        errors = []
+        def run_child_scan(scanner):
+            try:
+                scanner.run_scan()
+            except Exception as exc:
+                logger.exception('Error scanning with device {}'.format(
+                    scanner.device_config.serial_number
+                ))
+                errors.append(exc)
+        threads = []
+        for scanner in scanners:
+            t = threading.Thread(target=run_child_scan, args=(scanner,))
+            t.daemon = True
+            threads.append(t)
+        running.set()
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            if errors:
+                raise errors[0]
+            if running.is_set() and self.autosave:
+                self.save_to_dbstore()
+        finally:
+            running.clear()
+            self._stopped.set()
+    def stop_scan(self):
+        self._running.clear()
+        for scanner in self.scanners:
+            if scanner._running.is_set():
+                scanner.stop_scan()
+        self._stopped.wait()
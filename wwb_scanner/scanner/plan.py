@@ -0,0 +1,195 @@
+import numpy as np
+from scipy.signal import get_window
+
+import logging
+logger = logging.getLogger(__name__)
+
+def mhz_to_hz(mhz):
+    return mhz * 1000000.0
+def hz_to_mhz(hz):
+    return hz / 1000000.0
+
+def calc_relative_freqs(sample_rate, nfft):
+    '''Returns the fftshifted frequency axis of an *nfft* point FFT (rounded
+    to integer Hz) and the permutation that sorts raw FFT bins into it
+    '''
+    sort_index = np.fft.fftshift(np.arange(nfft))
+    freqs = np.fft.fftfreq(nfft, 1. / sample_rate)[sort_index]
+    return np.around(freqs).astype(np.int64), sort_index
+
+def calc_freq_resolution(rel_freqs):
+    r = np.unique(np.diff(rel_freqs))
+    if r.size != 1:
+        logger.error(f'!!! Not unique: {r}')
+        return r.mean()
+    return r[0]
+
+def check_equal_spacing(rel_freqs, step_size):
+    all_freqs = np.union1d(rel_freqs, rel_freqs + step_size)
+    diff = np.unique(np.diff(all_freqs))
+    logger.debug(f'freq spacing diff={diff}')
+    return diff.size == 1
+
+def calc_step_size_hz(sample_rate, rel_freqs, overlap):
+    '''Returns a tuple of the hop step size (in integer Hz) and whether the
+    frequency bins of adjacent hops fall on an evenly spaced grid
+    '''
+    step_size = int(round(sample_rate / 2. * overlap))
+    equal_spacing = check_equal_spacing(rel_freqs, step_size)
+    if not equal_spacing:
+        resolution = calc_freq_resolution(rel_freqs)
+        step_size = int(round(step_size - step_size % resolution))
+        if step_size <= 0:
+            step_size += int(round(resolution))
+        equal_spacing = check_equal_spacing(rel_freqs, step_size)
+    return step_size, equal_spacing
+
+def calc_step_size(sample_rate, nfft, overlap):
+    '''Returns a tuple of the hop step size (in MHz) and whether the frequency
+    bins of adjacent hops fall on an evenly spaced grid
+    '''
+    rel_freqs, _ = calc_relative_freqs(sample_rate, nfft)
+    step_size, equal_spacing = calc_step_size_hz(sample_rate, rel_freqs, overlap)
+    return hz_to_mhz(step_size), equal_spacing
+
+def _readonly(a):
+    a = np.array(a)
+    a.flags.writeable = False
+    return a
+
+class ScanPlan(object):
+    '''Precomputed hop grid and frequency axes for a scan
+
+    Everything that is the same for every hop (the window, the relative
+    frequency axis and the bin sort order) is calculated once when the plan
+    is built. Hop centers are stored as an integer Hz array and handed out
+    one at a time by :meth:`iter_hops`, so no per-hop objects exist until they
+    are scanned.
+
+    Plans are immutable. Use :meth:`split` to divide one into sub-plans on
+    the same hop grid.
+
+    attributes:
+        sample_rate: (int) sample rate in Hz
+        window: (numpy.ndarray) the FFT window
+        frequencies: (numpy.ndarray) integer Hz offsets of each sorted FFT bin
+            from the hop center
+        sort_index: (numpy.ndarray) permutation that sorts raw FFT bins
+            into :attr:`frequencies`
+        step_size_hz: (int) distance between hop centers in Hz
+        equal_spacing: (bool) whether bins of adjacent hops fall on an
+            evenly spaced grid
+        hop_centers: (numpy.ndarray) integer Hz center frequency of each hop
+    '''
+    __slots__ = (
+        'sample_rate', 'window_type', 'window', 'frequencies', 'sort_index',
+        'step_size_hz', 'equal_spacing', 'hop_centers',
+    )
+    def __init__(self, **kwargs):
+        sample_rate = int(round(kwargs['sample_rate']))
+        window = kwargs['window']
+        frequencies = kwargs.get('frequencies')
+        sort_index = kwargs.get('sort_index')
+        if frequencies is None or sort_index is None:
+            frequencies, sort_index = calc_relative_freqs(sample_rate, len(window))
+        step_size_hz = kwargs.get('step_size_hz')
+        equal_spacing = kwargs.get('equal_spacing')
+        if step_size_hz is None:
+            step_size_hz, equal_spacing = calc_step_size_hz(
+                sample_rate, frequencies, kwargs.get('overlap', .5),
+            )
+        elif equal_spacing is None:
+            equal_spacing = check_equal_spacing(frequencies, step_size_hz)
+        hop_centers = kwargs.get('hop_centers')
+        if hop_centers is None:
+            start_freq, end_freq = kwargs['scan_range']
+            start_hz = int(round(mhz_to_hz(start_freq)))
+            end_hz = int(round(mhz_to_hz(end_freq)))
+            num_hops = max((end_hz - start_hz) // step_size_hz + 1, 0)
+            hop_centers = start_hz + step_size_hz * np.arange(num_hops, dtype=np.int64)
+        _set = super(ScanPlan, self).__setattr__
+        _set('sample_rate', sample_rate)
+        _set('window_type', kwargs.get('window_type'))
+        _set('window', _readonly(window))
+        _set('frequencies', _readonly(frequencies))
+        _set('sort_index', _readonly(sort_index))
+        _set('step_size_hz', int(step_size_hz))
+        _set('equal_spacing', bool(equal_spacing))
+        _set('hop_centers', _readonly(np.asarray(hop_centers, dtype=np.int64)))
+    @classmethod
+    def from_config(cls, config, sample_rate=None):
+        c = config.sampling
+        if sample_rate is None:
+            sample_rate = c.sample_rate
+        window = get_window(c.window_type, c.window_size)
+        return cls(
+            scan_range=config.scan_range,
+            sample_rate=sample_rate,
+            window_type=c.window_type,
+            window=window,
+            overlap=c.sweep_overlap_ratio,
+        )
+    def __setattr__(self, key, value):
+        raise AttributeError('ScanPlan is immutable')
+    def __len__(self):
+        return self.hop_centers.size
+    @property
+    def nfft(self):
+        return self.window.size
+    @property
+    def num_hops(self):
+        return self.hop_centers.size
+    @property
+    def num_bins(self):
+        '''Number of unique frequencies a full scan can produce (an upper
+        bound if hops don't fall on an evenly spaced grid)
+        '''
+        num_hops = self.num_hops
+        if not num_hops:
+            return 0
+        max_bins = num_hops * self.nfft
+        if not self.equal_spacing or num_hops == 1:
+            return max_bins
+        f = self.frequencies
+        spacing = np.diff(np.union1d(f, f + self.step_size_hz)).min()
+        hop_centers = self.hop_centers
+        span = hop_centers.max() - hop_centers.min() + f[-1] - f[0]
+        return min(int(span // spacing) + 1, max_bins)
+    @property
+    def step_size(self):
+        return hz_to_mhz(self.step_size_hz)
+    @property
+    def scan_range(self):
+        if not self.num_hops:
+            return None
+        return [hz_to_mhz(self.hop_centers.min()), hz_to_mhz(self.hop_centers.max())]
+    def iter_hops(self):
+        for fc in self.hop_centers:
+            yield int(fc)
+    def frequency_axis(self):
+        '''Sorted unique frequencies (integer Hz) of every bin in the scan
+        '''
+        if not self.num_hops:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(self.hop_centers[:,np.newaxis] + self.frequencies[np.newaxis,:])
+    def hop_frequencies(self, center_frequency):
+        '''Absolute frequencies (integer Hz) of each sorted bin for a hop
+        '''
+        return self.frequencies + center_frequency
+    def copy(self, **kwargs):
+        for key in self.__slots__:
+            kwargs.setdefault(key, getattr(self, key))
+        return self.__class__(**kwargs)
+    def split(self, num_plans):
+        '''Divides the hops into at most *num_plans* contiguous sub-plans
+        '''
+        num_hops = self.num_hops
+        num_plans = min(num_plans, num_hops)
+        if num_plans < 1:
+            return []
+        hops_per_plan = int(np.ceil(num_hops / num_plans))
+        plans = []
+        for first_hop in range(0, num_hops, hops_per_plan):
+            hops = self.hop_centers[first_hop:first_hop+hops_per_plan]
+            plans.append(self.copy(hop_centers=hops))
+        return plans
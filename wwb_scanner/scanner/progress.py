@@ -0,0 +1,128 @@
+import time
+
+class ScanProgress(object):
+    '''Running counters for a scan, updated once per hop
+
+    Everything is kept as totals so updating and reading are constant
+    time regardless of how many hops the scan has.
+
+    attributes:
+        num_hops: (int) number of hops in the scan
+        hops_done: (int) number of hops processed so far
+        hops_failed: (int) number of hops that couldn't be processed
+        fraction: (float) portion of the scan completed (0 to 1), including
+            failed hops. Updated by :meth:`add_hop` and :meth:`add_failed_hop`,
+            but may also be set directly by scanners that don't work in hops
+        start_time: :func:`time.perf_counter` value when the scan started
+        tune_time: (float) total seconds spent retuning the device
+        read_time: (float) total seconds spent reading samples
+        dsp_time: (float) total seconds spent computing the PSD
+    '''
+    __slots__ = (
+        'num_hops', 'hops_done', 'hops_failed', 'fraction', 'start_time', 'update_time',
+        'tune_time', 'read_time', 'dsp_time',
+    )
+    def __init__(self, num_hops=0):
+        self.start(num_hops)
+    def start(self, num_hops, start_time=None):
+        '''Resets the counters for a new scan of *num_hops*
+        '''
+        if start_time is None:
+            start_time = time.perf_counter()
+        self.num_hops = num_hops
+        self.hops_done = 0
+        self.hops_failed = 0
+        self.fraction = 0.
+        self.start_time = start_time
+        self.update_time = start_time
+        self.tune_time = 0.
+        self.read_time = 0.
+        self.dsp_time = 0.
+    def add_hop(self, tune_time=None, read_time=None, dsp_time=None):
+        '''Records a completed hop along with the time each stage took
+        (in seconds, if known)
+        '''
+        self.hops_done += 1
+        if tune_time is not None:
+            self.tune_time += tune_time
+        if read_time is not None:
+            self.read_time += read_time
+        if dsp_time is not None:
+            self.dsp_time += dsp_time
+        self._update_fraction()
+    def add_failed_hop(self):
+        '''Records a hop that couldn't be processed
+        '''
+        self.hops_failed += 1
+        self._update_fraction()
+    def _update_fraction(self):
+        if self.num_hops:
+            self.fraction = min((self.hops_done + self.hops_failed) / self.num_hops, 1.)
+        self.update_time = time.perf_counter()
+    @property
+    def elapsed(self):
+        return self.update_time - self.start_time
+    @property
+    def hops_remaining(self):
+        return max(self.num_hops - self.hops_done - self.hops_failed, 0)
+    @property
+    def hops_per_second(self):
+        elapsed = self.elapsed
+        if elapsed <= 0 or not self.hops_done:
+            return 0.
+        return self.hops_done / elapsed
+    @property
+    def eta(self):
+        '''Estimated seconds until the scan completes (``None`` until the
+        first hop is done)
+        '''
+        rate = self.hops_per_second
+        if not rate:
+            return None
+        return self.hops_remaining / rate
+    def _mean(self, total):
+        if not self.hops_done:
+            return 0.
+        return total / self.hops_done
+    @property
+    def mean_tune_time(self):
+        return self._mean(self.tune_time)
+    @property
+    def mean_read_time(self):
+        return self._mean(self.read_time)
+    @property
+    def mean_dsp_time(self):
+        return self._mean(self.dsp_time)
+    def copy(self):
+        obj = self.__class__.__new__(self.__class__)
+        for key in self.__slots__:
+            setattr(obj, key, getattr(self, key))
+        return obj
+    @classmethod
+    def combine(cls, items):
+        '''Builds the progress of several scans running in parallel
+        '''
+        items = list(items)
+        obj = cls()
+        if not items:
+            return obj
+        obj.num_hops = sum(p.num_hops for p in items)
+        obj.hops_done = sum(p.hops_done for p in items)
+        obj.hops_failed = sum(p.hops_failed for p in items)
+        for key in ['tune_time', 'read_time', 'dsp_time']:
+            setattr(obj, key, sum(getattr(p, key) for p in items))
+        obj.start_time = min(p.start_time for p in items)
+        obj.update_time = max(p.update_time for p in items)
+        obj.fraction = sum(p.fraction for p in items) / len(items)
+        return obj
+    def __str__(self):
+        eta = self.eta
+        eta = '--' if eta is None else '{:.1f}s'.format(eta)
+        failed = ''
+        if self.hops_failed:
+            failed = ' ({} failed)'.format(self.hops_failed)
+        return '{self.hops_done}/{self.num_hops} hops{failed}, {rate:.1f} hops/s, ETA {eta}'.format(
+            self=self, failed=failed, rate=self.hops_per_second, eta=eta,
+        )
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {self}>'.format(self=self)
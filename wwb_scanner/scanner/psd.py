@@ -0,0 +1,149 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy import fft as sp_fft
+from scipy.signal import get_window
+
+def build_iq_lut(dtype=np.complex64):
+    # Indexed by one interleaved (I, Q) byte pair read as a little-endian uint16
+    values = np.arange(256, dtype=np.float64) / 127.5 - 1
+    ix = np.arange(65536)
+    lut = np.empty(ix.size, dtype=dtype)
+    lut.real = values[ix & 0xff]
+    lut.imag = values[ix >> 8]
+    return lut
+
+class ByteSampleConverter(object):
+    '''Converts raw uint8 IQ buffers from the device into complex samples
+
+    Conversion is a single table lookup per sample into a buffer that is
+    reused for every call, so the returned array is only valid until the
+    next call to :meth:`convert`.
+    '''
+    _luts = {}
+    def __init__(self, num_samples, dtype=np.complex64):
+        self.dtype = np.dtype(dtype)
+        lut = self._luts.get(self.dtype)
+        if lut is None:
+            lut = self._luts[self.dtype] = build_iq_lut(self.dtype)
+        self.lut = lut
+        self.buffer = np.empty(num_samples, dtype=self.dtype)
+    def convert(self, values):
+        pairs = np.frombuffer(values, dtype='<u2')
+        if pairs.size > self.buffer.size:
+            self.buffer = np.empty(pairs.size, dtype=self.dtype)
+        out = self.buffer[:pairs.size]
+        np.take(self.lut, pairs, out=out)
+        return out
+
+def segment_view(samples, nperseg, noverlap):
+    step = nperseg - noverlap
+    nseg = (samples.shape[-1] - noverlap) // step
+    if nseg < 1:
+        return samples[:0].reshape((0, nperseg))
+    stride = samples.strides[-1]
+    return as_strided(
+        samples, shape=(nseg, nperseg), strides=(step * stride, stride),
+        writeable=False,
+    )
+
+class PSDEngine(object):
+    '''Computes the frequency-translated, sorted power spectrum of an IQ block
+
+    This produces the same result as running :func:`scipy.signal.welch`
+    followed by the ``irfft -> translate_freq -> rfft`` round trip in
+    :meth:`SampleSet.process_samples`, using only vectorized operations.
+    '''
+    def __init__(self, sample_rate, window, noverlap=None, dtype=np.float64):
+        self.sample_rate = sample_rate
+        self.dtype = np.dtype(dtype)
+        self.complex_dtype = np.result_type(self.dtype, np.complex64)
+        self.window = np.asarray(window, dtype=self.dtype)
+        nperseg = self.nperseg = self.window.size
+        if noverlap is None:
+            noverlap = nperseg // 2
+        self.noverlap = noverlap
+        self.scale = 1. / (sample_rate * (self.window * self.window).sum())
+        freqs = np.fft.fftshift(np.fft.fftfreq(nperseg, 1. / sample_rate))
+        self.frequencies = np.around(freqs)
+        num_xlate = 2 * (nperseg - 1)
+        self._xlate_index = np.arange(num_xlate, dtype=np.float64)
+        h = np.zeros(num_xlate, dtype=np.float64)
+        h[0] = 1.
+        h[1:nperseg-1] = 2.
+        h[nperseg-1] = 1.
+        self._analytic_weights = h
+    @classmethod
+    def from_config(cls, sampling_config, sample_rate=None, window_size=None, window=None):
+        if sample_rate is None:
+            sample_rate = sampling_config.sample_rate
+        if window is None:
+            if window_size is None:
+                window_size = sampling_config.window_size
+            window = get_window(sampling_config.window_type, window_size)
+        if sampling_config.get('single_precision'):
+            dtype = np.float32
+        else:
+            dtype = np.float64
+        noverlap = None
+        overlap_ratio = sampling_config.get('window_overlap')
+        if overlap_ratio is not None:
+            noverlap = min(int(len(window) * overlap_ratio), len(window) - 1)
+        return cls(sample_rate, window, noverlap=noverlap, dtype=dtype)
+    def periodogram_sum(self, samples):
+        segs = segment_view(samples, self.nperseg, self.noverlap)
+        if not segs.shape[0]:
+            return np.zeros(self.nperseg, dtype=self.window.dtype), 0
+        spec = sp_fft.fft(segs * self.window, axis=-1)
+        Pxx = spec.real ** 2
+        Pxx += spec.imag ** 2
+        return Pxx.sum(axis=0), segs.shape[0]
+    def welch(self, samples):
+        Pxx, nseg = self.periodogram_sum(samples)
+        Pxx *= self.scale / nseg
+        return Pxx
+    def translate(self, Pxx, center_frequency):
+        # Equivalent to hilbert(irfft(Pxx)) since the analytic signal's
+        # spectrum is just the one-sided Pxx with the Hilbert weights applied
+        analytic = np.zeros(self._analytic_weights.size, dtype=self.complex_dtype)
+        analytic[:Pxx.size] = Pxx
+        analytic *= self._analytic_weights
+        analytic = sp_fft.ifft(analytic)
+
+        omega = 2 * np.pi * (center_frequency / self.sample_rate)
+        step = np.mod(omega - np.pi, 2 * np.pi) - np.pi
+        analytic *= np.exp(1j * step * self._xlate_index).astype(self.complex_dtype)
+
+        Pxx = np.abs(sp_fft.rfft(analytic.real))
+        return np.fft.fftshift(Pxx)
+    def process_psd(self, Pxx, center_frequency):
+        Pxx = self.translate(Pxx, center_frequency)
+        freqs = self.frequencies + center_frequency
+        return freqs, Pxx
+    def process(self, samples, center_frequency):
+        return self.process_psd(self.welch(samples), center_frequency)
+
+class PSDAccumulator(object):
+    '''Folds a stream of sample blocks into a running Welch periodogram sum
+
+    Segment boundaries follow the concatenated stream, so the result of
+    :meth:`get_psd` matches :meth:`PSDEngine.welch` on all of the blocks joined
+    together while only the unused tail of the previous block is retained.
+    '''
+    def __init__(self, engine):
+        self.engine = engine
+        self.reset()
+    def reset(self):
+        self.Pxx_sum = np.zeros(self.engine.nperseg, dtype=np.float64)
+        self.num_segments = 0
+        self._tail = None
+    def add_samples(self, samples):
+        engine = self.engine
+        if self._tail is not None:
+            samples = np.concatenate([self._tail, samples])
+        Pxx, nseg = engine.periodogram_sum(samples)
+        self.Pxx_sum += Pxx
+        self.num_segments += nseg
+        consumed = nseg * (engine.nperseg - engine.noverlap)
+        self._tail = samples[consumed:].copy()
+    def get_psd(self):
+        return self.Pxx_sum * (self.engine.scale / self.num_segments)
@@ -0,0 +1,184 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.signal import get_window
+
+import logging
+logger = logging.getLogger(__name__)
+
+from wwb_scanner.scanner.main import ScannerBase
+from wwb_scanner.scanner.plan import ScanPlan, hz_to_mhz
+from wwb_scanner.scanner.psd import PSDEngine
+from wwb_scanner.scanner.capture import RawCaptureReader
+
+# Reader of the capture being replayed in a worker process. Only set in
+# the pool's processes, which exit (unmapping the file) when it shuts down
+_worker_reader = None
+
+def _get_worker_reader(filename):
+    global _worker_reader
+    reader = _worker_reader
+    if reader is None or reader.filename != filename:
+        reader = _worker_reader = RawCaptureReader(filename)
+    return reader
+
+def process_reader_hops(reader, engine, indices):
+    '''Computes the translated PSD of the given hops of a
+    :class:`RawCaptureReader`
+    '''
+    results = []
+    for ix in indices:
+        header, samples = reader[ix]
+        _, Pxx = engine.process(samples.reshape(-1), int(header['center_frequency']))
+        results.append(Pxx)
+    return results
+
+def process_hops(filename, engine, indices):
+    '''Computes the translated PSD of the given hops of a capture file
+
+    This is the unit of work submitted to the process pool. Each worker
+    maps the file once and keeps it until the pool shuts down.
+    '''
+    return process_reader_hops(_get_worker_reader(filename), engine, indices)
+
+class ReplayScanner(ScannerBase):
+    '''Rebuilds a spectrum from the raw IQ saved by a previous scan
+
+    Hops are read from a capture file written with ``save_raw_values``
+    and processed using the current sampling config, so the window type,
+    window size and window overlap can differ from the original scan. The
+    sample rate and hop centers are taken from the capture.
+
+    params:
+        filename: path of the capture file
+        max_workers: (int) number of worker processes. If 0, hops are
+            processed in the calling thread
+        hops_per_task: (int) number of hops handed to a worker at a time
+    '''
+    def __init__(self, **kwargs):
+        super(ReplayScanner, self).__init__(**kwargs)
+        self.filename = kwargs.get('filename')
+        self.max_workers = kwargs.get('max_workers')
+        self.hops_per_task = kwargs.get('hops_per_task', 16)
+        # Only the headers are kept. The samples are mapped while scanning
+        with RawCaptureReader(self.filename) as reader:
+            self.reader = reader
+        headers = reader.headers
+        if len(headers):
+            self.sampling_config.sample_rate = float(headers['sample_rate'][0])
+            gain = headers['gain'][0]
+            if not np.isnan(gain):
+                self.device_config.gain = float(gain)
+            self.config.scan_range = [
+                hz_to_mhz(headers['center_frequency'].min()),
+                hz_to_mhz(headers['center_frequency'].max()),
+            ]
+    @property
+    def sample_rate(self):
+        return self.sampling_config.sample_rate
+    @property
+    def window_size(self):
+        return self.sampling_config.window_size
+    def build_plan(self):
+        c = self.sampling_config
+        hop_centers = self.reader.center_frequencies
+        step_size_hz = None
+        # A capture appended to by several scans holds repeated sweeps, so
+        # the hop centers aren't monotonic
+        unique_centers = np.unique(hop_centers)
+        if unique_centers.size > 1:
+            step_size_hz = int(np.diff(unique_centers).min())
+        return ScanPlan(
+            sample_rate=c.sample_rate,
+            window_type=c.window_type,
+            window=get_window(c.window_type, c.window_size),
+            overlap=c.sweep_overlap_ratio,
+            step_size_hz=step_size_hz,
+            hop_centers=hop_centers,
+        )
+    def build_psd_engine(self):
+        plan = self.plan
+        return PSDEngine.from_config(
+            self.sampling_config, sample_rate=plan.sample_rate, window=plan.window,
+        )
+    def iter_chunks(self):
+        n = self.hops_per_task
+        for start_ix in range(0, len(self.reader), n):
+            yield list(range(start_ix, min(start_ix + n, len(self.reader))))
+    def iter_results(self, executor=None, futures=None):
+        '''Yields the PSD of each hop in order
+
+        If *executor* is given, all chunks are submitted to it up front and
+        their futures are added to *futures* (so they can be cancelled).
+        '''
+        engine = self.build_psd_engine()
+        chunks = self.iter_chunks()
+        if executor is None:
+            with RawCaptureReader(self.filename) as reader:
+                for ix in chunks:
+                    for Pxx in process_reader_hops(reader, engine, ix):
+                        yield Pxx
+            return
+        if futures is None:
+            futures = []
+        futures.extend(executor.submit(process_hops, self.filename, engine, ix) for ix in chunks)
+        for f in futures:
+            for Pxx in f.result():
+                yield Pxx
+    def run_scan(self):
+        running = self._running
+        self._stopped.clear()
+        running.set()
+        self.reset_plan()
+        plan = self.plan
+        progress = self.scan_progress
+        progress.start(plan.num_hops)
+        executor = None
+        futures = []
+        if self.max_workers != 0 and len(self.reader):
+            executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        results = self.iter_results(executor, futures)
+        try:
+            hop_iter = zip(plan.iter_hops(), results)
+            read_start = time.perf_counter()
+            for fc, Pxx in hop_iter:
+                if not running.is_set():
+                    break
+                # The PSD is computed by the workers, so only the time spent
+                # waiting for each result is known here
+                read_time = time.perf_counter() - read_start
+                self.on_hop_processed(fc, Pxx, read_time)
+                read_start = time.perf_counter()
+        finally:
+            # Unmaps the capture if it was read here
+            results.close()
+            if executor is not None:
+                # Drop the chunks not started yet if the scan was stopped
+                for f in futures:
+                    f.cancel()
+                executor.shutdown(wait=True)
+        logger.info('{} hops replayed ({:.2f} hops/s)'.format(
+            progress.hops_done, progress.hops_per_second,
+        ))
+        if running.is_set() and self.autosave:
+            self.save_to_dbstore()
+        running.clear()
+        self._stopped.set()
+    @property
+    def num_processed(self):
+        return self.scan_progress.hops_done
+    def on_hop_processed(self, center_frequency, Pxx, read_time=None):
+        plan = self.plan
+        self.spectrum.add_sample_set(
+            frequency_hz=plan.hop_frequencies(center_frequency),
+            magnitude=Pxx,
+            center_frequency=center_frequency,
+            force_lower_freq=plan.equal_spacing,
+        )
+        self.on_spectrum_updated(self.spectrum.version)
+        self.scan_progress.add_hop(read_time=read_time)
+        self.on_progress(self.scan_progress)
+    def stop_scan(self):
+        self._running.clear()
+        self._stopped.wait()
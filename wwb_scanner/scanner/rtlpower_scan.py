@@ -3,7 +3,7 @@ import shlex
 
 import numpy as np
 
-from rtlsdr import RtlSdr
+from wwb_scanner.scanner.backends.rtl import RtlSdr
 
 from wwb_scanner.scanner.main import ScannerBase, hz_to_mhz, mhz_to_hz
 
@@ -1,13 +1,19 @@
+import os
 import time
 import threading
+import queue
 import numpy as np
 from scipy.signal.windows import __all__ as WINDOW_TYPES
-from scipy.signal import welch, get_window, hilbert
+from scipy.signal import hilbert
 
 import logging
 logger = logging.getLogger(__name__)
 
 from wwb_scanner.core import JSONMixin
+from wwb_scanner.utils.dbstore import db_store
+from wwb_scanner.scanner.psd import PSDEngine, PSDAccumulator, ByteSampleConverter
+from wwb_scanner.scanner.plan import calc_relative_freqs
+from wwb_scanner.scanner.capture import RawCaptureWriter
 
 WINDOW_TYPES = [s for s in WINDOW_TYPES if s != 'get_window']
 
@@ -30,7 +36,8 @@ def sort_psd(f, Pxx, onesided=False):
 
 class SampleSet(JSONMixin):
     __slots__ = ('scanner', 'center_frequency', 'raw', 'current_sweep', 'complete',
-                 '_frequencies', 'powers', 'collection', 'process_thread', 'samples_discarded')
+                 '_frequencies', 'powers', 'collection', 'process_thread', 'samples_discarded',
+                 'accumulator', 'read_start', 'tune_time', 'read_time', 'dsp_time')
     _serialize_attrs = ('center_frequency', '_frequencies', 'powers')
     def __init__(self, **kwargs):
         for key in self.__slots__:
@@ -59,36 +66,67 @@ class SampleSet(JSONMixin):
     @property
     def window_size(self):
         return getattr(self.scanner, 'window_size', NPERSEG)
+    @property
+    def psd_engine(self):
+        return self.collection.psd_engine
     def read_samples(self):
         scanner = self.scanner
         freq = self.center_frequency
         sweeps_per_scan = scanner.sweeps_per_scan
         samples_per_sweep = scanner.samples_per_sweep
         sdr = scanner.sdr
+        single_precision = scanner.sampling_config.get('single_precision')
+        tune_start = time.perf_counter()
         sdr.set_center_freq(freq)
-        self.raw = np.zeros((sweeps_per_scan, samples_per_sweep), 'complex')
-        self.powers = np.zeros((sweeps_per_scan, samples_per_sweep), 'float64')
-        sdr.read_samples_async(self.samples_callback, num_samples=samples_per_sweep)
+        self.read_start = time.perf_counter()
+        self.tune_time = self.read_start - tune_start
+        dtype = np.complex64 if single_precision else np.complex128
+        shape = (sweeps_per_scan, samples_per_sweep)
+        capture = self.collection.capture
+        if capture is not None:
+            _, self.raw = capture.allocate_hop(
+                freq, scanner.sample_rate, scanner.device_config.get('gain'),
+                shape, dtype,
+            )
+        if scanner.sampling_config.get('accumulate_sweeps'):
+            self.accumulator = PSDAccumulator(self.psd_engine)
+        elif self.raw is None:
+            self.raw = np.zeros(shape, dtype)
+        if single_precision:
+            sdr.read_bytes_async(self.bytes_callback, num_bytes=2*samples_per_sweep)
+        else:
+            sdr.read_samples_async(self.samples_callback, num_samples=samples_per_sweep)
+    def bytes_callback(self, values, context):
+        iq = self.collection.byte_converter.convert(values)
+        self.samples_callback(iq, context)
     def samples_callback(self, iq, context):
-        samples_per_sweep = self.scanner.samples_per_sweep
+        sweeps_per_scan = self.sweeps_per_scan
         if not self.samples_discarded:
             self.samples_discarded = True
             return
         current_sweep = getattr(self, 'current_sweep', None)
         if current_sweep is None:
             current_sweep = self.current_sweep = 0
-        if current_sweep >= self.raw.shape[0]:
-            self.on_sample_read_complete()
+        if current_sweep >= sweeps_per_scan:
             return
-        self.raw[current_sweep] = iq
+        if self.accumulator is not None:
+            self.accumulator.add_samples(iq)
+        if self.raw is not None:
+            self.raw[current_sweep] = iq
         self.current_sweep += 1
-        if current_sweep > self.raw.shape[0]:
+        if self.current_sweep >= sweeps_per_scan:
             self.on_sample_read_complete()
     def on_sample_read_complete(self):
+        if self.read_start is not None:
+            self.read_time = time.perf_counter() - self.read_start
         sdr = self.scanner.sdr
         if not sdr.read_async_canceling:
             sdr.cancel_read_async()
-        self.process_samples()
+        pipeline = self.collection.pipeline
+        if pipeline is not None:
+            pipeline.submit(self)
+        else:
+            self.process_samples()
     def translate_freq(self, samples, freq, rs):
         # Adapted from https://github.com/vsergeev/luaradio/blob/master/radio/blocks/signal/frequencytranslator.lua
         if not np.iscomplexobj(samples):
@@ -110,93 +148,212 @@ class SampleSet(JSONMixin):
         samples *= xlator
         return samples
     def process_samples(self):
-        rs = self.scanner.sample_rate
+        dsp_start = time.perf_counter()
         fc = self.center_frequency
 
-        samples = self.raw.flatten()
-
-        win_size = self.window_size
-        win = get_window(self.scanner.sampling_config.window_type, win_size)
-        freqs, Pxx = welch(samples, fs=rs, window=win, detrend=False,
-            nperseg=win_size, scaling='density', return_onesided=False)
-
-        iPxx = np.fft.irfft(Pxx)
-        iPxx = self.translate_freq(iPxx, fc, rs)
-        Pxx = np.abs(np.fft.rfft(iPxx.real))
-
-        freqs, Pxx = sort_psd(freqs, Pxx)
-        freqs = np.around(freqs)
-
-        freqs += fc
-        freqs /= 1e6
+        if self.accumulator is not None:
+            Pxx = self.accumulator.get_psd()
+            freqs, Pxx = self.psd_engine.process_psd(Pxx, fc)
+        else:
+            samples = self.raw.reshape(-1)
+            freqs, Pxx = self.psd_engine.process(samples, fc)
+        freqs = np.rint(freqs).astype(np.int64)
 
         self.powers = Pxx
         if not np.array_equal(freqs, self.frequencies):
             logger.warning('freq not equal: %s, %s' % (self.frequencies.size, freqs.size))
             self.frequencies = freqs
         self.raw = None
+        self.accumulator = None
+        self.dsp_time = time.perf_counter() - dsp_start
         self.collection.on_sample_set_processed(self)
         self.complete.set()
     def calc_expected_freqs(self):
-        freq = self.center_frequency
-        scanner = self.scanner
-        rs = scanner.sample_rate
-        win_size = self.window_size
-        num_samples = scanner.samples_per_sweep * scanner.sweeps_per_scan
-        overlap_ratio = scanner.sampling_config.sweep_overlap_ratio
-        fake_samples = np.zeros(num_samples, 'complex')
-        f_expected, Pxx = welch(fake_samples.real, fs=rs, nperseg=win_size, return_onesided=False)
-
-        f_expected, Pxx = sort_psd(f_expected, Pxx)
-
-        f_expected = np.around(f_expected)
-
-        f_expected += freq
-        f_expected /= 1e6
-        return f_expected
+        plan = None
+        if self.collection is not None:
+            plan = self.collection.plan
+        fc = int(round(self.center_frequency))
+        if plan is not None:
+            return plan.hop_frequencies(fc)
+        rel_freqs, _ = calc_relative_freqs(self.scanner.sample_rate, self.window_size)
+        return rel_freqs + fc
     def _serialize(self):
         return {k:getattr(self, k) for k in self._serialize_attrs}
 
 
+class ProcessingPipeline(object):
+    '''Runs :meth:`SampleSet.process_samples` on a worker thread
+
+    Completed sample sets are handed over through a bounded queue so the
+    device can be retuned while the previous hop is still being processed.
+    Once the queue is full, :meth:`submit` blocks until the worker catches up.
+    '''
+    def __init__(self, **kwargs):
+        self.max_queued = kwargs.get('max_queued', 4)
+        self.queue = queue.Queue(maxsize=self.max_queued)
+        self.thread = None
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+    def stop(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+    def submit(self, sample_set):
+        self.queue.put(sample_set)
+    def _run(self):
+        q = self.queue
+        while True:
+            sample_set = q.get()
+            if sample_set is None:
+                break
+            try:
+                sample_set.process_samples()
+            except Exception as exc:
+                logger.exception('Error processing {}'.format(sample_set.center_frequency))
+                sample_set.collection.on_sample_set_error(sample_set, exc)
+                sample_set.complete.set()
+
 class SampleCollection(JSONMixin):
     def __init__(self, **kwargs):
         self.scanner = kwargs.get('scanner')
         self.scanning = threading.Event()
         self.stopped = threading.Event()
         self.sample_sets = {}
-    def calc_progress(self):
-        num_sets = len(self.sample_sets)
-        if not num_sets:
-            return 0
-        num_complete = 0.
-        for sample_set in self.sample_sets.values():
-            if sample_set.complete.is_set():
-                num_complete += 1
-        return num_complete / num_sets
+        self.plan = kwargs.get('plan')
+        self.pipeline = None
+        self.capture = None
+        self.capture_filename = None
+        self.num_processed = 0
+        self.errors = []
+        self._psd_engine = None
+        self._byte_converter = None
+    @property
+    def byte_converter(self):
+        converter = self._byte_converter
+        if converter is None:
+            converter = self._byte_converter = ByteSampleConverter(
+                self.scanner.samples_per_sweep, np.complex64,
+            )
+        return converter
+    @property
+    def psd_engine(self):
+        engine = self._psd_engine
+        if engine is None:
+            scanner = self.scanner
+            plan = self.plan
+            if plan is not None:
+                engine = PSDEngine.from_config(
+                    scanner.sampling_config,
+                    sample_rate=plan.sample_rate,
+                    window=plan.window,
+                )
+            else:
+                engine = PSDEngine.from_config(
+                    scanner.sampling_config,
+                    sample_rate=scanner.sample_rate,
+                    window_size=scanner.window_size,
+                )
+            self._psd_engine = engine
+        return engine
+    @property
+    def num_hops(self):
+        if self.plan is not None:
+            return self.plan.num_hops
+        return len(self.sample_sets)
+    @property
+    def progress(self):
+        return self.scanner.scan_progress
+    def build_pipeline(self):
+        c = self.scanner.sampling_config
+        if not c.get('pipeline_processing'):
+            return None
+        return ProcessingPipeline(max_queued=c.get('processing_queue_size', 4))
+    def build_capture(self):
+        config = self.scanner.config
+        if not config.get('save_raw_values'):
+            return None
+        filename = config.get('raw_values_path')
+        if filename is None:
+            scan_range = config.scan_range
+            if self.plan is not None and self.plan.num_hops:
+                scan_range = self.plan.scan_range
+            filename = os.path.join(
+                os.path.dirname(db_store.DB_PATH), 'raw',
+                '{}_{:.3f}-{:.3f}.iq'.format(
+                    time.strftime('%Y%m%d-%H%M%S'), scan_range[0], scan_range[1],
+                ),
+            )
+        self.capture_filename = filename
+        return RawCaptureWriter(filename)
     def add_sample_set(self, sample_set):
         self.sample_sets[sample_set.center_frequency] = sample_set
     def build_sample_set(self, freq):
         sample_set = SampleSet(collection=self, center_frequency=freq)
         self.add_sample_set(sample_set)
         return sample_set
+    def iter_sample_sets(self):
+        if self.plan is None:
+            for key in sorted(self.sample_sets.keys()):
+                yield self.sample_sets[key]
+        else:
+            for freq in self.plan.iter_hops():
+                yield self.build_sample_set(freq)
     def scan_all_freqs(self):
-        self.scanning.set()
-        complete_events = set()
-        for key in sorted(self.sample_sets.keys()):
-            if not self.scanning.is_set():
-                break
-            sample_set = self.sample_sets[key]
-            sample_set.read_samples()
-            if not sample_set.complete.is_set():
-                complete_events.add(sample_set.complete)
-        if self.scanning.is_set():
-            for e in complete_events.copy():
-                if e.is_set():
-                    complete_events.discard(e)
-                else:
-                    e.wait()
-        self.scanning.clear()
-        self.stopped.set()
+        self._psd_engine = None
+        self.num_processed = 0
+        self.errors = []
+        self.progress.start(self.num_hops)
+        capture = self.capture = self.build_capture()
+        pipeline = None
+        try:
+            pipeline = self.pipeline = self.build_pipeline()
+            if pipeline is not None:
+                pipeline.start()
+            self.scanning.set()
+            complete_events = set()
+            for sample_set in self.iter_sample_sets():
+                if not self.scanning.is_set():
+                    break
+                sample_set.read_samples()
+                if not sample_set.complete.is_set():
+                    complete_events.add(sample_set.complete)
+            if self.scanning.is_set():
+                for e in complete_events.copy():
+                    if e.is_set():
+                        complete_events.discard(e)
+                    else:
+                        e.wait()
+        finally:
+            try:
+                if pipeline is not None:
+                    pipeline.stop()
+                    self.pipeline = None
+            finally:
+                if capture is not None:
+                    capture.close()
+                    self.capture = None
+                    logger.info('Raw values saved to {}'.format(self.capture_filename))
+                self.scanning.clear()
+                self.stopped.set()
+        progress = self.progress
+        logger.info(
+            '{} hops processed ({:.2f} hops/s, pipelined={}, per hop: '
+            'tune {:.2f}ms, read {:.2f}ms, dsp {:.2f}ms)'.format(
+                self.num_processed, progress.hops_per_second, pipeline is not None,
+                progress.mean_tune_time * 1e3, progress.mean_read_time * 1e3,
+                progress.mean_dsp_time * 1e3,
+            )
+        )
+        if self.errors:
+            # Raised once the pipeline has stopped so the other hops are kept
+            _, exc = self.errors[0]
+            raise exc
     def stop(self):
         if self.scanning.is_set():
             self.scanning.clear()
@@ -206,7 +363,17 @@ class SampleCollection(JSONMixin):
             self.scanning.clear()
             self.stopped.wait()
     def on_sample_set_processed(self, sample_set):
+        self.num_processed += 1
+        self.progress.add_hop(
+            sample_set.tune_time, sample_set.read_time, sample_set.dsp_time,
+        )
         self.scanner.on_sample_set_processed(sample_set)
+    def on_sample_set_error(self, sample_set, exc):
+        '''Records a hop that failed to process. The first error is raised
+        from :meth:`scan_all_freqs` at the end of the scan
+        '''
+        self.errors.append((sample_set.center_frequency, exc))
+        self.progress.add_failed_hop()
     def _serialize(self):
         return {'sample_sets':
             {k: v._serialize() for k, v in self.sample_sets.items()},
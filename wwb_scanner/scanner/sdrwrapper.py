@@ -1,11 +1,7 @@
 import threading
 import traceback
 
-from rtlsdr import RtlSdr
-try:
-    from rtlsdr import RtlSdrTcpClient
-except ImportError:
-    RtlSdrTcpClient = None
+from wwb_scanner.scanner.backends import get_source_class
 
 class SdrWrapper(object):
     def __init__(self, **kwargs):
@@ -52,28 +48,19 @@ class SdrWrapper(object):
                 else:
                     self.device_open.wait()
             if self.sdr is None:
-                if self.scanner.device_config.is_remote:
-                    self.sdr = self._open_sdr_remote()
-                else:
-                    self.sdr = self._open_sdr_local()
+                self.sdr = self._open_source()
                 if self.sdr is not None:
                     self.set_sdr_values()
                     self.device_open.set()
         return self.sdr
-    def _open_sdr_local(self):
-        serial_number = self.scanner.device_config.serial_number
+    def _open_source(self):
+        device_config = self.scanner.device_config
+        source_cls = get_source_class(device_config)
+        sdr = source_cls.from_device_config(device_config)
         try:
-            sdr = RtlSdr(serial_number=serial_number)
+            sdr.open()
         except IOError:
             sdr = None
-        return sdr
-    def _open_sdr_remote(self):
-        try:
-            if RtlSdrTcpClient is None:
-                raise Exception('Tcp client not available')
-            sdr = RtlSdrTcpClient(hostname=self.scanner.device_config.remote_hostname,
-                                  port=self.scanner.device_config.remote_port)
-            sdr.get_sample_rate()
         except:
             traceback.print_exc()
             sdr = None
@@ -0,0 +1,180 @@
+import numpy as np
+
+class MinMaxDecimator(object):
+    '''Reduces sorted (x, y) data to the points a plot of a given width can show
+
+    The visible x range is split into equal width buckets and only the
+    minimum and maximum of each bucket are kept (in x order), so a carrier
+    narrower than a bucket is never dropped. The nearest point on either
+    side of the view is kept as well so lines continue past the edges.
+
+    :meth:`set_view` and :meth:`set_data` recompute everything.
+    :meth:`update` only recomputes the buckets spanned by the part of the
+    data that changed.
+
+    If no :attr:`width` is set, the data is passed through as is.
+
+    attributes:
+        points_per_pixel: (int) number of output points per pixel of width
+        x: (numpy.ndarray) the source x values (sorted ascending)
+        y: (numpy.ndarray) the source y values
+        x_out: (numpy.ndarray) the decimated x values
+        y_out: (numpy.ndarray) the decimated y values
+    '''
+    def __init__(self, **kwargs):
+        self.points_per_pixel = kwargs.get('points_per_pixel', 2)
+        self.x = np.zeros(0, dtype=np.float64)
+        self.y = np.zeros(0, dtype=np.float64)
+        self.x_min = None
+        self.x_max = None
+        self.width = None
+        self.x_out = self.x
+        self.y_out = self.y
+        self._bucket_out = np.zeros(0, dtype=np.int64)
+    @property
+    def num_buckets(self):
+        if not self.width or self.x_min is None:
+            return 0
+        return max(int(self.width * self.points_per_pixel) // 2, 1)
+    @property
+    def enabled(self):
+        return self.num_buckets > 0
+    def set_view(self, x_min, x_max, width):
+        '''Sets the visible x range and its width in pixels and recomputes
+        the output
+        '''
+        if x_max < x_min:
+            x_min, x_max = x_max, x_min
+        self.x_min = x_min
+        self.x_max = x_max
+        self.width = width
+        return self.reset()
+    def set_data(self, x, y):
+        self.x = x
+        self.y = y
+        return self.reset()
+    def reset(self):
+        '''Recomputes all of the output and returns ``(x_out, y_out)``
+        '''
+        if not self.enabled:
+            self.x_out = self.x
+            self.y_out = self.y
+            self._bucket_out = np.zeros(0, dtype=np.int64)
+        else:
+            nb = self.num_buckets
+            i0 = self._bucket_start(-1)
+            i1 = self._bucket_stop(nb)
+            self.x_out, self.y_out, self._bucket_out = self._reduce(i0, i1)
+        return self.x_out, self.y_out
+    def update(self, x, y, start, stop):
+        '''Replaces the source data after the items from *start* to *stop*
+        (exclusive) changed
+
+        Only the buckets between ``x[start]`` and ``x[stop-1]`` are
+        recomputed. Returns the ``(start, stop)`` range of the output that
+        changed. If the number of output points changed, everything after
+        *start* is included.
+        '''
+        self.x = x
+        self.y = y
+        if not self.enabled:
+            self.x_out = x
+            self.y_out = y
+            return start, stop
+        num_out = self.x_out.size
+        stop = min(stop, x.size)
+        if start >= stop:
+            return num_out, num_out
+        b0, b1 = self._bucket_ids(x[[start, stop-1]])
+        i0 = self._bucket_start(b0)
+        i1 = self._bucket_stop(b1)
+        x_new, y_new, bucket_new = self._reduce(i0, i1)
+        bucket_out = self._bucket_out
+        o0 = int(np.searchsorted(bucket_out, b0, side='left'))
+        o1 = int(np.searchsorted(bucket_out, b1, side='right'))
+        if x_new.size == o1 - o0:
+            self.x_out = self.x_out.copy()
+            self.y_out = self.y_out.copy()
+            self.x_out[o0:o1] = x_new
+            self.y_out[o0:o1] = y_new
+            return o0, o1
+        self.x_out = np.concatenate([self.x_out[:o0], x_new, self.x_out[o1:]])
+        self.y_out = np.concatenate([self.y_out[:o0], y_new, self.y_out[o1:]])
+        self._bucket_out = np.concatenate([bucket_out[:o0], bucket_new, bucket_out[o1:]])
+        return o0, self.x_out.size
+    def _bucket_ids(self, x):
+        # Buckets in view are numbered 0 to num_buckets-1. Points before the
+        # view are in bucket -1 and points after it in bucket num_buckets
+        nb = self.num_buckets
+        x_min, x_max = self.x_min, self.x_max
+        span = x_max - x_min
+        if span > 0:
+            b = np.floor((x - x_min) * (nb / span)).astype(np.int64)
+        else:
+            b = np.zeros(x.shape, dtype=np.int64)
+        b = np.clip(b, 0, nb - 1)
+        b[x < x_min] = -1
+        b[x > x_max] = nb
+        return b
+    def _bucket_start(self, bucket):
+        '''Index of the first source point in *bucket* (or a later one)
+        '''
+        x = self.x
+        nb = self.num_buckets
+        if bucket < 0:
+            return max(int(np.searchsorted(x, self.x_min, side='left')) - 1, 0)
+        if bucket >= nb:
+            return int(np.searchsorted(x, self.x_max, side='right'))
+        edge = self.x_min + (self.x_max - self.x_min) * bucket / nb
+        ix = int(np.searchsorted(x, edge, side='left'))
+        # The edge is only an estimate of where floor() in _bucket_ids
+        # switches buckets, so check the neighbors
+        while ix > 0 and self._bucket_ids(x[ix-1:ix])[0] >= bucket:
+            ix -= 1
+        while ix < x.size and self._bucket_ids(x[ix:ix+1])[0] < bucket:
+            ix += 1
+        return ix
+    def _bucket_stop(self, bucket):
+        '''Index after the last source point in *bucket*
+        '''
+        nb = self.num_buckets
+        if bucket >= nb:
+            return min(self._bucket_start(nb) + 1, self.x.size)
+        return self._bucket_start(bucket + 1)
+    def _reduce(self, i0, i1):
+        '''Returns the output points and their bucket ids for the whole
+        buckets in ``x[i0:i1]``
+        '''
+        x = self.x[i0:i1]
+        y = self.y[i0:i1]
+        if not x.size:
+            return x, y, np.zeros(0, dtype=np.int64)
+        nb = self.num_buckets
+        b = self._bucket_ids(x)
+        seg_starts = np.r_[0, np.flatnonzero(np.diff(b)) + 1]
+        seg_stops = np.r_[seg_starts[1:], b.size]
+        seg_b = b[seg_starts]
+        seg_id = np.repeat(np.arange(seg_starts.size), seg_stops - seg_starts)
+
+        yf = np.where(np.isnan(y), -np.inf, y)
+        min_ix = self._first_match(yf, np.minimum.reduceat(yf, seg_starts), seg_id)
+        max_ix = self._first_match(yf, np.maximum.reduceat(yf, seg_starts), seg_id)
+
+        # Outside of the view only the point nearest to it matters
+        left = seg_b < 0
+        min_ix[left] = max_ix[left] = seg_stops[left] - 1
+        right = seg_b >= nb
+        min_ix[right] = max_ix[right] = seg_starts[right]
+
+        ix = np.empty(seg_starts.size * 2, dtype=np.int64)
+        ix[0::2] = np.minimum(min_ix, max_ix)
+        ix[1::2] = np.maximum(min_ix, max_ix)
+        bucket = np.repeat(seg_b, 2)
+        keep = np.r_[True, ix[1:] != ix[:-1]]
+        ix = ix[keep]
+        return x[ix], y[ix], bucket[keep]
+    @staticmethod
+    def _first_match(y, seg_values, seg_id):
+        ix = np.flatnonzero(y == seg_values[seg_id])
+        _, first = np.unique(seg_id[ix], return_index=True)
+        return ix[first]
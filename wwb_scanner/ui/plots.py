@@ -3,6 +3,7 @@ import matplotlib.pyplot as plt
 
 from wwb_scanner.scan_objects.spectrum import compare_spectra
 from wwb_scanner.file_handlers import BaseImporter
+from wwb_scanner.ui.decimate import MinMaxDecimator
 
 class BasePlot(object):
     def __init__(self, **kwargs):
@@ -11,6 +12,7 @@ class BasePlot(object):
             self.spectrum = BaseImporter.import_file(self.filename)
         else:
             self.spectrum = kwargs.get('spectrum')
+        self.decimator = MinMaxDecimator()
 
         #self.figure.canvas.mpl_connect('idle_event', self.on_idle)
 
@@ -36,27 +38,28 @@ class BasePlot(object):
         #self.timer.add_callback(self.on_timer)
     def on_timer(self):
         print('timer')
-        spectrum = self.spectrum
-        with spectrum.data_update_lock:
-            if spectrum.data_updated.is_set():
-                print('update plot')
-                self.update_plot()
-                spectrum.data_updated.clear()
+        snapshot = self.spectrum.snapshot
+        if snapshot.version != getattr(self, '_spectrum_version', None):
+            print('update plot')
+            self.update_plot()
     def build_data(self):
-        dtype = np.dtype(float)
-        if not len(self.spectrum.samples):
+        snapshot = self.spectrum.snapshot
+        self._spectrum_version = snapshot.version
+        if not snapshot.size:
             x = self.x = np.array(0.)
             y = self.y = np.array(0.)
         else:
-            x = self.x = np.fromiter(self.spectrum.iter_frequencies(), dtype)
-            y = self.y = np.fromiter((s.magnitude for s in self.spectrum.iter_samples()), dtype)
-            if not hasattr(self, 'plot'):
-                self.spectrum.data_updated.clear()
+            x = self.x = snapshot.frequency
+            y = self.y = snapshot.magnitude
         return x, y
+    def decimate(self, x, y):
+        if not x.ndim:
+            return x, y
+        return self.decimator.set_data(x, y)
     def update_plot(self):
         if not hasattr(self, 'plot'):
             return
-        x, y = self.build_data()
+        x, y = self.decimate(*self.build_data())
         self.plot.set_xdata(x)
         self.plot.set_ydata(y)
         #self.figure.canvas.draw_event(self.figure.canvas)
@@ -67,17 +70,32 @@ class BasePlot(object):
 class SpectrumPlot(BasePlot):
     def build_plot(self):
         self.figure = plt.figure()
-        self.plot = plt.plot(*self.build_data())[0]
+        ax = self.figure.gca()
+        x, y = self.build_data()
+        if x.ndim and x.size:
+            self.decimator.set_view(x.min(), x.max(), ax.get_window_extent().width)
+        self.plot = plt.plot(*self.decimate(x, y))[0]
+        ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
         plt.xlabel('frequency (MHz)')
         plt.ylabel('dBm')
-        center_frequencies = self.spectrum.center_frequencies
-        if len(center_frequencies):
-            samples = [self.spectrum.samples.get(f) for f in center_frequencies]
+        sample_data = self.spectrum.sample_data
+        ix = [sample_data.index_of(f) for f in self.spectrum.center_frequencies]
+        ix = np.array([i for i in ix if i is not None], dtype=int)
+        if ix.size:
+            center_frequencies = sample_data['frequency'][ix]
+            m = sample_data['magnitude'][ix]
             ymin = self.y.min()
             plt.vlines(center_frequencies,
-                       [ymin] * len(center_frequencies),
-                       [s.magnitude-5 if s.magnitude-5 > ymin else s.magnitude for s in samples])
+                       np.full(ix.size, ymin),
+                       np.where(m - 5 > ymin, m - 5, m))
         plt.show()
+    def on_xlim_changed(self, ax):
+        if not self.x.ndim:
+            return
+        x_min, x_max = ax.get_xlim()
+        x, y = self.decimator.set_view(x_min, x_max, ax.get_window_extent().width)
+        self.plot.set_data(x, y)
+        self.figure.canvas.draw_idle()
 
 class DiffSpectrum(object):
     def __init__(self, **kwargs):
@@ -91,15 +109,14 @@ class DiffSpectrum(object):
             spectrum = BaseImporter.import_file(kwargs.get('filename'))
         self.spectra.append({'name':name, 'spectrum':spectrum})
     def build_plots(self):
-        dtype = np.dtype(float)
         if len(self.spectra) == 2:
             diff_spec = compare_spectra(self.spectra[0]['spectrum'],
                                         self.spectra[1]['spectrum'])
             self.spectra.append({'name':'diff', 'spectrum':diff_spec})
         for i, spec_data in enumerate(self.spectra):
             spectrum = spec_data['spectrum']
-            x = np.fromiter(spectrum.iter_frequencies(), dtype)
-            y = np.fromiter((s.magnitude for s in spectrum.iter_samples()), dtype)
+            x = spectrum.sample_data['frequency']
+            y = spectrum.sample_data['magnitude']
             axes = self.axes[i]
             axes.plot(x, y)
             axes.set_title(spec_data['name'])
@@ -8,7 +8,8 @@ from PySide2.QtCharts import QtCharts
 
 from wwb_scanner.file_handlers import BaseImporter
 from wwb_scanner.scan_objects.spectrum import Spectrum
-from wwb_scanner.ui.pyside.utils import IntervalTimer, is_pathlike
+from wwb_scanner.ui.decimate import MinMaxDecimator
+from wwb_scanner.ui.pyside.utils import FrameCoalescer, is_pathlike
 
 GRAPH_DTYPE = np.dtype([
     ('x', np.float64),
@@ -26,7 +27,8 @@ class GraphPoint(QtCore.QPointF):
 
 class GraphTableModel(QtCore.QAbstractTableModel):
     def __init__(self, *args):
-        self._data = np.zeros((2,0), dtype=np.float64)
+        self._buffer = np.zeros((2,0), dtype=np.float64)
+        self._data = self._buffer
         super().__init__(*args)
     def columnCount(self, parent):
         return self._data.shape[1]
@@ -39,54 +41,70 @@ class GraphTableModel(QtCore.QAbstractTableModel):
             return float(self._data[index.row(), index.column()])
         return QtCore.QVariant()
     def _reshape_data(self, d_arr):
-        new_shape = (2, d_arr.size)
-        cur_shape = self._data.shape
-        parent = QtCore.QModelIndex()
-        if cur_shape[-1] > new_shape[-1]:
-            start_col = cur_shape[-1] - 1
-            end_col = new_shape[-1] - 1
-            ix = self.index(0, 0)
-            parent = ix
-            self.beginRemoveColumns(parent, start_col, end_col)
-            self._data = self._data[...,:end_col+1]
+        num_cols = self._data.shape[-1]
+        if num_cols > d_arr.size:
+            parent = QtCore.QModelIndex()
+            self.beginRemoveColumns(parent, d_arr.size, num_cols - 1)
+            self._data = self._buffer[:,:d_arr.size]
             self.endRemoveColumns()
-        elif cur_shape[-1] < new_shape[-1]:
-            start_col = cur_shape[-1]
-            end_col = new_shape[-1] - 1
-            ix = self.index(0, 0)
-            self.beginInsertColumns(parent, start_col, end_col)
-            data = np.zeros(new_shape, dtype=np.float64)
-            data[:,:start_col] = self._data[:,:]
-            data[0,start_col:] = d_arr['x'][start_col:]
-            data[1,start_col:] = d_arr['y'][start_col:]
-            self._data = data
-            self.endInsertColumns()
+        elif num_cols < d_arr.size:
+            self._insert_columns(d_arr)
+    def _insert_columns(self, d_arr):
+        # Columns are only ever added at the end. The buffer grows by
+        # doubling so appending a hop doesn't copy the existing data
+        start_col = self._data.shape[-1]
+        end_col = d_arr.size - 1
+        parent = QtCore.QModelIndex()
+        self.beginInsertColumns(parent, start_col, end_col)
+        capacity = self._buffer.shape[-1]
+        if d_arr.size > capacity:
+            buf = np.zeros((2, max(d_arr.size, capacity * 2)), dtype=np.float64)
+            buf[:,:start_col] = self._data
+            self._buffer = buf
+        data = self._data = self._buffer[:,:d_arr.size]
+        data[0,start_col:] = d_arr['x'][start_col:]
+        data[1,start_col:] = d_arr['y'][start_col:]
+        self.endInsertColumns()
 
     def set_from_graph_dtype(self, d_arr):
         if d_arr.size != self._data.shape[-1]:
             self._reshape_data(d_arr)
-            x_changed = True
-            y_changed = True
-        else:
-            x_changed = not np.array_equal(self._data[0], d_arr['x'])
-            y_changed = not np.array_equal(self._data[1], d_arr['y'])
-        if not x_changed and not y_changed:
-            return
         data = self._data
 
-        change_ix_x = np.flatnonzero(np.not_equal(data[0], d_arr['x']))
-        change_ix_y = np.flatnonzero(np.not_equal(data[1], d_arr['y']))
-
-        change_ix = set(change_ix_x) | set(change_ix_y)
+        changed = np.not_equal(data[0], d_arr['x'])
+        changed |= np.not_equal(data[1], d_arr['y'])
+        change_ix = np.flatnonzero(changed)
 
-        if not len(change_ix):
+        if not change_ix.size:
             return
 
         data[0] = d_arr['x']
         data[1] = d_arr['y']
 
-        tl = self.index(0, min(change_ix))
-        br = self.index(data.shape[0]-1, max(change_ix))
+        tl = self.index(0, int(change_ix[0]))
+        br = self.index(data.shape[0]-1, int(change_ix[-1]))
+        self.dataChanged.emit(tl, br)
+
+    def update_from_graph_dtype(self, d_arr, start, stop):
+        '''Applies only columns *start* through *stop* (exclusive) of *d_arr*
+
+        Columns past the current end are inserted and the rest of the range
+        is reported with a single :attr:`dataChanged` span.
+        '''
+        num_cols = self._data.shape[-1]
+        if d_arr.size < num_cols:
+            self.set_from_graph_dtype(d_arr)
+            return
+        if d_arr.size > num_cols:
+            self._insert_columns(d_arr)
+        stop = min(stop, num_cols)
+        if start >= stop:
+            return
+        data = self._data
+        data[0,start:stop] = d_arr['x'][start:stop]
+        data[1,start:stop] = d_arr['y'][start:stop]
+        tl = self.index(0, start)
+        br = self.index(data.shape[0]-1, stop-1)
         self.dataChanged.emit(tl, br)
 
 class SpectrumGraphData(QtQuick.QQuickItem):
@@ -99,10 +117,13 @@ class SpectrumGraphData(QtQuick.QQuickItem):
     _n_graphVisible = Signal()
     def __init__(self, *args):
         self.xy_data = np.zeros(0, dtype=GRAPH_DTYPE)
+        self.decimator = MinMaxDecimator()
         self._min_value = QtCore.QPointF(0., 0.)
         self._max_value = QtCore.QPointF(0., 0.)
         self._model = None
         self._spectrum = None
+        self._spectrum_version = None
+        self._y_extent_ix = None
         self._name = None
         self._color = None
         self._graphVisible = True
@@ -166,6 +187,8 @@ class SpectrumGraphData(QtQuick.QQuickItem):
         if value == self._spectrum:
             return
         self._spectrum = value
+        self._spectrum_version = None
+        self._y_extent_ix = None
         self._n_spectrum.emit()
         if value is not None:
             if self.name is None:
@@ -200,41 +223,105 @@ class SpectrumGraphData(QtQuick.QQuickItem):
     def update_spectrum_data(self):
         if self.spectrum is None:
             return
-        if not self.spectrum.data_updated.is_set():
+        snapshot = self.spectrum.snapshot
+        if snapshot.version == self._spectrum_version:
+            return
+        start, stop = snapshot.changed_range(self._spectrum_version)
+        self._spectrum_version = snapshot.version
+        if not snapshot.size:
             return
-        self._update_data_from_spectrum()
+        start, stop = self._update_data_from_spectrum(snapshot, start, stop)
+        self._set_series_from_data(start, stop)
+
+    def _update_data_from_spectrum(self, snapshot, start=0, stop=None):
+        size = snapshot.size
+        if stop is None:
+            stop = size
+        xy_data = self.xy_data
+        if xy_data.size != size:
+            start = min(start, xy_data.size)
+            stop = size
+            xy_data = np.zeros(size, dtype=GRAPH_DTYPE)
+            xy_data[:start] = self.xy_data[:start]
+        changed = snapshot.get_range(start, stop)
+        xy_data['x'][start:stop] = changed['frequency_hz'] / 1e6
+        y = xy_data['y'][start:stop]
+        y[:] = changed['dbFS']
+        y[np.isnan(y)] = -110
+        self.xy_data = xy_data
+        self._update_extents(start, stop)
+        return start, stop
+
+    def _update_y_extents(self, start=0, stop=None):
+        '''Finds the min and max of the y values after the ``[start:stop]``
+        range has changed
+
+        The indices of the extremes are kept so only the changed range needs
+        to be searched, unless one of them was inside it (its value may
+        have been lowered or raised).
+        '''
+        y = self.xy_data['y']
+        size = y.size
+        if stop is None:
+            stop = size
+        extent_ix = self._y_extent_ix
+        if extent_ix is not None:
+            for ix in extent_ix:
+                if ix >= size or start <= ix < stop:
+                    extent_ix = None
+                    break
+        if extent_ix is None:
+            min_ix, max_ix = y.argmin(), y.argmax()
+        else:
+            min_ix, max_ix = extent_ix
+            if stop > start:
+                changed = y[start:stop]
+                ix = changed.argmin() + start
+                if y[ix] < y[min_ix]:
+                    min_ix = ix
+                ix = changed.argmax() + start
+                if y[ix] > y[max_ix]:
+                    max_ix = ix
+        self._y_extent_ix = (min_ix, max_ix)
+        return y[min_ix], y[max_ix]
+
+    def _update_extents(self, start=0, stop=None):
+        x = self.xy_data['x']
+        min_y, max_y = self._update_y_extents(start, stop)
+        self.minValue = QtCore.QPointF(x[0], min_y)
+        self.maxValue = QtCore.QPointF(x[-1], max_y)
+
+    @Slot(float, float, float)
+    def set_view(self, x_min, x_max, width):
+        '''Sets the visible frequency range and plot width (in pixels) used
+        to decimate the data sent to the model
+        '''
+        self.decimator.set_view(x_min, x_max, width)
         self._set_series_from_data()
 
-    def _update_data_from_spectrum(self):
-        spectrum = self.spectrum
-        dtype = np.dtype(float)
-        with spectrum.data_update_lock:
-            xy_data = np.zeros(spectrum.sample_data.size, dtype=GRAPH_DTYPE)
-            data = spectrum.sample_data.data
-            xy_data['x'] = data['frequency']
-            freqmin = xy_data['x'].min()
-            freqmax = xy_data['x'].max()
-            xy_data['y'] = spectrum.sample_data.data['dbFS']
-            nan_ix = np.flatnonzero(np.isnan(xy_data['y']))
-            xy_data['y'][nan_ix] = -110
-            self.xy_data = xy_data
-            spectrum.data_updated.clear()
-        self._update_extents()
-
-    def _update_extents(self):
-        self.minValue = QtCore.QPointF(self.xy_data['x'].min(), self.xy_data['y'].min())
-        self.maxValue = QtCore.QPointF(self.xy_data['x'].max(), self.xy_data['y'].max())
-
-    def _set_series_from_data(self):
+    def _set_series_from_data(self, start=None, stop=None):
         if self.model is None:
             return
-        self.model.set_from_graph_dtype(self.xy_data)
+        decimator = self.decimator
+        xy_data = self.xy_data
+        if start is None:
+            x, y = decimator.set_data(xy_data['x'], xy_data['y'])
+        else:
+            start, stop = decimator.update(xy_data['x'], xy_data['y'], start, stop)
+            x, y = decimator.x_out, decimator.y_out
+        if decimator.enabled:
+            xy_data = np.zeros(x.size, dtype=GRAPH_DTYPE)
+            xy_data['x'] = x
+            xy_data['y'] = y
+        if start is None:
+            self.model.set_from_graph_dtype(xy_data)
+        else:
+            self.model.update_from_graph_dtype(xy_data, start, stop)
 
     @Slot(QtCore.QUrl)
     def load_from_file(self, uri):
         filename = uri.toLocalFile()
         spectrum = BaseImporter.import_file(filename)
-        spectrum.set_data_updated()
         self.spectrum = spectrum
         self.update_spectrum_data()
 
@@ -244,16 +331,14 @@ class SpectrumGraphData(QtQuick.QQuickItem):
         self.spectrum.export_to_file(filename=filename)
 
 class LiveSpectrumGraphData(SpectrumGraphData):
-    _n_update_interval = Signal()
-    _n_update_timer = Signal()
     _n_scanner = Signal()
     updateSpectrumData = Signal()
     def __init__(self, *args):
-        self._update_interval = None
-        self._update_timer = None
         self._scanner = None
         super().__init__(*args)
-        self.updateSpectrumData.connect(self.update_spectrum_data)
+        self.update_coalescer = FrameCoalescer(self)
+        self.update_coalescer.trigger.connect(self.update_spectrum_data)
+        self.updateSpectrumData.connect(self.update_coalescer.request)
 
     def _g_scanner(self): return self._scanner
     def _s_scanner(self, value):
@@ -261,67 +346,35 @@ class LiveSpectrumGraphData(SpectrumGraphData):
             return
         if self._scanner is not None:
             self._scanner.disconnect(self)
+            self._scanner.spectrumUpdated.disconnect(self.update_coalescer.request)
         self._scanner = value
         self._n_scanner.emit()
         if self._scanner is not None:
             self.spectrum = self._scanner.spectrum
             self._scanner.scannerRunState.connect(self.on_scanner_run_state)
-            self.update_interval = .1
+            self._scanner.spectrumUpdated.connect(self.update_coalescer.request)
         else:
-            self.update_interval = -1
+            self.update_coalescer.cancel()
     scanner = Property(QtCore.QObject, _g_scanner, _s_scanner, notify=_n_scanner)
 
     def on_scanner_run_state(self, state):
         if self.scanner is None:
             return
         if not self.scanner.running:
-            self.update_interval = -1
+            self.update_coalescer.cancel()
             if self.spectrum is not None:
-                with self.spectrum.data_update_lock:
-                    self.spectrum.set_data_updated()
-                    self.update_spectrum_data()
+                self.update_spectrum_data()
             self.scanner = None
 
-    def _g_update_interval(self): return self._update_interval
-    def _s_update_interval(self, value):
-        if value == self._update_interval:
-            return
-        self._update_interval = value
-        if self.update_timer is not None:
-            self.update_timer.stop.emit()
-        if value is not None and value > 0:
-            ms = int(round(value * 1000))
-            if self.update_timer is None:
-                self.update_timer = IntervalTimer(interval_ms=ms)
-                self.update_timer.trigger.connect(self.on_update_timer_trigger)
-            else:
-                self.update_timer.interval_ms = ms
-            self.update_timer.start.emit()
-        self._n_update_interval.emit()
-    update_interval = Property(float, _g_update_interval, _s_update_interval, notify=_n_update_interval)
-
-    def _g_update_timer(self): return self._update_timer
-    def _s_update_timer(self, value):
-        self._update_timer = value
-        self._n_update_timer.emit()
-    update_timer = Property(QtCore.QObject, _g_update_timer, _s_update_timer, notify=_n_update_timer)
-
-    def on_update_timer_trigger(self, *args):
-        self.updateSpectrumData.emit()
-
-    def _update_extents(self):
+    def _update_extents(self, start=0, stop=None):
+        x = self.xy_data['x']
+        min_x, max_x = x[0], x[-1]
         if self.scanner is not None:
-            min_x = self.scanner.startFreq
-            if self.xy_data.size and self.xy_data['x'].min() < min_x:
-                min_x = self.xy_data['x'].min()
-            max_x = self.scanner.endFreq
-            if self.xy_data.size and self.xy_data['x'].max() > max_x:
-                max_x = self.xy_data['x'].max()
-        else:
-            min_x = self.xy_data['x'].min()
-            max_x = self.xy_data['y'].max()
-        self.minValue = QtCore.QPointF(min_x, self.xy_data['y'].min())
-        self.maxValue = QtCore.QPointF(max_x, self.xy_data['y'].max())
+            min_x = min(min_x, self.scanner.startFreq)
+            max_x = max(max_x, self.scanner.endFreq)
+        min_y, max_y = self._update_y_extents(start, stop)
+        self.minValue = QtCore.QPointF(min_x, min_y)
+        self.maxValue = QtCore.QPointF(max_x, max_y)
 
 def register_qml_types():
     QtQml.qmlRegisterType(GraphTableModel, 'GraphUtils', 1, 0, 'GraphTableModel')
@@ -13,12 +13,13 @@ from PySide2.QtWidgets import QApplication
 from PySide2.QtQuick import QQuickView
 
 from wwb_scanner.ui.pyside import get_resource_filename
-from wwb_scanner.ui.pyside import device_config, graph, scanner
+from wwb_scanner.ui.pyside import device_config, graph, scanner, waterfall
 
 def register_qml_types():
     device_config.register_qml_types()
     graph.register_qml_types()
     scanner.register_qml_types()
+    waterfall.register_qml_types()
 
 QML_PATH = get_resource_filename('qml')
 
@@ -58,6 +59,9 @@ def run(argv=None):
     engine.setBaseUrl(str(QML_PATH))
     engine.addImportPath(str(QML_PATH))
     register_qml_types()
+    engine.addImageProvider(
+        waterfall.WaterfallImageProvider.provider_name, waterfall.image_provider,
+    )
     qml_main = QML_PATH / 'main.qml'
     engine.load(str(qml_main))
     win = engine.rootObjects()[0]
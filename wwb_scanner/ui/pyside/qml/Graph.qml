@@ -7,13 +7,14 @@ import GraphUtils 1.0
 
 Item {
     id: root
-    anchors.fill: parent
 
     property alias mouseDataPoint: crosshair.dataValue
     property alias theme: chart.theme
     property var spectrumGraphs: []
     property var activeSpectrum
     property alias activeSeries: chart.activeSeries
+    property alias viewAxisX: axisX
+    property real plotWidth: chart.plotArea.width
     signal newLiveScan(var scanner)
     signal loadFromFile(url fileName)
     signal updateAxisExtents()
@@ -74,6 +74,27 @@ Item {
     onMinValueChanged: { axisExtentsUpdate() }
     onMaxValueChanged: { axisExtentsUpdate() }
 
+    function updateView(){
+        if (!root.graphParent){
+            return;
+        }
+        var axis = root.graphParent.viewAxisX;
+        graphData.set_view(axis.min, axis.max, root.graphParent.plotWidth);
+    }
+
+    Component.onCompleted: { updateView() }
+
+    Connections {
+        target: root.graphParent ? root.graphParent.viewAxisX : null
+        function onMinChanged() { root.updateView() }
+        function onMaxChanged() { root.updateView() }
+    }
+
+    Connections {
+        target: root.graphParent
+        function onPlotWidthChanged() { root.updateView() }
+    }
+
     function save_to_file(fileName){
         graphData.save_to_file(fileName);
     }
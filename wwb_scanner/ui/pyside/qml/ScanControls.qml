@@ -11,6 +11,8 @@ RowLayout {
     property bool scanRunning: false
     property bool scanReady: !root.scanRunning
     property alias progress: progressBar.value
+    property alias progressText: progressLabel.text
+    property alias continuous: continuousCheck.checked
 
     signal scannerState(bool state)
 
@@ -52,11 +54,24 @@ RowLayout {
 
     ToolSeparator { }
 
+    CheckBox {
+        id: continuousCheck
+        text: 'Continuous'
+        enabled: root.scanReady
+    }
+
     Item {
         Layout.fillWidth: true
         Layout.fillHeight: true
     }
 
+    Label {
+        id: progressLabel
+        visible: root.scanRunning
+        font.pointSize: 9
+        verticalAlignment: Text.AlignVCenter
+    }
+
     ProgressBar {
         id: progressBar
         visible: root.scanRunning
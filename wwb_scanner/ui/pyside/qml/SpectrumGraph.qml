@@ -72,6 +72,27 @@ Item {
     onMinValueChanged: { axisExtentsUpdate() }
     onMaxValueChanged: { axisExtentsUpdate() }
 
+    function updateView(){
+        if (!root.graphParent){
+            return;
+        }
+        var axis = root.graphParent.viewAxisX;
+        graphData.set_view(axis.min, axis.max, root.graphParent.plotWidth);
+    }
+
+    Component.onCompleted: { updateView() }
+
+    Connections {
+        target: root.graphParent ? root.graphParent.viewAxisX : null
+        function onMinChanged() { root.updateView() }
+        function onMaxChanged() { root.updateView() }
+    }
+
+    Connections {
+        target: root.graphParent
+        function onPlotWidthChanged() { root.updateView() }
+    }
+
     function load_from_file(fileName){
         graphData.load_from_file(fileName);
     }
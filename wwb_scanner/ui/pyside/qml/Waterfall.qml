@@ -0,0 +1,33 @@
+import QtQuick 2.0
+import GraphUtils 1.0
+
+Item {
+    id: root
+
+    property alias scanner: waterfallData.scanner
+    property alias minDB: waterfallData.minDB
+    property alias maxDB: waterfallData.maxDB
+    property alias numRows: waterfallData.numRows
+
+    function clear(){
+        waterfallData.clear();
+    }
+
+    WaterfallData {
+        id: waterfallData
+    }
+
+    Rectangle {
+        anchors.fill: parent
+        color: 'black'
+    }
+
+    Image {
+        id: image
+        anchors.fill: parent
+        source: waterfallData.imageSource
+        cache: false
+        smooth: false
+        fillMode: Image.Stretch
+    }
+}
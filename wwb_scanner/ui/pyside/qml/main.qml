@@ -63,6 +63,7 @@ ApplicationWindow {
             anchors.fill: parent
             config: scanConfig
             progress: scanner.progress
+            progressText: scanner.progressText
             onScannerState: {
                 if (state) {
                     scanner.start();
@@ -102,10 +103,24 @@ ApplicationWindow {
 
     StackView {
         anchors.fill: parent
-        Graph {
-            id: chartWrapper
+        ColumnLayout {
             anchors.fill: parent
-            theme: themeSelect.theme
+            spacing: 0
+            Graph {
+                id: chartWrapper
+                Layout.fillWidth: true
+                Layout.fillHeight: true
+                theme: themeSelect.theme
+            }
+            Waterfall {
+                id: waterfall
+                Layout.fillWidth: true
+                Layout.preferredHeight: parent.height * .3
+                visible: scanner.continuous || waterfall.numRows > 0
+                scanner: scanner
+                minDB: scanConfig.scalingMinDB
+                maxDB: scanConfig.scalingMaxDB
+            }
         }
     }
 
@@ -144,6 +159,7 @@ ApplicationWindow {
         deviceInfo: device_config.device ? device_config.device: null
         gain: device_config.gain
         sampleRate: device_config.sampleRate
+        continuous: scanControls.continuous
         onScannerRunState: {
             scanControls.scanRunning = scanner.running;
         }
@@ -8,9 +8,9 @@ import logging
 logger = logging.getLogger(__name__)
 
 from wwb_scanner.scanner import config
-from wwb_scanner.scanner import Scanner
-from wwb_scanner.scanner.main import get_freq_resolution
-from wwb_scanner.scan_objects import Spectrum
+from wwb_scanner.scanner.main import ThreadedScanner, get_freq_resolution
+from wwb_scanner.scan_objects import Spectrum, SpectrumHistory
+from wwb_scanner.ui.waterfall import WaterfallBuffer
 
 from wwb_scanner.ui.pyside.utils import GenericQObject, QObjectThread
 
@@ -102,8 +102,12 @@ class ScannerInterface(GenericQObject):
     _n_sampleRate = Signal()
     _n_spectrum = Signal()
     _n_progress = Signal()
+    _n_progressText = Signal()
+    _n_continuous = Signal()
     _n_scannerInitialized = Signal()
     scannerRunState = Signal(bool)
+    spectrumUpdated = Signal(int)
+    historyUpdated = Signal(float)
     def __init__(self, *args):
         self._running = False
         self._scanConfig = None
@@ -113,9 +117,13 @@ class ScannerInterface(GenericQObject):
         self._spectrum = None
         self._scannerInitialized = False
         self._progress = -1
+        self._progressText = ''
+        self._continuous = False
         super().__init__(*args)
         self.scanner = None
         self.scan_thread = None
+        # Only as many sweeps as the waterfall can show are kept
+        self.history = SpectrumHistory(max_rows=WaterfallBuffer.DEFAULT_HEIGHT)
 
     @property
     def startFreq(self): return self.scanConfig.startFreq
@@ -160,6 +168,14 @@ class ScannerInterface(GenericQObject):
     def _s_progress(self, value): self._generic_setter('_progress', value)
     progress = Property(float, _g_progress, _s_progress, notify=_n_progress)
 
+    def _g_progressText(self): return self._progressText
+    def _s_progressText(self, value): self._generic_setter('_progressText', value)
+    progressText = Property(str, _g_progressText, _s_progressText, notify=_n_progressText)
+
+    def _g_continuous(self): return self._continuous
+    def _s_continuous(self, value): self._generic_setter('_continuous', value)
+    continuous = Property(bool, _g_continuous, _s_continuous, notify=_n_continuous)
+
     def build_scan_config(self):
         conf = config.ScanConfig()
         conf.scan_range = [self.startFreq, self.endFreq]
@@ -191,15 +207,30 @@ class ScannerInterface(GenericQObject):
     def _start(self):
         self.scannerInitialized = False
         conf = self.build_scan_config()
-        self.scanner = Scanner(config=conf)
+        # Each scan is added to the history (and the waterfall). In
+        # continuous mode scans repeat until stopped and aren't saved
+        kw = dict(config=conf, history=self.history, scan_wait_timeout=0.)
+        if self.continuous:
+            kw.update(run_once=False, autosave=False)
+        self.scanner = ThreadedScanner(**kw)
         self.spectrum = self.scanner.spectrum
         self.spectrum.name = f'{self.startFreq} - {self.endFreq} (live)'
         self.progress = 0.
+        self.progressText = ''
         self.running = True
-        self.scan_thread = ScanThread(target=self.scanner.run_scan)
+        self.scan_thread = ScanThread(target=self.scanner.run)
         self.scanner.on_progress = self.scan_thread._on_scanner_progress
+        self.scanner.on_spectrum_updated = self.scan_thread._on_spectrum_updated
+        self.scanner.on_history_row = self.scan_thread._on_history_row
         self.scan_thread.complete.connect(self.on_scanner_finished)
         self.scan_thread.scannerProgress.connect(self.on_scanner_progress)
+        self.scan_thread.scannerProgressText.connect(self.on_scanner_progress_text)
+        self.scan_thread.spectrumUpdated.connect(
+            self.spectrumUpdated, QtCore.Qt.QueuedConnection,
+        )
+        self.scan_thread.historyUpdated.connect(
+            self.historyUpdated, QtCore.Qt.QueuedConnection,
+        )
         self.scan_init_thread = QObjectThread(target=self.scanner._running.wait)
         self.scan_init_thread.complete.connect(self.on_scanner_ready)
         self.scan_thread.start()
@@ -207,6 +238,8 @@ class ScannerInterface(GenericQObject):
 
     def _stop(self):
         if self.scanner is not None:
+            self.scanner.stopping.set()
+            self.scanner.waiting.set()
             if self.scanner._running.is_set():
                 self.scanner.stop_scan()
 
@@ -214,6 +247,10 @@ class ScannerInterface(GenericQObject):
     def on_scanner_progress(self, value):
         self.progress = value
 
+    @Slot()
+    def on_scanner_progress_text(self, value):
+        self.progressText = value
+
     @Slot()
     def on_scanner_finished(self):
         self.scan_thread.stop()
@@ -249,8 +286,16 @@ class ScannerInterface(GenericQObject):
 
 class ScanThread(QObjectThread):
     scannerProgress = Signal(float)
-    def _on_scanner_progress(self, value):
-        self.scannerProgress.emit(value)
+    scannerProgressText = Signal(str)
+    spectrumUpdated = Signal(int)
+    historyUpdated = Signal(float)
+    def _on_scanner_progress(self, progress):
+        self.scannerProgress.emit(progress.fraction)
+        self.scannerProgressText.emit(str(progress))
+    def _on_spectrum_updated(self, version):
+        self.spectrumUpdated.emit(version)
+    def _on_history_row(self, timestamp):
+        self.historyUpdated.emit(timestamp)
 
 def register_qml_types():
     QtQml.qmlRegisterType(ScanConfigData, 'ScanTools', 1, 0, 'ScanConfigData')
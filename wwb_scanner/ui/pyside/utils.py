@@ -100,6 +100,49 @@ class IntervalTimer(QObject):
         if timer_id is not None:
             self.killTimer(timer_id)
 
+class FrameCoalescer(QObject):
+    '''Collapses bursts of :meth:`request` calls into at most one
+    :attr:`trigger` per display frame
+
+    The time spent handling each trigger is measured and the next one is
+    delayed so handlers use no more than *budget* (a fraction) of the
+    event loop's time. Requests that arrive while a trigger is pending are
+    merged into it.
+    '''
+    trigger = Signal()
+    def __init__(self, parent=None, **kwargs):
+        self.frame_ms = kwargs.pop('frame_ms', 1000. / 60)
+        self.budget = kwargs.pop('budget', .5)
+        super().__init__(parent=parent)
+        self._next_ts = 0.
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._timer.timeout.connect(self._on_timeout)
+
+    @property
+    def pending(self):
+        return self._timer.isActive()
+
+    @QtCore.Slot()
+    @QtCore.Slot(int)
+    def request(self, *args):
+        if self._timer.isActive():
+            return
+        delay = max(self._next_ts - time.perf_counter(), 0)
+        self._timer.start(int(round(delay * 1000)))
+
+    @QtCore.Slot()
+    def cancel(self):
+        self._timer.stop()
+
+    def _on_timeout(self):
+        start_ts = time.perf_counter()
+        self.trigger.emit()
+        elapsed = time.perf_counter() - start_ts
+        interval = max(self.frame_ms / 1000., elapsed / self.budget)
+        self._next_ts = start_ts + interval
+
 class QObjectThread(QtCore.QObject):
     started = Signal()
     result = Signal(object)
@@ -0,0 +1,112 @@
+from PySide2 import QtCore, QtGui, QtQml, QtQuick
+from PySide2.QtCore import Signal, Property, Slot
+import logging
+logger = logging.getLogger(__name__)
+
+from wwb_scanner.ui.waterfall import WaterfallBuffer
+from wwb_scanner.ui.pyside.utils import GenericQObject
+
+class WaterfallImageProvider(QtQuick.QQuickImageProvider):
+    '''Serves the images of :class:`WaterfallData` objects to QML
+
+    Image ids are ``<key>/<version>``. The version only exists to make
+    the url change, so ``Image`` items request a new image on each sweep.
+    '''
+    provider_name = 'waterfall'
+    def __init__(self):
+        super().__init__(QtQuick.QQuickImageProvider.Image)
+        self.buffers = {}
+    def add_buffer(self, key, buffer):
+        self.buffers[key] = buffer
+    def remove_buffer(self, key):
+        self.buffers.pop(key, None)
+    def requestImage(self, id, size, requestedSize):
+        key = id.split('/')[0]
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            return QtGui.QImage()
+        with buffer.lock:
+            img = buffer.image
+            h, w = img.shape[:2]
+            qimg = QtGui.QImage(img.data, w, h, w * 4, QtGui.QImage.Format_RGBA8888)
+            # Detach from the buffer before the next row is written
+            return qimg.copy()
+
+image_provider = WaterfallImageProvider()
+
+class WaterfallData(GenericQObject):
+    '''Feeds a :class:`WaterfallBuffer` from a ScannerInterface's history
+
+    One row is added for each completed scan and :attr:`imageSource` is
+    updated to point at the new image.
+    '''
+    _n_scanner = Signal()
+    _n_imageSource = Signal()
+    _n_minDB = Signal()
+    _n_maxDB = Signal()
+    _n_numRows = Signal()
+    def __init__(self, *args):
+        self._scanner = None
+        self._imageSource = ''
+        self.buffer = WaterfallBuffer()
+        self._minDB = self.buffer.min_db
+        self._maxDB = self.buffer.max_db
+        self._numRows = 0
+        super().__init__(*args)
+        key = self.key = str(id(self))
+        image_provider.add_buffer(key, self.buffer)
+        self.destroyed.connect(lambda *args: image_provider.remove_buffer(key))
+
+    def _g_scanner(self): return self._scanner
+    def _s_scanner(self, value):
+        if value == self._scanner:
+            return
+        if self._scanner is not None:
+            self._scanner.historyUpdated.disconnect(self.on_history_updated)
+        self._scanner = value
+        self._n_scanner.emit()
+        if self._scanner is not None:
+            self._scanner.historyUpdated.connect(self.on_history_updated)
+    scanner = Property(QtCore.QObject, _g_scanner, _s_scanner, notify=_n_scanner)
+
+    def _g_imageSource(self): return self._imageSource
+    def _s_imageSource(self, value): self._generic_setter('_imageSource', value)
+    imageSource = Property(str, _g_imageSource, _s_imageSource, notify=_n_imageSource)
+
+    def _g_minDB(self): return self._minDB
+    def _s_minDB(self, value): self._generic_setter('_minDB', value)
+    minDB = Property(float, _g_minDB, _s_minDB, notify=_n_minDB)
+
+    def _g_maxDB(self): return self._maxDB
+    def _s_maxDB(self, value): self._generic_setter('_maxDB', value)
+    maxDB = Property(float, _g_maxDB, _s_maxDB, notify=_n_maxDB)
+
+    def _g_numRows(self): return self._numRows
+    def _s_numRows(self, value): self._generic_setter('_numRows', value)
+    numRows = Property(int, _g_numRows, _s_numRows, notify=_n_numRows)
+
+    def _generic_property_changed(self, attr, old_value, new_value):
+        if attr in ('_minDB', '_maxDB'):
+            self.buffer.set_limits(self.minDB, self.maxDB)
+            self.update_image_source()
+
+    def update_image_source(self):
+        self.numRows = self.buffer.num_rows
+        name = WaterfallImageProvider.provider_name
+        self.imageSource = f'image://{name}/{self.key}/{self.buffer.version}'
+
+    @Slot(float)
+    def on_history_updated(self, timestamp):
+        history = self.scanner.history
+        if history is None or not len(history):
+            return
+        self.buffer.add_history_row(history)
+        self.update_image_source()
+
+    @Slot()
+    def clear(self):
+        self.buffer.clear()
+        self.update_image_source()
+
+def register_qml_types():
+    QtQml.qmlRegisterType(WaterfallData, 'GraphUtils', 1, 0, 'WaterfallData')
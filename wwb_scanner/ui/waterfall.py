@@ -0,0 +1,134 @@
+import threading
+
+import numpy as np
+
+from wwb_scanner.scanner.config import ProcessingConfig
+from wwb_scanner.utils.color import build_colormap, dB_to_rgba
+
+class WaterfallBuffer(object):
+    '''Preallocated RGBA image of the most recent sweeps (newest row first)
+
+    Each sweep is reduced to :attr:`width` columns spanning the frequency
+    axis (keeping the maximum of each column so narrow carriers aren't
+    lost), colored and written as a single row. Nothing else in the image
+    is touched.
+
+    The rows are stored twice in a buffer of ``2 * height`` rows so the
+    visible image is always a contiguous slice of it (see :attr:`image`)
+    and can be handed to an image class without reordering.
+
+    The reduced dB values are kept as well so the image can be recolored
+    when the limits change.
+
+    params:
+        width: (int) number of columns
+        height: (int) number of rows (sweeps) to keep. Default is
+            :attr:`DEFAULT_HEIGHT`
+        min_db: (float) dB value mapped to the first color. Defaults to
+            ``scaling_min_db`` in :class:`ProcessingConfig`
+        max_db: (float) dB value mapped to the last color. Defaults to
+            ``scaling_max_db`` in :class:`ProcessingConfig`
+        colormap: RGBA lookup table (see :func:`build_colormap`)
+    '''
+    DEFAULT_HEIGHT = 256
+    def __init__(self, **kwargs):
+        defaults = ProcessingConfig.DEFAULTS
+        self.width = kwargs.get('width', 1024)
+        self.height = kwargs.get('height', self.DEFAULT_HEIGHT)
+        self.min_db = kwargs.get('min_db', defaults['scaling_min_db'])
+        self.max_db = kwargs.get('max_db', defaults['scaling_max_db'])
+        self.colormap = kwargs.get('colormap')
+        if self.colormap is None:
+            self.colormap = build_colormap()
+        self.lock = threading.Lock()
+        self.frequency_hz = None
+        self._column_starts = None
+        self._values = np.empty((self.height * 2, self.width), dtype=np.float32)
+        self._image = np.empty((self.height * 2, self.width, 4), dtype=np.uint8)
+        self.version = 0
+        self.clear()
+    @property
+    def image(self):
+        '''The visible image as a ``(height, width, 4)`` uint8 array
+        (a view into the buffer)
+        '''
+        h = self.height
+        return self._image[self._head:self._head + h]
+    @property
+    def values(self):
+        '''The reduced dB values of :attr:`image`
+        '''
+        h = self.height
+        return self._values[self._head:self._head + h]
+    def clear(self):
+        with self.lock:
+            self._values[:] = np.nan
+            self._image[:] = self.colormap[0]
+            self._head = 0
+            self.num_rows = 0
+            self.version += 1
+    def set_frequency_axis(self, frequency_hz):
+        '''Sets the frequency axis of the sweeps and clears the image
+        '''
+        frequency_hz = np.asarray(frequency_hz)
+        self.frequency_hz = frequency_hz
+        if frequency_hz.size:
+            f0 = frequency_hz[0]
+            span = max(frequency_hz[-1] - f0, 1)
+            cols = np.floor((frequency_hz - f0) * (self.width / span)).astype(np.intp)
+            cols = np.clip(cols, 0, self.width - 1)
+            starts = np.searchsorted(cols, np.arange(self.width), side='left')
+            # Columns without any bins take the value of the next one
+            self._column_starts = np.clip(starts, 0, frequency_hz.size - 1)
+        else:
+            self._column_starts = None
+        self.clear()
+    def reduce_row(self, dB):
+        '''Reduces a sweep (on :attr:`frequency_hz`) to one value per column
+        '''
+        if self._column_starts is None:
+            return np.full(self.width, np.nan, dtype=np.float32)
+        dB = np.asarray(dB, dtype=np.float32)
+        return np.fmax.reduceat(dB, self._column_starts)
+    def add_row(self, dB, frequency_hz=None):
+        '''Scrolls the image by adding a sweep as the top row
+
+        If *frequency_hz* is given and differs from the current axis, the
+        axis is replaced (clearing the image) first.
+
+        Returns the :attr:`version` of the image.
+        '''
+        if frequency_hz is not None:
+            if self.frequency_hz is None or not np.array_equal(frequency_hz, self.frequency_hz):
+                self.set_frequency_axis(frequency_hz)
+        if self.frequency_hz is None:
+            raise ValueError('frequency_hz is required for the first row')
+        values = self.reduce_row(dB)
+        h = self.height
+        with self.lock:
+            head = self._head = (self._head - 1) % h
+            self._values[head] = values
+            self._values[head + h] = values
+            dB_to_rgba(values, self.min_db, self.max_db, self.colormap, out=self._image[head])
+            self._image[head + h] = self._image[head]
+            self.num_rows = min(self.num_rows + 1, h)
+            self.version += 1
+            return self.version
+    def add_history_row(self, history, ix=-1):
+        '''Adds a row from a :class:`~wwb_scanner.scan_objects.SpectrumHistory`
+        '''
+        _, row = history.get_row(ix)
+        return self.add_row(row, history.frequency_hz)
+    def add_spectrum(self, spectrum):
+        snapshot = spectrum.snapshot
+        return self.add_row(snapshot.dbFS, snapshot.frequency_hz)
+    def set_limits(self, min_db, max_db):
+        '''Changes the dB range of the colors and recolors the image
+        '''
+        if min_db == self.min_db and max_db == self.max_db:
+            return
+        with self.lock:
+            self.min_db = min_db
+            self.max_db = max_db
+            dB_to_rgba(self._values, min_db, max_db, self.colormap, out=self._image)
+            self.version += 1
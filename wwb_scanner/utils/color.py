@@ -1,3 +1,5 @@
+import numpy as np
+
 
 class Color(dict):
     _color_keys = ['r', 'g', 'b', 'a']
@@ -70,3 +72,44 @@ class Color(dict):
         return '<{self.__class__}: {self}>'.format(self=self)
     def __str__(self):
         return str(self.to_list())
+
+WATERFALL_COLORS = [
+    '#000000', '#000080', '#0000ff', '#00ffff',
+    '#00ff00', '#ffff00', '#ff0000', '#ffffff',
+]
+
+def build_colormap(colors=None, size=256):
+    '''Builds a lookup table of RGBA values (uint8, shape ``(size, 4)``)
+    blending evenly between the given hex colors
+    '''
+    if colors is None:
+        colors = WATERFALL_COLORS
+    stops = np.array([Color.from_hex(c).to_list() for c in colors])
+    positions = np.linspace(0, 1, len(colors))
+    x = np.linspace(0, 1, size)
+    lut = np.empty((size, 4), dtype=np.uint8)
+    for i in range(4):
+        lut[:,i] = np.round(np.interp(x, positions, stops[:,i]) * 255)
+    return lut
+
+def dB_to_rgba(dB, min_db, max_db, colormap=None, out=None):
+    '''Maps dB values to RGBA colors
+
+    Values are scaled linearly from *min_db* (the first color of the
+    *colormap*) to *max_db* (the last) and clipped to that range. NaN values
+    map to the first color.
+
+    The result has the shape of *dB* with an extra axis of 4 (uint8) and is
+    written to *out* if given.
+    '''
+    if colormap is None:
+        colormap = build_colormap()
+    dB = np.asarray(dB)
+    num_colors = colormap.shape[0]
+    span = max_db - min_db
+    if span <= 0:
+        span = 1.
+    ix = (dB - min_db) * ((num_colors - 1) / span)
+    ix = np.nan_to_num(ix, nan=0., posinf=num_colors - 1, neginf=0.)
+    ix = np.clip(ix, 0, num_colors - 1).astype(np.intp)
+    return np.take(colormap, ix, axis=0, out=out)
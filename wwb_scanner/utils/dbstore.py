@@ -1,10 +1,19 @@
 import os
+import copy as _copy
+import atexit
+import hashlib
 import datetime
+import threading
 
 import tinydb
-from tinydb import TinyDB, where
+from tinydb import TinyDB
+
+import logging
+logger = logging.getLogger(__name__)
 
 from wwb_scanner.utils import numpyjson
+from wwb_scanner.utils.scanstore import ScanStore, ScanRecord
+from wwb_scanner.utils.writebehind import ScanWriter
 
 APP_PATH = os.path.expanduser('~/wwb_scanner_data')
 
@@ -27,14 +36,135 @@ class JSONStorage(tinydb.JSONStorage):
         self._handle.flush()
         self._handle.truncate()
 
+class ScanConfigCache(object):
+    '''In-memory index of the ``scan_configs`` table
+
+    The table is read once and configs are then found by eid, datetime,
+    name or content (see :meth:`content_hash`) with a dict lookup. Where
+    several configs match, the one with the lowest eid is found (as a
+    TinyDB query would). :meth:`get` returns copies, so the cached
+    documents can't be changed by callers.
+
+    params:
+        db: the TinyDB database holding the table
+    '''
+    #: Keys that aren't part of a config's content
+    IGNORED_KEYS = ['eid', 'datetime']
+    def __init__(self, db):
+        self.db = db
+        self.table = db.table('scan_configs')
+        self.by_eid = {}
+        self.hashes = {}
+        self.by_hash = {}
+        self.by_datetime = {}
+        self.by_name = {}
+        self.last_eid = None
+        for doc in self.table.all():
+            self.add(doc.eid, doc)
+    @classmethod
+    def content_hash(cls, config):
+        '''Hash of a config (or its serialized dict) ignoring
+        :attr:`IGNORED_KEYS`
+        '''
+        if not isinstance(config, dict):
+            config = config._serialize()
+        def strip(d):
+            return {
+                k: strip(v) if isinstance(v, dict) else v
+                for k, v in d.items() if k != '_child_conf_keys'
+            }
+        d = strip({k: v for k, v in config.items() if k not in cls.IGNORED_KEYS})
+        s = numpyjson.dumps(d, sort_keys=True)
+        return hashlib.sha1(s.encode('UTF-8')).hexdigest()
+    def _get_index_keys(self, eid):
+        doc = self.by_eid[eid]
+        return {
+            'by_hash':self.hashes[eid],
+            'by_datetime':doc.get('datetime'),
+            'by_name':doc.get('name'),
+        }
+    def add(self, eid, doc):
+        self.by_eid[eid] = doc
+        self.hashes[eid] = self.content_hash(doc)
+        for attr, key in self._get_index_keys(eid).items():
+            if key is None:
+                continue
+            index = getattr(self, attr)
+            cur_eid = index.get(key)
+            if cur_eid is None or eid < cur_eid:
+                index[key] = eid
+        if self.last_eid is None or eid > self.last_eid:
+            self.last_eid = eid
+    def remove(self, eid):
+        '''Removes *eid* from the indexes. Where it was the lowest match
+        for a key, the next lowest config with that key takes its place
+        '''
+        if eid not in self.by_eid:
+            return
+        index_keys = self._get_index_keys(eid)
+        del self.by_eid[eid]
+        del self.hashes[eid]
+        for attr, key in index_keys.items():
+            index = getattr(self, attr)
+            if key is None or index.get(key) != eid:
+                continue
+            del index[key]
+            for other_eid in self.by_eid:
+                if self._get_index_keys(other_eid)[attr] != key:
+                    continue
+                cur_eid = index.get(key)
+                if cur_eid is None or other_eid < cur_eid:
+                    index[key] = other_eid
+        if eid == self.last_eid:
+            self.last_eid = max(self.by_eid) if self.by_eid else None
+    def replace(self, eid, doc):
+        '''Reindexes *eid* after its stored document changed to *doc*
+        '''
+        self.remove(eid)
+        self.add(eid, doc)
+    def find(self, config):
+        '''Returns the eid of a stored config with the same content as
+        *config* (or None)
+        '''
+        return self.by_hash.get(self.content_hash(config))
+    def get(self, eid):
+        doc = self.by_eid.get(eid)
+        if doc is None:
+            return None
+        return ScanRecord(_copy.deepcopy(doc), eid=eid)
+
 class DBStore(object):
+    '''Storage for scan configs (in TinyDB) and scans (in a :class:`ScanStore`)
+
+    Scans were previously kept in TinyDB as well (at :attr:`SCAN_DB_PATH`).
+    They're copied to the scan store the first time it's opened.
+
+    New scan arrays are stored in compact form unless
+    :attr:`SCAN_DATA_COMPACT` is False, and zlib compressed if
+    :attr:`SCAN_DATA_COMPRESS` is set (see :class:`ScanStore`).
+
+    Scans can also be saved in the background through :attr:`writer`.
+    Reading scans waits for those writes to finish first.
+
+    Scan configs are looked up through a :class:`ScanConfigCache` and only
+    stored once for each distinct content.
+    '''
     DB_PATH = os.path.join(APP_PATH, 'db.json')
     SCAN_DB_PATH = os.path.join(APP_PATH, 'scan_db.json')
+    SCAN_INDEX_PATH = os.path.join(APP_PATH, 'scan_index.sqlite')
+    SCAN_DATA_PATH = os.path.join(APP_PATH, 'scan_data.bin')
+    SCAN_DATA_COMPACT = True
+    SCAN_DATA_COMPRESS = False
     TABLES = ['scan_configs', 'scans_performed', 'scans_imported']
     def __init__(self):
 
         self._db = None
         self._scan_db = None
+        self._scan_store = None
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._config_cache = None
+        self._config_lock = threading.RLock()
         #self.migrate_db()
     @property
     def db(self):
@@ -44,17 +174,84 @@ class DBStore(object):
             db = self._db = TinyDB(self.DB_PATH, storage=JSONStorage)
         return db
     @property
+    def config_cache(self):
+        '''The :class:`ScanConfigCache` of :attr:`db` (rebuilt if the
+        database has been reopened)
+        '''
+        db = self.db
+        with self._config_lock:
+            cache = self._config_cache
+            if cache is None or cache.db is not db:
+                cache = self._config_cache = ScanConfigCache(db)
+            return cache
+    @property
     def scan_db(self):
         db = self._scan_db
         if db is None:
             self._check_dirs()
             db = self._scan_db = TinyDB(self.SCAN_DB_PATH, storage=JSONStorage)
         return db
+    @property
+    def scan_store(self):
+        store = self._scan_store
+        if store is None:
+            self._check_dirs()
+            store = ScanStore(
+                self.SCAN_INDEX_PATH, self.SCAN_DATA_PATH,
+                compact=self.SCAN_DATA_COMPACT, compress=self.SCAN_DATA_COMPRESS,
+            )
+            try:
+                self.migrate_scan_db(store)
+            except Exception:
+                store.close()
+                raise
+            self._scan_store = store
+        return store
+    @property
+    def writer(self):
+        '''A :class:`ScanWriter` for this instance (started on first use
+        and flushed when the interpreter exits)
+        '''
+        writer = self._writer
+        if writer is None:
+            with self._writer_lock:
+                writer = self._writer
+                if writer is None:
+                    writer = ScanWriter(self)
+                    writer.start()
+                    atexit.register(writer.stop)
+                    self._writer = writer
+        return writer
+    def flush_writes(self, timeout=None):
+        '''Waits for any writes queued on :attr:`writer`
+        '''
+        writer = self._writer
+        if writer is None:
+            return True
+        return writer.flush(timeout)
     def _check_dirs(self):
-        if not os.path.exists(os.path.dirname(self.DB_PATH)):
-            os.makedirs(os.path.dirname(self.DB_PATH))
-        if not os.path.exists(os.path.dirname(self.SCAN_DB_PATH)):
-            os.makedirs(os.path.dirname(self.SCAN_DB_PATH))
+        for path in [self.DB_PATH, self.SCAN_DB_PATH, self.SCAN_INDEX_PATH, self.SCAN_DATA_PATH]:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+    def migrate_scan_db(self, store):
+        '''Copies scans from the TinyDB scan database into *store* (once)
+        '''
+        if store.get_meta('scan_db_migrated') is not None:
+            return
+        migrated = datetime.datetime.utcnow().isoformat()
+        if not os.path.exists(self.SCAN_DB_PATH):
+            store.set_meta('scan_db_migrated', migrated)
+            return
+        try:
+            # The flag is set along with the scans, so a failed migration
+            # is retried from the start next time
+            num_scans = store.import_tinydb(
+                self.scan_db, meta={'scan_db_migrated':migrated},
+            )
+        finally:
+            self._scan_db.close()
+            self._scan_db = None
+        logger.info('Migrated {} scans from {}'.format(num_scans, self.SCAN_DB_PATH))
     def migrate_db(self):
         for table_name in ['scans_performed', 'scans_imported']:
             if table_name not in self.db.tables():
@@ -69,64 +266,124 @@ class DBStore(object):
             old_table.remove(eids=eids)
             self.db.purge_table(table_name)
     def add_scan_config(self, config, force_insert=False):
+        '''Stores *config* (unless it's already stored) and sets its eid
+
+        A config without an eid is matched to a stored one by its datetime,
+        then by its content. If *force_insert* is True the stored config
+        is replaced with *config*.
+        '''
         if config.get('datetime') is None:
             config['datetime'] = datetime.datetime.utcnow()
-        table = self.db.table('scan_configs')
-        if config.get('eid') is not None:
-            dbconfig = table.get(eid=config.eid)
-        else:
-            dbconfig = table.get(where('datetime') == config['datetime'])
-        if dbconfig is not None:
-            if force_insert:
-                eids = [dbconfig.eid]
-                table.update(config._serialize(), eids=eids)
-            eid = dbconfig.eid
-        else:
-            eid = table.insert(config._serialize())
+        with self._config_lock:
+            cache = self.config_cache
+            if config.get('eid') is not None:
+                eid = config.eid if config.eid in cache.by_eid else None
+            else:
+                eid = cache.by_datetime.get(config['datetime'])
+                if eid is None:
+                    eid = cache.find(config)
+            if eid is not None:
+                if force_insert:
+                    data = config._serialize()
+                    cache.table.update(data, eids=[eid])
+                    doc = dict(cache.by_eid[eid])
+                    doc.update(data)
+                    cache.replace(eid, doc)
+            else:
+                data = config._serialize()
+                eid = cache.table.insert(data)
+                cache.add(eid, data)
         config.eid = eid
     def get_scan_config(self, **kwargs):
-        table = self.db.table('scan_configs')
+        '''Finds a stored config by ``datetime``, ``eid`` or ``name``
+        (or the most recent one if none are given)
+
+        Returns a :class:`ScanRecord` (a copy) or None
+        '''
+        cache = self.config_cache
         if kwargs.get('datetime'):
-            dbconfig = table.get(where('datetime')==kwargs.get('datetime'))
+            eid = cache.by_datetime.get(kwargs.get('datetime'))
         elif kwargs.get('eid'):
-            dbconfig = table.get(eid=kwargs.get('eid'))
+            eid = kwargs.get('eid')
         elif kwargs.get('name'):
-            dbconfig = table.get(where('name')==kwargs.get('name'))
-        elif table._last_id > 0:
-            dbconfig = table.get(eid=table._last_id)
+            eid = cache.by_name.get(kwargs.get('name'))
         else:
-            dbconfig = None
-        return dbconfig
+            eid = cache.last_eid
+        return cache.get(eid)
     def add_scan(self, spectrum, scan_config=None):
+        # A queued save of the same spectrum would otherwise overwrite this one
+        self.flush_writes()
+        data = self.build_scan_data(spectrum, scan_config)
+        return self.write_scan(spectrum, data)
+    def build_scan_data(self, spectrum, scan_config=None, copy=False, add_config=True):
+        '''Returns the fields of *spectrum* to be stored by :meth:`write_scan`
+
+        If *copy* is True the fields and arrays are copied so *spectrum*
+        can keep changing while they're written.
+
+        A scan config that hasn't been stored yet is stored here unless
+        *add_config* is False, in which case ``scan_config_eid`` is left
+        for the caller to fill in.
+        '''
         if scan_config is None:
             scan_config = spectrum.scan_config
         if scan_config is not None:
-            if scan_config.get('eid') is None:
+            if scan_config.get('eid') is None and add_config:
                 self.add_scan_config(scan_config)
-            spectrum.scan_config_eid = scan_config.eid
-        data = spectrum._serialize()
-        table = self.scan_db.table('scans_performed')
+            if scan_config.get('eid') is not None:
+                spectrum.scan_config_eid = scan_config.eid
+        attrs = spectrum._serialize_attrs
+        if spectrum.eid is not None and not spectrum.sample_data_loaded:
+            # The arrays haven't been loaded, so they can't have changed
+            data = {attr: getattr(spectrum, attr) for attr in attrs}
+        elif copy:
+            with spectrum.data_update_lock:
+                data = spectrum._serialize()
+                sample_data = data['sample_data']
+                data['sample_data'] = sample_data.__class__(
+                    sample_data.data.copy(), sample_data.keep_sorted,
+                )
+        else:
+            data = spectrum._serialize()
+        if copy:
+            for attr in attrs:
+                data[attr] = _copy.copy(data[attr])
+        return data
+    def write_scan(self, spectrum, data):
+        '''Stores *data* from :meth:`build_scan_data`, updating the record
+        of *spectrum* if it has one
+        '''
+        store = self.scan_store
         if spectrum.eid is not None:
             eid = spectrum.eid
-            table.update(data, eids=[eid])
+            store.update(eid, data)
         else:
-            eid = table.insert(data)
+            eid = store.insert(data)
             spectrum.eid = eid
         return eid
+    def list_scans(self):
+        '''Returns the metadata of all scans by eid without reading any of
+        their fields or arrays (see :meth:`ScanStore.list_scans`)
+        '''
+        self.flush_writes()
+        return self.scan_store.list_scans()
     def get_all_scans(self):
-        table = self.scan_db.table('scans_performed')
-        scans = table.all()
-        scan_data = {}
-        for scan in scans:
-            excluded = ['samples', 'sample_data', 'center_frequencies']
-            scan_data[scan.eid] = {key:scan[key] for key in scan.keys()
-                                    if key not in excluded}
+        self.flush_writes()
+        scan_data = self.scan_store.get_all_attrs()
+        for scan in scan_data.values():
+            for key in ['samples', 'center_frequencies']:
+                scan.pop(key, None)
         return scan_data
     def get_scan(self, eid):
-        table = self.scan_db.table('scans_performed')
-        return table.get(eid=eid)
+        self.flush_writes()
+        return self.scan_store.get(eid)
+    def get_scan_attrs(self, eid):
+        self.flush_writes()
+        return self.scan_store.get_attrs(eid)
+    def get_scan_data(self, eid):
+        self.flush_writes()
+        return self.scan_store.get_sample_data(eid)
     def update_scan(self, eid, **kwargs):
-        table = self.scan_db.table('scans_performed')
-        table.update(kwargs, eids=[eid])
+        self.scan_store.update(eid, kwargs)
 
 db_store = DBStore()
@@ -9,25 +9,79 @@ PY3 = sys.version_info.major >= 3
 
 import jsonfactory
 
-## From http://stackoverflow.com/questions/27909658/
+def _descr_from_json(descr):
+    # JSON turns the (name, type[, shape]) tuples of structured dtypes
+    # into lists
+    if not isinstance(descr, list):
+        return descr
+    fields = []
+    for field in descr:
+        name = field[0]
+        if isinstance(name, list):
+            name = tuple(name)
+        field_descr = (name, _descr_from_json(field[1]))
+        if len(field) > 2:
+            field_descr += (tuple(field[2]),)
+        fields.append(field_descr)
+    return fields
+
+def ndarray_to_dict(obj, binary=False):
+    '''Describes an array by its dtype, shape and little-endian bytes
+
+    The bytes are base64 encoded unless *binary* is set (for containers
+    that can hold raw bytes).
+    '''
+    obj = np.asarray(obj)
+    if obj.dtype.hasobject:
+        raise TypeError('Arrays of Python objects cannot be encoded')
+    dtype = obj.dtype.newbyteorder('<')
+    obj = np.ascontiguousarray(obj, dtype=dtype)
+    data = obj.tobytes()
+    if not binary:
+        data = base64.b64encode(data).decode('ascii')
+    return dict(
+        dtype=np.lib.format.dtype_to_descr(dtype),
+        shape=list(obj.shape),
+        data=data,
+    )
+
+def ndarray_from_dict(d):
+    '''Rebuilds an array from :func:`ndarray_to_dict`
+
+    The array is a read-only view of the decoded bytes (no copy is made).
+    '''
+    dtype = np.lib.format.descr_to_dtype(_descr_from_json(d['dtype']))
+    data = d['data']
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    arr = np.frombuffer(data, dtype=dtype)
+    return arr.reshape(d['shape'])
+
+def _legacy_loads(data_b64):
+    # Arrays written before version 2 of the encoding were pickled
+    data = base64.b64decode(data_b64)
+    if PY3:
+        return pickle.loads(data, encoding='bytes')
+    return pickle.loads(data)
 
 @jsonfactory.register
 class NumpyEncoder(object):
+    '''Encodes arrays as ``{"__ndarray__": {"dtype", "shape", "data"}}``
+    (see :func:`ndarray_to_dict`)
+
+    Pickled arrays from older files (where ``__ndarray__`` is a string)
+    can still be decoded.
+    '''
     def encode(self, obj):
         if isinstance(obj, np.ndarray):
-            data_b64 = base64.b64encode(obj.dumps())
-            if isinstance(data_b64, bytes):
-                data_b64 = data_b64.decode('UTF-8')
-            return dict(__ndarray__=data_b64)
+            return dict(__ndarray__=ndarray_to_dict(obj))
         return None
     def decode(self, d):
         if '__ndarray__' in d:
-            data = base64.b64decode(d['__ndarray__'])
-            if PY3:
-                if not isinstance(data, bytes):
-                    data = bytes(data, 'UTF-8')
-                return pickle.loads(data, encoding='bytes')
-            return pickle.loads(data)
+            value = d['__ndarray__']
+            if isinstance(value, dict):
+                return ndarray_from_dict(value)
+            return _legacy_loads(value)
         return d
 
 def dumps(obj, **kwargs):
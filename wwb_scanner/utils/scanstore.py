@@ -0,0 +1,335 @@
+import os
+import io
+import json
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+from wwb_scanner.utils import numpyjson
+
+SCHEMA_VERSION = 1
+
+#: Columns of the metadata index (so scans can be listed without decoding
+#: their fields or reading any arrays)
+METADATA_COLUMNS = [
+    ('name', 'TEXT'),
+    ('timestamp_utc', 'REAL'),
+    ('step_size', 'REAL'),
+    ('color', 'TEXT'),
+    ('scan_config_eid', 'INTEGER'),
+    ('num_points', 'INTEGER'),
+    ('frequency_min_hz', 'INTEGER'),
+    ('frequency_max_hz', 'INTEGER'),
+]
+ATTR_COLUMNS = ['name', 'timestamp_utc', 'step_size', 'color', 'scan_config_eid']
+
+class ScanRecord(dict):
+    '''A stored scan. Like a TinyDB ``Element``, its id is in :attr:`eid`
+    '''
+    def __init__(self, value=None, eid=None):
+        super(ScanRecord, self).__init__(value or {})
+        self.eid = eid
+
+class ScanStore(object):
+    '''Stores scans in a sqlite index and an append-only array file
+
+    The arrays of a scan (its ``sample_data``) are appended to the data
+    file, each in the ``.npy`` format. The file is a series of these (so
+    it can't be read with ``np.load``, hence the ``.bin`` extension used
+    by :class:`DBStore`). Everything else is kept as JSON in the index
+    along with the offset of the arrays. Saving a scan only writes that
+    scan, no matter how many are stored.
+
+    A few fields are also kept as columns of the index (see
+    :data:`METADATA_COLUMNS`) for :meth:`list_scans`.
+
+    Replacing the arrays of a scan appends a new copy and leaves the old
+    one in place (unreferenced).
+
+    By default the arrays are stored in the compact form of
+    :meth:`SampleArray.to_compact <wwb_scanner.scan_objects.SampleArray.to_compact>`
+    (an evenly spaced frequency axis as three numbers and levels as int16
+    in 0.01 dB). Scans stored in either form can be read regardless of
+    these settings.
+
+    params:
+        index_path: path of the sqlite index
+        data_path: path of the array file
+        compact: (bool) store arrays in the compact form. Default is True
+        compress: (bool) zlib compress the compact arrays. Default is False
+    '''
+    ARRAY_KEYS = ['sample_data']
+    def __init__(self, index_path, data_path, compact=True, compress=False):
+        self.index_path = index_path
+        self.data_path = data_path
+        self.compact = compact
+        self.compress = compress
+        self.lock = threading.RLock()
+        self._conn = None
+    @property
+    def conn(self):
+        conn = self._conn
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, check_same_thread=False)
+            self._create_tables(conn)
+            self._conn = conn
+        return conn
+    def _create_tables(self, conn):
+        # An encoding of NULL is a single array (stored with compact=False),
+        # otherwise it's the JSON from _write_array
+        columns = ''.join(', {} {}'.format(*c) for c in METADATA_COLUMNS)
+        with conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS scans (
+                eid INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                attrs TEXT NOT NULL,
+                data_offset INTEGER,
+                keep_sorted INTEGER,
+                encoding TEXT{}
+            )'''.format(columns))
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+    @staticmethod
+    def _attr_metadata(attrs):
+        metadata = {key: attrs.get(key) for key in ATTR_COLUMNS}
+        if metadata['color'] is not None:
+            metadata['color'] = numpyjson.dumps(metadata['color'])
+        return metadata
+    @staticmethod
+    def _array_metadata(arr):
+        metadata = dict(num_points=arr.size, frequency_min_hz=None, frequency_max_hz=None)
+        if arr.size and 'frequency_hz' in (arr.dtype.names or ()):
+            metadata['frequency_min_hz'] = int(arr['frequency_hz'].min())
+            metadata['frequency_max_hz'] = int(arr['frequency_hz'].max())
+        return metadata
+    def _set_metadata(self, conn, eid, metadata):
+        keys = list(metadata.keys())
+        conn.execute(
+            'UPDATE scans SET {} WHERE eid = ?'.format(', '.join('{} = ?'.format(k) for k in keys)),
+            [metadata[k] for k in keys] + [eid],
+        )
+    def close(self):
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+    def get_meta(self, key):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+    def set_meta(self, key, value):
+        with self.lock, self.conn as conn:
+            self._set_meta(conn, key, value)
+    def _set_meta(self, conn, key, value):
+        conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+    def _split_data(self, data):
+        attrs = dict(data)
+        sample_data = None
+        for key in self.ARRAY_KEYS:
+            value = attrs.pop(key, None)
+            if value is not None:
+                sample_data = value
+        return attrs, sample_data
+    def _write_array(self, sample_data):
+        '''Appends the array of a SampleArray (or ndarray) to the data file
+        and returns its offset, ``keep_sorted``, encoding and metadata columns
+
+        Compact arrays are written one after another in the ``.npy``
+        format (or as a single uint8 array of their zlib compressed bytes)
+        and their names are kept in the encoding.
+        '''
+        from wwb_scanner.scan_objects import SampleArray
+        keep_sorted = getattr(sample_data, 'keep_sorted', True)
+        arr = np.ascontiguousarray(getattr(sample_data, 'data', sample_data))
+        metadata = self._array_metadata(arr)
+        write_array = np.lib.format.write_array
+        if not self.compact:
+            with open(self.data_path, 'ab') as f:
+                offset = f.tell()
+                write_array(f, arr, allow_pickle=False)
+            return offset, keep_sorted, None, metadata
+        arrays = SampleArray(arr, keep_sorted=False).to_compact()
+        encoding = dict(fields=list(arrays.keys()), zlib=self.compress)
+        with open(self.data_path, 'ab') as f:
+            offset = f.tell()
+            if self.compress:
+                fd = io.BytesIO()
+                for key in encoding['fields']:
+                    write_array(fd, arrays[key], allow_pickle=False)
+                buf = np.frombuffer(zlib.compress(fd.getvalue()), dtype=np.uint8)
+                write_array(f, buf, allow_pickle=False)
+            else:
+                for key in encoding['fields']:
+                    write_array(f, arrays[key], allow_pickle=False)
+        return offset, keep_sorted, json.dumps(encoding), metadata
+    def _read_array(self, offset, encoding=None):
+        '''Reads the array written at *offset* by :meth:`_write_array`
+        '''
+        from wwb_scanner.scan_objects import SampleArray
+        read_array = np.lib.format.read_array
+        with open(self.data_path, 'rb') as f:
+            f.seek(offset)
+            if encoding is None:
+                return read_array(f, allow_pickle=False)
+            encoding = json.loads(encoding)
+            if encoding['zlib']:
+                f = io.BytesIO(zlib.decompress(read_array(f, allow_pickle=False)))
+            arrays = {key: read_array(f, allow_pickle=False) for key in encoding['fields']}
+        return SampleArray.from_compact(arrays, keep_sorted=False).data
+    def insert(self, data, table_name='scans_performed', eid=None):
+        '''Adds a scan and returns its eid (*eid* can be given to keep the
+        id of an existing record)
+        '''
+        with self.lock, self.conn as conn:
+            return self._insert(conn, data, table_name, eid)
+    def _insert(self, conn, data, table_name, eid):
+        # Adds the row without committing, so several can be added in one
+        # transaction
+        attrs, sample_data = self._split_data(data)
+        metadata = self._attr_metadata(attrs)
+        offset, keep_sorted, encoding = None, None, None
+        if sample_data is not None:
+            offset, keep_sorted, encoding, array_metadata = self._write_array(sample_data)
+            metadata.update(array_metadata)
+        cursor = conn.execute(
+            'INSERT INTO scans (eid, table_name, attrs, data_offset, keep_sorted, encoding) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (eid, table_name, numpyjson.dumps(attrs), offset, keep_sorted, encoding),
+        )
+        eid = cursor.lastrowid
+        self._set_metadata(conn, eid, metadata)
+        return eid
+    def update(self, eid, data):
+        '''Updates the given fields of a scan. Arrays are only written if
+        they're included
+        '''
+        attrs, sample_data = self._split_data(data)
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT attrs FROM scans WHERE eid = ?', (eid,),
+            ).fetchone()
+            if row is None:
+                raise KeyError(eid)
+            stored = numpyjson.loads(row[0])
+            stored.update(attrs)
+            metadata = self._attr_metadata(stored)
+            with self.conn as conn:
+                conn.execute(
+                    'UPDATE scans SET attrs = ? WHERE eid = ?',
+                    (numpyjson.dumps(stored), eid),
+                )
+                if sample_data is not None:
+                    offset, keep_sorted, encoding, array_metadata = self._write_array(sample_data)
+                    metadata.update(array_metadata)
+                    conn.execute(
+                        'UPDATE scans SET data_offset = ?, keep_sorted = ?, encoding = ? '
+                        'WHERE eid = ?',
+                        (offset, keep_sorted, encoding, eid),
+                    )
+                self._set_metadata(conn, eid, metadata)
+    def get(self, eid):
+        '''Returns a :class:`ScanRecord` with the arrays loaded (as
+        ``sample_data``) or None
+        '''
+        with self.lock:
+            record = self.get_attrs(eid)
+            if record is not None:
+                sample_data = self.get_sample_data(eid)
+                if sample_data is not None:
+                    record['sample_data'] = sample_data
+        return record
+    def get_attrs(self, eid):
+        '''Returns a :class:`ScanRecord` of the stored fields (without
+        reading any arrays) or None
+        '''
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT attrs FROM scans WHERE eid = ?', (eid,),
+            ).fetchone()
+        if row is None:
+            return None
+        return ScanRecord(numpyjson.loads(row[0]), eid=eid)
+    def get_sample_data(self, eid):
+        '''Reads the stored ``sample_data`` of a scan as a SampleArray
+        (None if it has none)
+        '''
+        from wwb_scanner.scan_objects import SampleArray
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT data_offset, keep_sorted, encoding FROM scans WHERE eid = ?', (eid,),
+            ).fetchone()
+            if row is None or row[0] is None:
+                return None
+            offset, keep_sorted, encoding = row
+            data = self._read_array(offset, encoding)
+        return SampleArray(data, bool(keep_sorted))
+    def list_scans(self, table_name='scans_performed'):
+        '''Returns the metadata columns of all scans by eid
+
+        Only the index columns are read. ``color`` is decoded and
+        ``frequency_range`` (in MHz) is added from the frequency columns.
+        '''
+        names = [c[0] for c in METADATA_COLUMNS]
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT eid, {} FROM scans WHERE table_name = ? ORDER BY eid'.format(
+                    ', '.join(names),
+                ),
+                (table_name,),
+            ).fetchall()
+        scans = {}
+        for row in rows:
+            d = dict(zip(names, row[1:]))
+            d['eid'] = row[0]
+            if d['color'] is not None:
+                d['color'] = numpyjson.loads(d['color'])
+            f_min, f_max = d.pop('frequency_min_hz'), d.pop('frequency_max_hz')
+            d['frequency_range'] = None
+            if f_min is not None:
+                d['frequency_range'] = [f_min / 1e6, f_max / 1e6]
+            scans[row[0]] = d
+        return scans
+    def get_all_attrs(self, table_name='scans_performed'):
+        '''Returns the stored fields (without arrays) of all scans by eid
+        '''
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT eid, attrs FROM scans WHERE table_name = ? ORDER BY eid',
+                (table_name,),
+            ).fetchall()
+        return {eid: numpyjson.loads(attrs) for eid, attrs in rows}
+    def count(self, table_name=None):
+        with self.lock:
+            if table_name is None:
+                row = self.conn.execute('SELECT COUNT(*) FROM scans').fetchone()
+            else:
+                row = self.conn.execute(
+                    'SELECT COUNT(*) FROM scans WHERE table_name = ?', (table_name,),
+                ).fetchone()
+        return row[0]
+    def import_tinydb(self, db, table_names=None, meta=None):
+        '''Copies the scans of a TinyDB database and returns how many were
+        copied. Ids are kept for the first table and reassigned for the rest
+
+        Everything is added in a single transaction, along with the *meta*
+        items (a dict) if given, so an import that fails partway leaves
+        nothing behind and can simply be retried.
+        '''
+        if table_names is None:
+            table_names = ['scans_performed', 'scans_imported']
+        num_imported = 0
+        with self.lock, self.conn as conn:
+            for i, table_name in enumerate(table_names):
+                if table_name not in db.tables():
+                    continue
+                for item in db.table(table_name).all():
+                    eid = item.eid if i == 0 else None
+                    self._insert(conn, dict(item), table_name, eid)
+                    num_imported += 1
+            for key, value in (meta or {}).items():
+                self._set_meta(conn, key, value)
+        return num_imported
@@ -0,0 +1,145 @@
+import copy
+import datetime
+import threading
+import collections
+
+import logging
+logger = logging.getLogger(__name__)
+
+class ScanWriter(threading.Thread):
+    '''Writes scans to a :class:`~wwb_scanner.utils.dbstore.DBStore` in the
+    background so scanning doesn't wait on the disk
+
+    Writes are queued by what they write to. Saving a spectrum that's
+    already waiting to be saved (or updating fields of an eid that's
+    already waiting) replaces the queued write with a single one carrying
+    the newest data, so a scan that's saved after every sweep never has
+    more than one save queued.
+
+    The data is copied when a write is queued and the writes are made in
+    the order they were last queued.
+
+    params:
+        db_store: the :class:`~wwb_scanner.utils.dbstore.DBStore` to write to
+        max_pending: (int) number of queued writes at which callers wait
+            for the queue to drain. Default is 32
+
+    attributes:
+        num_written: (int) writes completed
+        num_coalesced: (int) writes merged into one that was already queued
+    '''
+    def __init__(self, db_store, max_pending=32):
+        super(ScanWriter, self).__init__(name='ScanWriter')
+        self.daemon = True
+        self.db_store = db_store
+        self.max_pending = max_pending
+        self.num_written = 0
+        self.num_coalesced = 0
+        self._pending = collections.OrderedDict()
+        self._busy = False
+        self._stopping = False
+        self._condition = threading.Condition()
+    @property
+    def queue_depth(self):
+        '''Number of writes queued or in progress
+        '''
+        with self._condition:
+            return len(self._pending) + int(self._busy)
+    def save_scan(self, spectrum, scan_config=None):
+        '''Queues :meth:`DBStore.add_scan` for *spectrum*
+
+        :attr:`Spectrum.eid` is set once it's been written. If the scan
+        config hasn't been stored yet, a copy of it is stored (and its eid
+        set) just before the scan.
+        '''
+        db_store = self.db_store
+        if scan_config is None:
+            scan_config = spectrum.scan_config
+        data = db_store.build_scan_data(spectrum, scan_config, copy=True, add_config=False)
+        new_config = None
+        if scan_config is not None and scan_config.get('eid') is None:
+            if scan_config.get('datetime') is None:
+                scan_config['datetime'] = datetime.datetime.utcnow()
+            new_config = scan_config.__class__(scan_config._serialize())
+        def write(data):
+            if new_config is not None:
+                db_store.add_scan_config(new_config)
+                if scan_config.get('eid') is None:
+                    scan_config.eid = new_config.eid
+                spectrum.scan_config_eid = new_config.eid
+                data['scan_config_eid'] = new_config.eid
+            db_store.write_scan(spectrum, data)
+        self._put(('scan', id(spectrum)), write, data)
+    def update_scan(self, eid, **kwargs):
+        '''Queues :meth:`DBStore.update_scan`. Fields of queued updates for
+        the same *eid* are combined
+        '''
+        db_store = self.db_store
+        data = {key: copy.copy(val) for key, val in kwargs.items()}
+        def write(data):
+            db_store.update_scan(eid, **data)
+        self._put(('update', eid), write, data, merge=True)
+    def _put(self, key, write, data, merge=False):
+        condition = self._condition
+        with condition:
+            stopping = self._stopping
+        if stopping:
+            # Nothing will process the queue, so write it here
+            write(data)
+            return
+        with condition:
+            pending = self._pending
+            if key in pending:
+                _, prev_data = pending.pop(key)
+                if merge:
+                    prev_data.update(data)
+                    data = prev_data
+                self.num_coalesced += 1
+            else:
+                while len(pending) >= self.max_pending:
+                    logger.debug('Write queue full ({} pending)'.format(len(pending)))
+                    condition.wait()
+            pending[key] = (write, data)
+            condition.notify_all()
+    def run(self):
+        condition = self._condition
+        pending = self._pending
+        while True:
+            with condition:
+                while not pending and not self._stopping:
+                    condition.wait()
+                if not pending:
+                    break
+                key, (write, data) = pending.popitem(last=False)
+                self._busy = True
+                condition.notify_all()
+            try:
+                write(data)
+            except Exception:
+                logger.exception('Error writing {}'.format(key))
+            finally:
+                with condition:
+                    self._busy = False
+                    self.num_written += 1
+                    condition.notify_all()
+    def flush(self, timeout=None):
+        '''Waits for all queued writes to finish. Returns False if *timeout*
+        expired first
+        '''
+        if threading.current_thread() is self:
+            return True
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending and not self._busy, timeout,
+            )
+    def stop(self, flush=True):
+        '''Stops the thread after writing everything queued (or dropping it
+        if *flush* is False)
+        '''
+        with self._condition:
+            self._stopping = True
+            if not flush:
+                self._pending.clear()
+            self._condition.notify_all()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()